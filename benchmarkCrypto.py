@@ -0,0 +1,168 @@
+import argparse
+import base64
+import csv
+import json
+import os
+import platform
+import socket
+import statistics
+import threading
+import time
+import cryptography
+import frame_crypto
+
+# Operations per crypto suite. The session path is what the testbench uses since FrameCipher;
+# the *_setup variants set up the cipher for every frame (the old path, as in testAes.py) and
+# the base64 variants add the text encoding the JSON wire format needs on both ends.
+OPERATIONS = ("encrypt", "decrypt", "encrypt_setup", "decrypt_setup", "encrypt_base64", "base64_decrypt")
+SCALING_OPERATIONS = ("encrypt", "decrypt")
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the per-frame crypto path: cipher modes, frame sizes, base64 step and thread scaling."
+)
+parser.add_argument("--sizes_kb", type=str, default="1,4,16,64,256,1024,8192",
+                    help="Comma separated frame sizes in KB (default: 1,4,16,64,256,1024,8192)")
+parser.add_argument("--ciphers", type=str, default=",".join(frame_crypto.CIPHER_SUITES),
+                    help=f"Comma separated crypto suites (default: {','.join(frame_crypto.CIPHER_SUITES)})")
+parser.add_argument("--operations", type=str, default=",".join(OPERATIONS),
+                    help=f"Comma separated operations (default: {','.join(OPERATIONS)})")
+parser.add_argument("--iterations", type=int, default=500, help="Timed calls per measurement (default: 500)")
+parser.add_argument("--warmup", type=int, default=20, help="Untimed calls before every measurement (default: 20)")
+parser.add_argument("--max_mb", type=int, default=32,
+                    help="Caps the data per measurement, so large frames get fewer iterations (minimum 10, default: 32)")
+parser.add_argument("--threads", type=str, default="1,2,4",
+                    help=f"Comma separated thread counts; >1 only for {','.join(SCALING_OPERATIONS)} (default: 1,2,4)")
+parser.add_argument("--csv", type=str, help="Write the results to this CSV file")
+parser.add_argument("--json", type=str, help="Write the results to this JSON file")
+
+AES_KEY = os.urandom(32)
+ASSOCIATED_DATA = os.urandom(21)
+
+
+def host_info():
+    """ Identifies the machine, so results of the Pi and the laptop can be put side by side """
+    return {
+        "host": socket.gethostname(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "cryptography": cryptography.__version__,
+    }
+
+
+def make_operation(suite, operation, plain):
+    """ Returns a function that runs `operation` once on `plain` with its own FrameCipher """
+    frame_cipher = frame_crypto.FrameCipher(suite, AES_KEY)
+    payload = bytes(frame_cipher.encrypt(plain, ASSOCIATED_DATA))
+    encoded = base64.b64encode(payload).decode("utf-8")
+
+    return {
+        "encrypt": lambda: frame_cipher.encrypt(plain, ASSOCIATED_DATA),
+        "decrypt": lambda: frame_cipher.decrypt(payload, ASSOCIATED_DATA),
+        "encrypt_setup": lambda: frame_crypto.encrypt(suite, AES_KEY, plain, ASSOCIATED_DATA),
+        "decrypt_setup": lambda: frame_crypto.decrypt(suite, AES_KEY, payload, ASSOCIATED_DATA),
+        "encrypt_base64": lambda: base64.b64encode(frame_cipher.encrypt(plain, ASSOCIATED_DATA)).decode("utf-8"),
+        "base64_decrypt": lambda: frame_cipher.decrypt(base64.b64decode(encoded), ASSOCIATED_DATA),
+    }[operation]
+
+
+def measure(suite, operation, size, threads, iterations, warmup):
+    """ Times every call, in `threads` threads at once; returns (per-call seconds, wall time of all calls) """
+    plain = os.urandom(size)
+    barrier = threading.Barrier(threads)
+    samples = [[] for _ in range(threads)]
+    spans = [None] * threads
+
+    def worker(index):
+        function = make_operation(suite, operation, plain)
+        for _ in range(warmup):
+            function()
+        barrier.wait()
+        first = time.perf_counter()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            function()
+            samples[index].append(time.perf_counter() - start)
+        spans[index] = (first, time.perf_counter())
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    # From the first call that started to the last one that finished (not thread start-up)
+    wall = max(end for _, end in spans) - min(start for start, _ in spans)
+    return [sample for thread_samples in samples for sample in thread_samples], wall
+
+
+def benchmark(suite, operation, size, threads, args):
+    """ One result row: median / p99 per call and throughput in MB/s (10^6 bytes) of all threads together """
+    iterations = max(10, min(args.iterations, args.max_mb * 1024 * 1024 // size // threads))
+    samples, wall = measure(suite, operation, size, threads, iterations, min(args.warmup, iterations))
+    return {
+        "cipher": suite,
+        "operation": operation,
+        "size_kb": size // 1024,
+        "threads": threads,
+        "iterations": iterations,
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "p99_us": round(statistics.quantiles(samples, n=100)[98] * 1e6, 2),
+        "mb_per_s": round(size * len(samples) / wall / 1e6, 2),
+    }
+
+
+def print_session_savings(results):
+    """ Saving of one FrameCipher per session over cipher setup per frame (encrypt + decrypt, median) """
+    median = {(row["cipher"], row["size_kb"], row["operation"]): row["median_us"] for row in results if row["threads"] == 1}
+    for suite, size_kb, operation in list(median):
+        keys = [(suite, size_kb, name) for name in ("encrypt_setup", "decrypt_setup", "encrypt", "decrypt")]
+        if operation != "encrypt" or not all(key in median for key in keys):
+            continue
+        setup = median[keys[0]] + median[keys[1]]
+        session = median[keys[2]] + median[keys[3]]
+        print(f"{suite:>18} {size_kb:>5} KB: session saves {setup - session:>8.1f}µs per frame ({(setup - session) / setup * 100:.1f}%)")
+
+
+def main():
+    args = parser.parse_args()
+    sizes = [int(size) * 1024 for size in args.sizes_kb.split(",")]
+    suites = [suite.strip() for suite in args.ciphers.split(",")]
+    operations = [operation.strip() for operation in args.operations.split(",")]
+    thread_counts = [int(threads) for threads in args.threads.split(",")]
+    for operation in operations:
+        if operation not in OPERATIONS:
+            parser.error(f"Unknown operation {operation!r}, choose from {','.join(OPERATIONS)}")
+
+    host = host_info()
+    print(" ".join(f"{key}: {value}" for key, value in host.items()))
+    print(f"{'cipher':>18} {'operation':>15} {'KB':>5} {'threads':>7} {'iter':>5} {'median':>11} {'p99':>11} {'MB/s':>9}")
+    results = []
+    for suite in suites:
+        for operation in operations:
+            for size in sizes:
+                for threads in thread_counts:
+                    if threads > 1 and operation not in SCALING_OPERATIONS:
+                        continue
+                    row = benchmark(suite, operation, size, threads, args)
+                    results.append(row)
+                    print(f"{suite:>18} {operation:>15} {row['size_kb']:>5} {threads:>7} {row['iterations']:>5} "
+                          f"{row['median_us']:>9.1f}µs {row['p99_us']:>9.1f}µs {row['mb_per_s']:>9.1f}")
+
+    print_session_savings(results)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(host) + list(results[0]))
+            writer.writeheader()
+            for row in results:
+                writer.writerow({**host, **row})
+        print(f"📋 Saved CSV: {args.csv}")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"host": host, "results": results}, json_file, indent=2)
+        print(f"📋 Saved JSON: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
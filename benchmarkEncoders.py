@@ -0,0 +1,132 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import socket
+import statistics
+import time
+import cv2
+import PIL
+import frame_encoders
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the image encoder backends (frame_encoders.py) over the test images: encode time, size and decode time."
+)
+parser.add_argument("--images", type=str, default="test_images", help="Folder with test images (default: test_images)")
+parser.add_argument("--qualities", type=str, default="20,50,80,90", help="Comma separated qualities (default: 20,50,80,90)")
+parser.add_argument("--encoders", type=str, default=",".join(frame_encoders.available_encoders()),
+                    help="Comma separated encoder backends (default: all available on this machine)")
+parser.add_argument("--jpeg_settings", type=str, default="default",
+                    help="Comma separated JPEG settings to sweep (see frame_encoders.py), e.g. default,444,420+opt,420+prog "
+                         "(default: default; encoders without a setting are skipped for it)")
+parser.add_argument("--iterations", type=int, default=20, help="Timed encodes/decodes per measurement (default: 20)")
+parser.add_argument("--warmup", type=int, default=2, help="Untimed encodes/decodes before every measurement (default: 2)")
+parser.add_argument("--csv", type=str, help="Write the results to this CSV file")
+parser.add_argument("--json", type=str, help="Write the results to this JSON file")
+
+
+def host_info():
+    """ Identifies the machine and the codec libraries, so runs on different boxes can be compared """
+    return {
+        "host": socket.gethostname(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+    }
+
+
+def time_ms(function, iterations, warmup):
+    """ Per-call times in ms; the last result is returned too """
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, result
+
+
+def benchmark(encoder, frame, quality, jpeg_settings, args):
+    """ One result row for a BGR frame: conversion, encode (median / p99), size, decode """
+    convert_ms, image = time_ms(lambda: encoder.prepare(frame), args.iterations, args.warmup)
+    encode_ms, data = time_ms(lambda: encoder.encode(image, quality, jpeg_settings), args.iterations, args.warmup)
+    decode_ms, _ = time_ms(lambda: encoder.decode(data), args.iterations, args.warmup)
+    return {
+        "encoder": encoder.name,
+        "jpeg_settings": jpeg_settings,
+        "quality": quality,
+        "convert_ms": round(statistics.median(convert_ms), 3),
+        "encode_ms": round(statistics.median(encode_ms), 3),
+        "encode_p99_ms": round(statistics.quantiles(encode_ms, n=100)[98], 3),
+        "size_kb": round(len(data) / 1024, 2),
+        "decode_ms": round(statistics.median(decode_ms), 3),
+    }
+
+
+def main():
+    args = parser.parse_args()
+    qualities = [int(quality) for quality in args.qualities.split(",")]
+    try:
+        encoders = [frame_encoders.create_encoder(name.strip()) for name in args.encoders.split(",")]
+    except (ImportError, ValueError) as e:
+        parser.error(str(e))
+    settings = [setting.strip() for setting in args.jpeg_settings.split(",")]
+    for setting in settings:
+        frame_encoders.parse_jpeg_settings(setting)  # ValueError bij een onbekende instelling
+    image_files = sorted(f for f in os.listdir(args.images) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+
+    host = host_info()
+    print(" ".join(f"{key}: {value}" for key, value in host.items()))
+    print(f"{'image':>26} {'resolution':>10} {'encoder':>9} {'settings':>16} {'q':>3} {'convert':>9} {'encode':>9} "
+          f"{'p99':>9} {'KB':>8} {'decode':>9}")
+    results = []
+    for image_file in image_files:
+        frame = cv2.imread(os.path.join(args.images, image_file))
+        if frame is None:
+            print(f"⚠️ Error reading: {image_file}")
+            continue
+        resolution = f"{frame.shape[1]}x{frame.shape[0]}"
+        for encoder in encoders:
+            for jpeg_settings in settings:
+                try:
+                    encoder.options(jpeg_settings)
+                except ValueError:
+                    continue  # bv. webp of turbojpeg met opt/rstN
+                for quality in qualities:
+                    row = {"filename": image_file, "resolution": resolution,
+                           **benchmark(encoder, frame, quality, jpeg_settings, args)}
+                    results.append(row)
+                    print(f"{image_file:>26} {resolution:>10} {encoder.name:>9} {jpeg_settings:>16} {quality:>3} "
+                          f"{row['convert_ms']:>7.2f}ms {row['encode_ms']:>7.2f}ms {row['encode_p99_ms']:>7.2f}ms "
+                          f"{row['size_kb']:>8.1f} {row['decode_ms']:>7.2f}ms")
+
+    # Snelste encoder per resolutie (mediaan over beelden en kwaliteiten, met de eerste instelling)
+    for resolution in sorted({row["resolution"] for row in results}):
+        encode = {}
+        for encoder in encoders:
+            samples = [row["encode_ms"] for row in results if row["resolution"] == resolution
+                       and row["encoder"] == encoder.name and row["jpeg_settings"] == settings[0]]
+            if samples:
+                encode[encoder.name] = statistics.median(samples)
+        print(f"{resolution:>10} ({settings[0]}): "
+              + ", ".join(f"{name} {ms:.2f} ms" for name, ms in sorted(encode.items(), key=lambda item: item[1])))
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(host) + list(results[0]))
+            writer.writeheader()
+            for row in results:
+                writer.writerow({**host, **row})
+        print(f"📋 Saved CSV: {args.csv}")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"host": host, "results": results}, json_file, indent=2)
+        print(f"📋 Saved JSON: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
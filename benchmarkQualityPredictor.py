@@ -0,0 +1,118 @@
+import argparse
+import collections
+import os
+import statistics
+import time
+import cv2
+import numpy as np
+import frame_encoders
+import quality_predictor
+import rate_controller
+
+# Headless test of quality_predictor.py: a webcam-like sequence over the test images (sensor noise, a
+# moving object and a slow brightness drift per frame), every image visited --visits times, with a byte
+# budget that changes every --budget_frames frames. Every frame is encoded once at the predicted
+# quality; a frame hits when its size is within --tolerance of the budget. QualityMapper from
+# rate_controller.py (size per quality learned over all frames, no scenes) runs next to it as baseline.
+# --depth N feeds the real sizes back N-1 frames late, like FramePipeline with N frames in flight
+# (simpleSenderWebcamAes_v2.py --executor thread/process); the hit rate should not drop much with it.
+parser = argparse.ArgumentParser(
+    description="Measure how well the per-scene quality predictor hits a frame size budget with one encode per frame."
+)
+parser.add_argument("--images", type=str, default="test_images", help="Folder with test images (default: test_images)")
+parser.add_argument("--encoder", type=str, choices=list(frame_encoders.ENCODERS), default="pil",
+                    help="Encoder backend (default: pil)")
+parser.add_argument("--budgets_bpp", type=str, default="0.5,1,2,1.5",
+                    help="Comma separated budgets in bits per pixel, cycled every --budget_frames (default: 0.5,1,2,1.5)")
+parser.add_argument("--budget_frames", type=int, default=15, help="Frames per budget (default: 15)")
+parser.add_argument("--frames", type=int, default=60, help="Frames per visit of an image (default: 60)")
+parser.add_argument("--visits", type=int, default=2, help="Visits of every image, the later ones can reuse the cached curve (default: 2)")
+parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative size error (default: 0.1)")
+parser.add_argument("--depth", type=int, default=1,
+                    help="Frames in flight: sizes reach the predictor this many frames after the prediction (default: 1)")
+parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+
+def frames(image, count, rng):
+    """ Webcam-like frames of a still image: noise, a moving block and a slow brightness drift """
+    height, width = image.shape[:2]
+    for index in range(count):
+        frame = np.clip(image.astype(np.int16) + rng.integers(-3, 4, image.shape) + index // 6, 0, 255).astype(np.uint8)
+        x = (index * 9) % max(1, width - width // 6)
+        cv2.rectangle(frame, (x, height // 3), (x + width // 6, height // 3 + height // 5), (40, 80, 200), -1)
+        yield frame
+
+
+def in_range(quality, size, budget, min_quality, max_quality):
+    """ False when even the lowest quality is too big or the highest too small for the budget """
+    return not ((quality == min_quality and size > budget) or (quality == max_quality and size < budget))
+
+
+def main():
+    args = parser.parse_args()
+    budgets = [float(bpp) for bpp in args.budgets_bpp.split(",")]
+    try:
+        encoder = frame_encoders.create_encoder(args.encoder)
+    except ImportError as e:
+        parser.error(str(e))
+    image_files = sorted(f for f in os.listdir(args.images) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    images = [(name, cv2.imread(os.path.join(args.images, name))) for name in image_files]
+    rng = np.random.default_rng(args.seed)
+
+    predictor = quality_predictor.QualityPredictor(encoder, tolerance=args.tolerance)
+    mapper = rate_controller.QualityMapper(predictor.min_quality, predictor.max_quality)
+    mapper_quality = 50
+    mapper_hits = mapper_frames = 0
+    predict_ms = []
+
+    print(f"{'image':>26} {'visit':>5} {'hits':>9} {'median err':>10} {'out':>4} {'fits':>4} {'baseline hits':>13}")
+    for visit in range(args.visits):
+        for name, image in images:
+            if image is None:
+                print(f"⚠️ Error reading: {name}")
+                continue
+            pixels = image.shape[0] * image.shape[1]
+            fits = predictor.fits
+            errors, out = [], 0
+            visit_mapper = [0, 0]
+            in_flight = collections.deque()  # (prediction, size) nog niet teruggemeld aan de predictor
+            for index, frame in enumerate(frames(image, args.frames, rng)):
+                budget = budgets[(index // args.budget_frames) % len(budgets)] * pixels / 8
+
+                begin = time.perf_counter()
+                prediction = predictor.predict(frame, budget)
+                predict_ms.append((time.perf_counter() - begin) * 1000)
+                prepared = encoder.prepare(frame)
+                size = len(encoder.encode(prepared, prediction.quality))
+                in_flight.append((prediction, size))
+                while len(in_flight) >= args.depth:
+                    predictor.observe(*in_flight.popleft())
+                if in_range(prediction.quality, size, budget, predictor.min_quality, predictor.max_quality):
+                    errors.append(abs(size / budget - 1))
+                else:
+                    out += 1
+
+                # Baseline: zelfde budget, kwaliteit uit de geleerde grootte per kwaliteit (geen scènes)
+                mapper_quality = mapper.quality(budget * 8, 1, mapper_quality)
+                mapper_size = len(encoder.encode(prepared, mapper_quality))
+                mapper.observe(mapper_quality, mapper_size)
+                if in_range(mapper_quality, mapper_size, budget, mapper.min_quality, mapper.max_quality):
+                    visit_mapper[1] += 1
+                    visit_mapper[0] += abs(mapper_size / budget - 1) <= args.tolerance
+
+            while in_flight:
+                predictor.observe(*in_flight.popleft())
+            hits = sum(error <= args.tolerance for error in errors)
+            median = f"{statistics.median(errors):.1%}" if errors else "-"
+            print(f"{name:>26} {visit + 1:>5} {hits:>4}/{len(errors):<4} {median:>10} {out:>4} "
+                  f"{predictor.fits - fits:>4} {visit_mapper[0]:>6}/{visit_mapper[1]:<6}")
+            mapper_hits += visit_mapper[0]
+            mapper_frames += visit_mapper[1]
+
+    print(f"🎯 Predictor: {predictor.stats()}, predict {statistics.median(predict_ms):.2f} ms median "
+          f"(incl. trial encodes: max {max(predict_ms):.1f} ms)")
+    print(f"📏 Baseline (QualityMapper): {mapper_hits}/{mapper_frames} frames within {args.tolerance:.0%} of the budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import random
+import statistics
+import cv2
+import rate_controller
+
+# Headless test of the receiver rate controllers (rate_controller.py) against a simulated bottleneck:
+# a webcam sender at --fps with QualityMapper, a FIFO link whose capacity changes every --phase_s
+# seconds (unbounded queue, so overshoot shows up as queueing delay, like a bufferbloated uplink) and
+# the receiver controller feeding its target back over the same base delay. Frame sizes per JPEG
+# quality come from encoding --image once per quality. With --base64 the link carries what the apps
+# really send: the AES-CBC encrypted JPEG as base64 in a JSON message (about 4/3 of the JPEG plus
+# JSON_OVERHEAD_BYTES). The sender and the controller keep counting JPEG bytes, as the apps do;
+# --measure wire feeds the controller the message size instead, to show the resulting mismatch.
+#
+# Per phase and controller it prints:
+#   converge_s   time until the link stays "in band" for the rest of the phase: delivered rate
+#                >= --band x capacity and queueing delay <= --max_queue_ms
+#   util         delivered rate / capacity after convergence
+#   queue        median / p95 queueing delay after convergence (ms)
+#   cv           coefficient of variation of the quality after convergence
+#   flips/s      quality direction changes per second after convergence (oscillation)
+parser = argparse.ArgumentParser(
+    description="Simulate the receiver rate controllers over a bottleneck link and measure convergence and stability."
+)
+parser.add_argument("--controllers", type=str, default=",".join(rate_controller.CONTROLLERS),
+                    help=f"Comma separated controllers (default: {','.join(rate_controller.CONTROLLERS)})")
+parser.add_argument("--capacity_mbit", type=str, default="8,5,12",
+                    help="Comma separated link capacity per phase in Mbit/s (default: 8,5,12)")
+parser.add_argument("--phase_s", type=float, default=30, help="Duration of every phase in seconds (default: 30)")
+parser.add_argument("--fps", type=float, default=25, help="Sender frame rate (default: 25)")
+parser.add_argument("--base_delay_ms", type=float, default=20, help="One-way delay without queueing, both directions (default: 20)")
+parser.add_argument("--jitter_ms", type=float, default=2, help="Random extra delay per frame, 0..N ms (default: 2)")
+parser.add_argument("--size_noise", type=float, default=0.05, help="Relative frame size noise (default: 0.05)")
+parser.add_argument("--image", type=str, default="test_images/city_640x480.jpg",
+                    help="Image whose JPEG size per quality is used (default: test_images/city_640x480.jpg)")
+parser.add_argument("--band", type=float, default=0.5, help="Minimum delivered rate / capacity to count as converged (default: 0.5)")
+parser.add_argument("--max_queue_ms", type=float, default=100, help="Maximum queueing delay to count as converged (default: 100)")
+parser.add_argument("--base64", action="store_true",
+                    help="Send every frame as encrypted base64 JSON over the link, like the apps do")
+parser.add_argument("--measure", type=str, choices=("jpeg", "wire"), default="jpeg",
+                    help="Frame size the controller measures: JPEG bytes (like the apps) or link bytes (default: jpeg)")
+parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+parser.add_argument("--csv", type=str, help="Write the per-frame time series to this CSV file")
+
+JSON_OVERHEAD_BYTES = 300  # velden naast "data" in een frame van de v2 zender
+
+
+def wire_bytes(jpeg_bytes):
+    """ Message size of one frame: IV + PKCS7 padded AES-CBC, base64 encoded, in JSON """
+    encrypted = 16 + (jpeg_bytes // 16 + 1) * 16
+    return 4 * ((encrypted + 2) // 3) + JSON_OVERHEAD_BYTES
+
+
+def jpeg_sizes(path):
+    """ JPEG bytes per quality 1..100 for one frame """
+    frame = cv2.imread(path)
+    if frame is None:
+        raise SystemExit(f"❌ Error reading: {path}")
+    return {quality: len(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1])
+            for quality in range(1, 101)}
+
+
+def simulate(name, capacities, sizes, args):
+    """ Runs one controller over all phases; returns the per-frame rows """
+    rng = random.Random(args.seed)
+    mapper = rate_controller.QualityMapper()
+    if name == "delay":
+        controller = rate_controller.DelayGradientController()
+    else:
+        controller = rate_controller.FpsStepController(wanted_fps=args.fps)
+    base_delay = args.base_delay_ms / 1000
+
+    quality, target_bps = 50, None
+    feedback = []  # (time the sender gets it, message), in order
+    link_free = previous_arrival = 0.0
+    delivered = []  # (arrival, bytes) of the last second
+    rows = []
+    frame_interval = 1 / args.fps
+    for frame_id in range(int(len(capacities) * args.phase_s * args.fps)):
+        sent_at = frame_id * frame_interval
+        while feedback and feedback[0][0] <= sent_at:
+            message = feedback.pop(0)[1]
+            if "target_bitrate" in message:
+                target_bps = message["target_bitrate"]
+            else:
+                quality = message["quality"]
+        if target_bps is not None:
+            quality = mapper.quality(target_bps, args.fps, quality)
+
+        size = max(1, int(sizes[quality] * (1 + rng.uniform(-args.size_noise, args.size_noise))))
+        mapper.observe(quality, size)
+        link_size = wire_bytes(size) if args.base64 else size
+        phase = min(int(sent_at // args.phase_s), len(capacities) - 1)
+        capacity = capacities[phase]
+        start = max(sent_at, link_free)
+        link_free = start + link_size * 8 / capacity
+        arrival = max(link_free + base_delay + rng.uniform(0, args.jitter_ms / 1000), previous_arrival)
+        previous_arrival = arrival
+
+        if name == "delay":
+            controller.on_frame(sent_at, arrival, link_size if args.measure == "wire" else size)
+            target = controller.feedback(arrival)
+            if target is not None:
+                feedback.append((arrival + base_delay, {"target_bitrate": target}))
+        else:
+            new_quality = controller.on_frame(arrival)
+            if new_quality is not None:
+                feedback.append((arrival + base_delay, {"quality": new_quality}))
+
+        delivered.append((arrival, link_size))
+        while arrival - delivered[0][0] > 1.0:
+            delivered.pop(0)
+        rows.append({
+            "controller": name,
+            "phase": phase,
+            "capacity_mbit": capacity / 1e6,
+            "sent_at": round(sent_at, 3),
+            "quality": quality,
+            "size_kb": round(size / 1024, 2),
+            "wire_kb": round(link_size / 1024, 2),
+            "target_mbit": round(target_bps / 1e6, 3) if target_bps is not None else "",
+            "delivered_mbit": round(sum(size for _, size in delivered) * 8 / 1e6, 3),
+            "queue_ms": round((start - sent_at) * 1000, 1),
+        })
+    return rows
+
+
+def summarize(rows, args):
+    """ Convergence and stability metrics of one phase """
+    capacity = rows[0]["capacity_mbit"]
+    start = rows[0]["sent_at"]
+    in_band = [(row["sent_at"], int(row["delivered_mbit"] >= args.band * capacity and row["queue_ms"] <= args.max_queue_ms))
+               for row in rows if row["sent_at"] - start >= 1.0]  # 1 s rate window
+    converge = rate_controller.settle_time([(start, 0)] + in_band, 1, 1, hold=min(5.0, args.phase_s / 3))
+    settled = [row for row in rows if converge is not None and row["sent_at"] - start >= converge]
+    if not settled:
+        return {"converge_s": None}
+
+    qualities = [row["quality"] for row in settled]
+    flips, direction = 0, 0
+    for before, after in zip(qualities, qualities[1:]):
+        step = (after > before) - (after < before)
+        if step and direction and step != direction:
+            flips += 1
+        direction = step or direction
+    queue = sorted(row["queue_ms"] for row in settled)
+    return {
+        "converge_s": round(converge, 1),
+        "util": round(statistics.mean(row["delivered_mbit"] for row in settled) / capacity, 2),
+        "queue_median_ms": queue[len(queue) // 2],
+        "queue_p95_ms": queue[int(len(queue) * 0.95)],
+        "quality": round(statistics.mean(qualities), 1),
+        "quality_cv": round(rate_controller.variation(qualities), 3),
+        "flips_per_s": round(flips / (settled[-1]["sent_at"] - settled[0]["sent_at"] or 1), 2),
+    }
+
+
+def main():
+    args = parser.parse_args()
+    capacities = [float(mbit) * 1e6 for mbit in args.capacity_mbit.split(",")]
+    controllers = [name.strip() for name in args.controllers.split(",")]
+    for name in controllers:
+        if name not in rate_controller.CONTROLLERS:
+            parser.error(f"Unknown controller {name!r}, choose from {','.join(rate_controller.CONTROLLERS)}")
+    sizes = jpeg_sizes(args.image)
+
+    print(f"{'controller':>10} {'phase':>5} {'Mbit/s':>6} {'converge':>9} {'util':>5} {'queue':>14} "
+          f"{'quality':>7} {'cv':>6} {'flips/s':>7}")
+    all_rows = []
+    for name in controllers:
+        rows = simulate(name, capacities, sizes, args)
+        all_rows += rows
+        for phase, capacity in enumerate(capacities):
+            result = summarize([row for row in rows if row["phase"] == phase], args)
+            if result["converge_s"] is None:
+                print(f"{name:>10} {phase:>5} {capacity / 1e6:>6.1f} {'never':>9}")
+                continue
+            print(f"{name:>10} {phase:>5} {capacity / 1e6:>6.1f} {result['converge_s']:>8.1f}s {result['util']:>5.2f} "
+                  f"{result['queue_median_ms']:>5.0f}/{result['queue_p95_ms']:>5.0f} ms {result['quality']:>7.1f} "
+                  f"{result['quality_cv']:>6.3f} {result['flips_per_s']:>7.2f}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(all_rows[0]))
+            writer.writeheader()
+            writer.writerows(all_rows)
+        print(f"📋 Saved CSV: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
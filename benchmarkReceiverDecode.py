@@ -0,0 +1,124 @@
+import argparse
+import csv
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import frame_crypto
+import frame_pipeline
+
+# Headless test of the receiver decode stage (imageTestBenchReceiver.py --decode_workers): encrypted
+# JPEG frames of the test images at every --resolutions go through the same stages as in the
+# receiver. With 0 workers, decrypt + imdecode + resize runs in the decode stage itself. With N
+# workers the decode stage submits to a pool of N threads and a reorder stage waits for the results in
+# order. The output stage checks that the frames come out in order. Per resolution and worker count
+# it prints frames/s and the speedup over the first worker count. The speedup is bounded by the
+# number of CPU cores: the crypto and OpenCV calls release the GIL.
+parser = argparse.ArgumentParser(
+    description="Measure how receiver decode throughput (decrypt + imdecode + resize) scales with the number of decode workers."
+)
+parser.add_argument("--images", type=str, default="test_images", help="Folder with test images (default: test_images)")
+parser.add_argument("--resolutions", type=str, default="800x600,1920x1080,3840x2160",
+                    help="Comma separated frame resolutions (default: 800x600,1920x1080,3840x2160)")
+parser.add_argument("--workers", type=str, default="0,1,2,4", help="Comma separated worker counts (default: 0,1,2,4)")
+parser.add_argument("--quality", type=int, default=80, help="JPEG quality (default: 80)")
+parser.add_argument("--cipher", type=str, choices=frame_crypto.CIPHER_SUITES, default="aes-cbc",
+                    help="Crypto suite (default: aes-cbc)")
+parser.add_argument("--frames", type=int, default=200, help="Frames per measurement (default: 200)")
+parser.add_argument("--queue_size", type=int, default=8, help="Queue length between the stages (default: 8)")
+parser.add_argument("--csv", type=str, help="Write the results to this CSV file")
+
+KEY = os.urandom(32)
+
+
+def encrypted_frames(images, size, quality, cipher):
+    """ One encrypted JPEG per test image at `size` """
+    payloads = []
+    for image in images:
+        jpeg = cv2.imencode(".jpg", cv2.resize(image, size), [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+        payloads.append(bytes(cipher.encrypt(jpeg)))
+    return payloads
+
+
+def run(payloads, size, cipher, workers, args):
+    """ Streams args.frames frames through the decode stages; returns (frames/s, decode ms per frame) """
+    decode_ms = []
+    received = []
+
+    def output(result):
+        index, (frame, _, frame_decode_ms) = result
+        if frame is None:
+            raise ValueError(f"frame {index} did not decode")
+        received.append(index)
+        decode_ms.append(frame_decode_ms)
+
+    sink = frame_pipeline.PipelineStage("output", output, args.queue_size)
+    if workers == 0:
+        decode = frame_pipeline.PipelineStage(
+            "decode", lambda item: (item[0], frame_pipeline.decrypt_and_decode(*item[1])), args.queue_size, outputs=(sink,))
+        stages = (decode, sink)
+        pool = None
+    else:
+        pool = ThreadPoolExecutor(workers)
+        reorder = frame_pipeline.PipelineStage(
+            "reorder", lambda item: (item[0], item[1].result()), args.queue_size + workers, outputs=(sink,))
+        decode = frame_pipeline.PipelineStage(
+            "decode", lambda item: (item[0], pool.submit(frame_pipeline.decrypt_and_decode, *item[1])),
+            args.queue_size, outputs=(reorder,))
+        stages = (decode, reorder, sink)
+    for stage in stages:
+        stage.start()
+
+    start = time.perf_counter()
+    for index in range(args.frames):
+        decode.put((index, (cipher, payloads[index % len(payloads)], b"", size)))
+    decode.close()
+    for stage in stages:
+        stage.join()
+    elapsed = time.perf_counter() - start
+    if pool is not None:
+        pool.shutdown()
+
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+    if received != list(range(args.frames)):
+        raise SystemExit(f"❌ Frames out of order with {workers} workers")
+    return args.frames / elapsed, statistics.median(decode_ms)
+
+
+def main():
+    args = parser.parse_args()
+    image_files = sorted(f for f in os.listdir(args.images) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    images = [image for image in (cv2.imread(os.path.join(args.images, name)) for name in image_files) if image is not None]
+    if not images:
+        raise SystemExit(f"❌ No test images in {args.images}")
+    cipher = frame_crypto.FrameCipher(args.cipher, KEY)
+    worker_counts = [int(workers) for workers in args.workers.split(",")]
+
+    print(f"🖥️ {os.cpu_count()} CPU cores, {args.cipher}, JPEG quality {args.quality}, {args.frames} frames per run")
+    print(f"{'resolution':>10} {'workers':>7} {'FPS':>8} {'speedup':>7} {'decode ms':>9}")
+    rows = []
+    for resolution in args.resolutions.split(","):
+        size = tuple(int(value) for value in resolution.split("x"))
+        payloads = encrypted_frames(images, size, args.quality, cipher)
+        baseline = None
+        for workers in worker_counts:
+            fps, decode_ms = run(payloads, size, cipher, workers, args)
+            baseline = baseline or fps
+            rows.append({"resolution": resolution, "workers": workers, "fps": round(fps, 1),
+                         "speedup": round(fps / baseline, 2), "decode_ms": round(decode_ms, 2),
+                         "cpu_count": os.cpu_count(), "cipher": args.cipher})
+            print(f"{resolution:>10} {workers:>7} {fps:>8.1f} {fps / baseline:>6.2f}x {decode_ms:>9.2f}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"📋 Saved CSV: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+import time
+import websockets
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the signaling relay: CPU time and bytes out while adding sender->receiver pairs."
+)
+parser.add_argument("--server", type=str, default="signalingServer.py", help="Relay script to benchmark (default: signalingServer.py)")
+parser.add_argument("--server_args", type=str, default="", help="Extra arguments passed to the relay script")
+parser.add_argument("--port", type=int, default=9100, help="Port used for the local relay (default: 9100)")
+parser.add_argument("--pairs", type=str, default="1,2,4,8", help="Comma separated number of pairs per run (default: 1,2,4,8)")
+parser.add_argument("--payload_kb", type=int, default=64, help="Message size in KB (default: 64)")
+parser.add_argument("--fps", type=int, default=30, help="Messages per second per sender (default: 30)")
+parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run (default: 5)")
+parser.add_argument("--single_room", action="store_true", help="Put every pair in the same room (old broadcast behaviour)")
+parser.add_argument("--binary", action="store_true", help="Send binary WebSocket frames instead of text frames")
+parser.add_argument("--receiver_kbps", type=float, default=0, help="Limit the receivers' downlink to this many kbit/s, to simulate congestion (0 = no limit)")
+parser.add_argument("--conflate", action="store_true", help="Senders ask the relay for latest-frame conflation (?conflate=1)")
+parser.add_argument("--workers", type=str, default="", help="Comma separated relay worker counts, passed as --workers (e.g. 1,2,4)")
+parser.add_argument("--load_procs", type=int, default=1, help="Processes used to generate the load, so the clients are not the bottleneck (default: 1)")
+parser.add_argument("--slow_receivers", type=int, default=0, help="Extra receivers per room that stop reading, like a stalled link (default: 0)")
+
+
+# Kop van elk benchmarkbericht; ook geldig als de relay het JSON-bericht her-encodeert (spaties)
+HEADER_RE = re.compile(r'\{"room": ?"([^"]*)", ?"t": ?([0-9.]+)')
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def process_cpu_seconds(pid):
+    """ CPU-tijd (user + system) van een proces via /proc, None als dat niet beschikbaar is (bv. Windows) """
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def relay_cpu_seconds(pid):
+    """ CPU-tijd van de relay inclusief zijn worker-processen (multi-worker modus) """
+    total = process_cpu_seconds(pid)
+    if total is None:
+        return None
+    return total + sum(process_cpu_seconds(child) or 0 for child in child_pids(pid))
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def record_message(stats, room, message, received):
+    stats["messages"] += 1
+    stats["bytes"] += len(message)
+    head = message[:80]
+    if isinstance(head, bytes):
+        head = head.decode("ascii", errors="replace")
+    match = HEADER_RE.match(head)
+    if match is None or match.group(1) != room:
+        stats["foreign"] += 1
+        return
+    stats["delays_ms"].append((received - float(match.group(2))) * 1000)
+
+
+async def run_receiver(url, room, stats, ready):
+    async with websockets.connect(url, max_size=None) as websocket:
+        ready.set()
+        try:
+            async for message in websocket:
+                record_message(stats, room, message, time.time())
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def open_raw_websocket(host, port, room, rcvbuf=0):
+    """ Minimale WebSocket-handshake op een gewone TCP-socket, voor ontvangers die de bibliotheek niet mag bufferen """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)  # Voor connect, anders negeert TCP het venster
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (host, port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write((f"GET /{room} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    await reader.readuntil(b"\r\n\r\n")
+    return reader, writer
+
+
+async def read_limited(reader, size, kbps):
+    """ Leest `size` bytes aan hoogstens `kbps` kbit/s: een smalle downlink """
+    chunks = []
+    while size > 0:
+        chunk = await reader.readexactly(min(size, 8192))
+        chunks.append(chunk)
+        size -= len(chunk)
+        await asyncio.sleep(len(chunk) * 8 / (kbps * 1000))
+    return b"".join(chunks)
+
+
+async def run_limited_receiver(host, port, room, stats, ready, kbps):
+    """ Ontvanger achter een link van `kbps` kbit/s; meet de vertraging zoals run_receiver """
+    reader, writer = await open_raw_websocket(host, port, room, rcvbuf=65536)
+    ready.set()
+    try:
+        while True:
+            head = await read_limited(reader, 2, kbps)
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await read_limited(reader, 2, kbps))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await read_limited(reader, 8, kbps))[0]
+            payload = await read_limited(reader, length, kbps)
+            if opcode == 8:  # Close
+                break
+            if opcode in (1, 2):  # Tekst / binair, de benchmark gebruikt geen fragmentatie
+                record_message(stats, room, payload, time.time())
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run_slow_receiver(host, port, room, ready, stop):
+    """ Ontvanger op een vastgelopen link: doet de WebSocket-handshake en leest daarna niets meer """
+    reader, writer = await open_raw_websocket(host, port, room)
+    writer.transport.pause_reading()
+    ready.set()
+    await stop.wait()
+    writer.close()
+
+
+async def run_sender(url, room, payload, fps, duration, binary):
+    interval = 1 / fps
+    async with websockets.connect(url, max_size=None) as websocket:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        next_send = start
+        sent = 0
+        while loop.time() - start < duration:
+            message = f'{{"room":"{room}","t":{time.time():.6f},"data":"{payload}"}}'
+            await websocket.send(message.encode() if binary else message)
+            sent += 1
+            next_send += interval
+            await asyncio.sleep(max(0, next_send - loop.time()))
+        return sent
+
+
+async def run_pairs(port, rooms, payload, fps, duration, slow_receivers, binary, receiver_kbps, conflate):
+    stop = asyncio.Event()
+    receivers = []
+    stats = []
+    for room in rooms:
+        pair_stats = {"messages": 0, "bytes": 0, "foreign": 0, "delays_ms": []}
+        ready = asyncio.Event()
+        if receiver_kbps > 0:
+            receiver = run_limited_receiver("127.0.0.1", port, room, pair_stats, ready, receiver_kbps)
+        else:
+            receiver = run_receiver(f"ws://127.0.0.1:{port}/{room}", room, pair_stats, ready)
+        receivers.append(asyncio.create_task(receiver))
+        await ready.wait()
+        stats.append(pair_stats)
+        for _ in range(slow_receivers):
+            ready = asyncio.Event()
+            receivers.append(asyncio.create_task(run_slow_receiver("127.0.0.1", port, room, ready, stop)))
+            await ready.wait()
+
+    query = "?conflate=1" if conflate else ""
+    senders = [run_sender(f"ws://127.0.0.1:{port}/{room}{query}", room, payload, fps, duration, binary) for room in rooms]
+    sent = sum(await asyncio.gather(*senders))
+
+    await asyncio.sleep(0.5)  # Laatste berichten laten aankomen
+    stop.set()
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+
+    return sent, stats
+
+
+def run_load(*job):
+    return asyncio.run(run_pairs(*job))
+
+
+def benchmark(args, pairs, workers=None):
+    payload = "A" * (args.payload_kb * 1024)
+    command = [sys.executable, args.server, "--port", str(args.port)] + args.server_args.split()
+    if workers is not None:
+        command += ["--workers", str(workers)]
+    rooms = ["bench" if args.single_room else f"bench{i}" for i in range(pairs)]
+    procs = max(1, min(args.load_procs, pairs))
+    jobs = [(args.port, rooms[i::procs], payload, args.fps, args.duration, args.slow_receivers, args.binary,
+             args.receiver_kbps, args.conflate) for i in range(procs)]
+
+    relay = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(args.port):
+            raise RuntimeError(f"❌ Relay did not start: {' '.join(command)}")
+        time.sleep(0.5)  # Workers laten opstarten
+        cpu_before = relay_cpu_seconds(relay.pid)
+        started = time.time()
+        if procs == 1:
+            results = [run_load(*jobs[0])]
+        else:
+            with multiprocessing.Pool(procs) as pool:
+                results = pool.starmap(run_load, jobs)
+        elapsed = time.time() - started
+        cpu_after = relay_cpu_seconds(relay.pid)
+    finally:
+        relay.terminate()
+        relay.wait()
+    relay_cpu = None if cpu_before is None else cpu_after - cpu_before
+
+    sent = sum(result[0] for result in results)
+    stats = [pair_stats for result in results for pair_stats in result[1]]
+    bytes_out = sum(s["bytes"] for s in stats)
+    delays = [d for s in stats for d in s["delays_ms"]]
+    return {
+        "workers": workers or 1,
+        "pairs": pairs,
+        "sent": sent,
+        "delivered": sum(s["messages"] for s in stats),
+        "foreign": sum(s["foreign"] for s in stats),
+        "mbytes_out": bytes_out / 1e6,
+        "relay_cpu_s": relay_cpu,
+        "delay_p50_ms": percentile(delays, 50),
+        "delay_p99_ms": percentile(delays, 99),
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    args = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    pair_counts = [int(p) for p in args.pairs.split(",")]
+    worker_counts = [int(w) for w in args.workers.split(",")] if args.workers else [None]
+
+    print(f"🚀 Relay benchmark: {args.server} {args.server_args} | {args.payload_kb} KB @ {args.fps} FPS, {args.duration}s per run")
+    print(f"{'workers':>7} {'pairs':>5} {'sent':>7} {'delivered':>9} {'foreign':>7} {'msg/s':>7} {'MB out':>9} {'MB/pair':>8} "
+          f"{'CPU s':>7} {'CPU s/pair':>10} {'msg/CPU-s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in worker_counts:
+        for pairs in pair_counts:
+            result = benchmark(args, pairs, workers)
+            cpu = result["relay_cpu_s"]
+            if cpu:
+                cpu_text = f"{cpu:7.2f} {cpu / pairs:10.3f} {result['delivered'] / cpu:10.0f}"
+            else:
+                cpu_text = f"{'n/a':>7} {'n/a':>10} {'n/a':>10}"
+            print(f"{result['workers']:>7} {result['pairs']:>5} {result['sent']:>7} {result['delivered']:>9} {result['foreign']:>7} "
+                  f"{result['delivered'] / result['elapsed_s']:7.0f} {result['mbytes_out']:9.1f} {result['mbytes_out'] / pairs:8.1f} "
+                  f"{cpu_text} {result['delay_p50_ms']:8.1f} {result['delay_p99_ms']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
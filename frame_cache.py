@@ -0,0 +1,82 @@
+import collections
+import os
+
+# Cache of encoded testbench frames, so the sender can stream without re-encoding the same
+# static image every frame (transport-only measurements, see imageTestBenchSender.py --frame_cache).
+#
+# Entries are keyed by a file-name-safe string, e.g. "cityNight_640x480_q50_<mtime>" (source image,
+# resolution, quality and source mtime). The memory part is an LRU limited to `max_bytes`; with a
+# `directory` the entries are also kept on disk (same limit, oldest files removed first), so the next
+# run on the same box starts with a full cache. Files get the neutral suffix SUFFIX: the data can be JPEG,
+# WebP or any other encoder output.
+SUFFIX = ".bin"
+
+
+class FrameCache:
+    """ Encoded frames in memory (LRU) and optionally on disk, each limited to `max_bytes` """
+
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.memory = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.directory = directory
+        self.files = {}  # name -> size, oldest first
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            entries = [entry for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith(SUFFIX)]
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+                self.files[entry.name[:-len(SUFFIX)]] = entry.stat().st_size
+
+    def get(self, key):
+        """ Encoded frame for `key`, or None """
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+        elif key in self.files:
+            with open(self._path(key), "rb") as cached_file:
+                data = cached_file.read()
+            self._remember(key, data)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        data = bytes(data)
+        self._remember(key, data)
+        if self.directory and len(data) <= self.max_bytes and key not in self.files:
+            while sum(self.files.values()) + len(data) > self.max_bytes:
+                oldest = next(iter(self.files))
+                os.remove(self._path(oldest))
+                del self.files[oldest]
+            with open(self._path(key), "wb") as cached_file:
+                cached_file.write(data)
+            self.files[key] = len(data)
+        return data
+
+    def get_or_encode(self, key, encode):
+        """ Cached frame, or the result of `encode()` which is then cached """
+        data = self.get(key)
+        return data if data is not None else self.put(key, encode())
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return  # too big for the cache, the caller keeps its own reference
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key))
+        while self.memory and self.memory_bytes + len(data) > self.max_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def stats(self):
+        return (f"{self.hits} hits, {self.misses} misses, {len(self.memory)} frames / "
+                f"{self.memory_bytes / 1024 / 1024:.1f} MB in memory"
+                + (f", {len(self.files)} frames on disk" if self.directory else ""))
@@ -0,0 +1,221 @@
+import os
+import struct
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.backends import default_backend
+
+# Crypto suites for testbench frames. The payload is always nonce/IV + ciphertext (+ 16 byte tag):
+#
+#   aes-cbc            AES-256-CBC + PKCS7, 16 byte IV (original testbench format, no authentication)
+#   aes-gcm            AES-256-GCM, 12 byte nonce, frame header bound in as associated data
+#   chacha20-poly1305  ChaCha20-Poly1305, 12 byte nonce, frame header bound in as associated data
+#
+# All suites use the same 32 byte key.
+#
+# encrypt() / decrypt() set up the cipher for every call (one-off use, benchmarkCrypto.py baseline).
+# FrameCipher does the key setup once per session and derives nonces from a frame counter:
+#   AEAD suites: nonce = 8 byte random session prefix + 4 byte counter (frame ids fit in 32 bits)
+#   aes-cbc:     IV = AES-ECB(prefix + 0000 + counter), unpredictable as CBC requires
+# The nonce still travels in front of every payload, so receivers need no counter state.
+CIPHER_SUITES = ("aes-cbc", "aes-gcm", "chacha20-poly1305")
+NONCE_BYTES = {"aes-cbc": 16, "aes-gcm": 12, "chacha20-poly1305": 12}
+TAG_BYTES = {"aes-cbc": 0, "aes-gcm": 16, "chacha20-poly1305": 16}
+AEAD_CLASSES = {"aes-gcm": AESGCM, "chacha20-poly1305": ChaCha20Poly1305}
+# The prefix must be unique per key: every run uses the same key, and two sessions with the same
+# prefix reuse AEAD nonces (leaks the plaintext XOR and the GCM authentication key). With 8 random
+# bytes a collision needs about 2^32 sessions; 4 bytes would collide after about 2^16.
+NONCE_PREFIX_BYTES = 8
+COUNTER = struct.Struct("!I")
+MAX_COUNTER = 2 ** 32 - 1
+
+
+class DecryptionError(ValueError):
+    """ Invalid padding or authentication tag: the frame is corrupt or was tampered with """
+
+
+def encrypt(suite, key, plain_bytes, associated_data=b""):
+    """ Returns nonce/IV + ciphertext (+ tag) for one frame """
+    nonce = os.urandom(NONCE_BYTES[suite])
+    if suite in AEAD_CLASSES:
+        return nonce + AEAD_CLASSES[suite](key).encrypt(nonce, plain_bytes, associated_data)
+
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(nonce), backend=default_backend()).encryptor()
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    padded = padder.update(plain_bytes) + padder.finalize()
+    return nonce + encryptor.update(padded) + encryptor.finalize()
+
+
+def decrypt(suite, key, payload, associated_data=b""):
+    """ Decrypts nonce/IV + ciphertext (+ tag); `payload` may be a memoryview """
+    payload = memoryview(payload)
+    nonce_bytes = NONCE_BYTES[suite]
+    nonce = bytes(payload[:nonce_bytes])
+    if suite in AEAD_CLASSES:
+        try:
+            return AEAD_CLASSES[suite](key).decrypt(nonce, payload[nonce_bytes:], associated_data)
+        except Exception as e:  # cryptography.exceptions.InvalidTag
+            raise DecryptionError(f"{suite}: authentication failed") from e
+
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(nonce), backend=default_backend()).decryptor()
+    decrypted_padded = decryptor.update(payload[nonce_bytes:]) + decryptor.finalize()
+    try:
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        return unpadder.update(decrypted_padded) + unpadder.finalize()
+    except ValueError as e:
+        raise DecryptionError(f"{suite}: invalid padding") from e
+
+
+class FrameCipher:
+    """ Per-session crypto state: key setup once, counter nonces, no padder or slicing copies.
+
+    Worker processes that encrypt frames out of order share `nonce_prefix` and pass an explicit
+    `counter` (e.g. the frame id) so nonces stay unique without shared state.
+    """
+
+    def __init__(self, suite, key, nonce_prefix=None):
+        if suite not in CIPHER_SUITES:
+            raise ValueError(f"Unknown cipher suite {suite!r}")
+        self.suite = suite
+        self.key = key
+        self.nonce_prefix = nonce_prefix if nonce_prefix is not None else os.urandom(NONCE_PREFIX_BYTES)
+        self.counter = 0
+        self.nonce_bytes = NONCE_BYTES[suite]
+        self.aes = algorithms.AES(key) if suite != "chacha20-poly1305" else None
+        self.aead = AEAD_CLASSES[suite](key) if suite in AEAD_CLASSES else None
+        # aes-cbc: IVs are the encrypted counter block, the ECB encryptor is reused for every frame
+        self.iv_encryptor = Cipher(self.aes, modes.ECB(), backend=default_backend()).encryptor() \
+            if suite == "aes-cbc" else None
+
+    def next_nonce(self, counter=None):
+        if counter is None:
+            counter = self.counter
+            self.counter += 1
+        if not 0 <= counter <= MAX_COUNTER:
+            raise ValueError(f"Nonce counter {counter} out of range: start a new session (new prefix)")
+        if self.iv_encryptor is not None:
+            return self.iv_encryptor.update(self.nonce_prefix + bytes(4) + COUNTER.pack(counter))
+        return self.nonce_prefix + COUNTER.pack(counter)
+
+    def encrypt(self, plain_bytes, associated_data=b"", counter=None):
+        """ Returns nonce/IV + ciphertext (+ tag), the same payload layout as encrypt() """
+        nonce = self.next_nonce(counter)
+        if self.aead is not None:
+            return nonce + self.aead.encrypt(nonce, plain_bytes, associated_data)
+
+        # PKCS7 without a padder: only the pad bytes are fed separately, the frame is not copied
+        pad = 16 - len(plain_bytes) % 16
+        out = bytearray(len(nonce) + len(plain_bytes) + pad + 15)
+        out[:len(nonce)] = nonce
+        view = memoryview(out)
+        encryptor = Cipher(self.aes, modes.CBC(nonce), backend=default_backend()).encryptor()
+        filled = len(nonce)
+        filled += encryptor.update_into(plain_bytes, view[filled:])
+        filled += encryptor.update_into(bytes([pad]) * pad, view[filled:])
+        return view[:filled]
+
+    def decrypt(self, payload, associated_data=b""):
+        """ Decrypts nonce/IV + ciphertext (+ tag) straight from a memoryview (no slice copies) """
+        payload = memoryview(payload)
+        nonce = bytes(payload[:self.nonce_bytes])
+        ciphertext = payload[self.nonce_bytes:]
+        if self.aead is not None:
+            try:
+                return self.aead.decrypt(nonce, ciphertext, associated_data)
+            except Exception as e:  # cryptography.exceptions.InvalidTag
+                raise DecryptionError(f"{self.suite}: authentication failed") from e
+
+        if len(ciphertext) == 0 or len(ciphertext) % 16:
+            raise DecryptionError(f"{self.suite}: ciphertext is not a whole number of blocks")
+        out = bytearray(len(ciphertext) + 15)
+        decryptor = Cipher(self.aes, modes.CBC(nonce), backend=default_backend()).decryptor()
+        filled = decryptor.update_into(ciphertext, out)
+        pad = out[filled - 1]
+        if not 1 <= pad <= 16 or out[filled - pad:filled] != bytes([pad]) * pad:
+            raise DecryptionError(f"{self.suite}: invalid padding")
+        return memoryview(out)[:filled - pad]
+
+    def stream_decryptor(self, payload_len, associated_data=b""):
+        return StreamDecryptor(self.suite, self.key, payload_len, associated_data, self)
+
+
+class StreamDecryptor:
+    """ Decrypts one frame payload that arrives in pieces (chunked frames).
+
+    aes-cbc and aes-gcm decrypt every piece straight into one preallocated plaintext buffer;
+    the GCM tag is held back from the last bytes of the payload. ChaCha20-Poly1305 has no
+    streaming API in `cryptography`, so its ciphertext is collected and decrypted at the end.
+    """
+
+    def __init__(self, suite, key, payload_len, associated_data=b"", frame_cipher=None):
+        self.suite = suite
+        self.key = key
+        self.associated_data = associated_data
+        self.nonce_bytes = NONCE_BYTES[suite]
+        # Reuse the session key setup (FrameCipher) when there is one
+        self.aes = frame_cipher.aes if frame_cipher is not None else None
+        self.aead = frame_cipher.aead if frame_cipher is not None else None
+        # Bytes that go through the decryptor; ChaCha20-Poly1305 keeps the tag with the ciphertext
+        self.stream_len = payload_len - self.nonce_bytes
+        if suite == "aes-gcm":
+            self.stream_len -= TAG_BYTES[suite]
+        minimum = TAG_BYTES[suite] if suite == "chacha20-poly1305" else 0
+        if self.stream_len < minimum:
+            raise DecryptionError(f"{suite}: payload of {payload_len} bytes is too short")
+        self.nonce = bytearray()
+        self.tag = bytearray()
+        self.received = 0
+        self.filled = 0
+        self.decryptor = None
+        # update_into needs one block of slack for a partial block
+        self.buffer = bytearray(self.stream_len + 15)
+        self.view = memoryview(self.buffer)
+
+    def update(self, data):
+        data = memoryview(data)
+        if len(self.nonce) < self.nonce_bytes:
+            take = self.nonce_bytes - len(self.nonce)
+            self.nonce += data[:take]
+            data = data[take:]
+            if len(self.nonce) < self.nonce_bytes:
+                return
+            if self.suite != "chacha20-poly1305":
+                mode = modes.CBC(bytes(self.nonce)) if self.suite == "aes-cbc" else modes.GCM(bytes(self.nonce))
+                self.decryptor = Cipher(self.aes or algorithms.AES(self.key), mode, backend=default_backend()).decryptor()
+                if self.suite == "aes-gcm":
+                    self.decryptor.authenticate_additional_data(self.associated_data)
+
+        take = min(len(data), self.stream_len - self.received)
+        self.received += take
+        self.tag += data[take:]
+        if self.decryptor is not None:
+            self.filled += self.decryptor.update_into(data[:take], self.view[self.filled:])
+        else:
+            self.view[self.filled:self.filled + take] = data[:take]
+            self.filled += take
+
+    def finalize(self):
+        """ Returns the plaintext as a memoryview (on the internal buffer for aes-cbc / aes-gcm) """
+        if self.received != self.stream_len or len(self.nonce) != self.nonce_bytes:
+            raise DecryptionError(f"{self.suite}: frame incomplete")
+
+        try:
+            if self.suite == "chacha20-poly1305":
+                return memoryview((self.aead or ChaCha20Poly1305(self.key)).decrypt(
+                    bytes(self.nonce), self.view[:self.filled], self.associated_data))
+            if self.suite == "aes-gcm":
+                tail = self.decryptor.finalize_with_tag(bytes(self.tag))
+            else:
+                tail = self.decryptor.finalize()
+        except Exception as e:  # cryptography.exceptions.InvalidTag
+            raise DecryptionError(f"{self.suite}: authentication failed") from e
+        if tail:
+            self.view[self.filled:self.filled + len(tail)] = tail
+            self.filled += len(tail)
+
+        if self.suite == "aes-gcm":
+            return self.view[:self.filled]
+        pad = self.buffer[self.filled - 1] if self.filled else 0
+        if not 1 <= pad <= 16 or self.buffer[self.filled - pad:self.filled] != bytes([pad]) * pad:
+            raise DecryptionError(f"{self.suite}: invalid padding")
+        return self.view[:self.filled - pad]
@@ -0,0 +1,123 @@
+import math
+import cv2
+import numpy as np
+
+# Tile-based delta encoding for the webcam senders (--delta) and their receivers.
+#
+# The frame is split into tile x tile blocks. A tile counts as changed when at least
+# `min_changed_pixels` of its pixels differ more than `pixel_threshold` (max over B, G, R) from the
+# reference, i.e. what the receiver last got for that tile; counting pixels instead of averaging
+# keeps webcam noise from marking every tile. Only changed tiles are sent, packed row-major into
+# one mosaic image (ceil(sqrt(n)) tiles wide) that goes through the normal JPEG + encryption path.
+# Tiles are a multiple of 16 pixels, so JPEG blocks never straddle two tiles.
+#
+# Keyframes are the plain full frame (readable by receivers without delta support). They are sent
+# for the first frame, every `keyframe_interval` frames and when more than `keyframe_ratio` of the
+# tiles changed. Extra message fields:
+#   "keyframe": bool, "tile_size": int, "tiles": [[row, col], ...] (delta frames, mosaic order),
+#   "tiles_total": int
+# A delta frame without changed tiles has "tiles": [] and an empty image payload.
+
+
+def tile_grid(width, height, tile):
+    return math.ceil(height / tile), math.ceil(width / tile)
+
+
+def tile_view(image, tile):
+    """ (rows, cols, tile, tile, 3) view on a frame whose sides are a multiple of `tile` """
+    rows, cols = image.shape[0] // tile, image.shape[1] // tile
+    return image.reshape(rows, tile, cols, tile, image.shape[2]).swapaxes(1, 2)
+
+
+class TileDeltaEncoder:
+    def __init__(self, tile=64, pixel_threshold=25, min_changed_pixels=16, keyframe_interval=50, keyframe_ratio=0.5):
+        if tile % 16:
+            raise ValueError("tile size must be a multiple of 16")
+        self.tile = tile
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_ratio = keyframe_ratio
+        self.reference = None  # padded frame as the receiver has it (before JPEG loss)
+        self.frames_since_keyframe = 0
+
+    def _pad(self, frame):
+        rows, cols = tile_grid(frame.shape[1], frame.shape[0], self.tile)
+        return cv2.copyMakeBorder(frame, 0, rows * self.tile - frame.shape[0], 0, cols * self.tile - frame.shape[1],
+                                  cv2.BORDER_REPLICATE)
+
+    def encode(self, frame):
+        """ Returns (image to encode, extra message fields); the image is the full frame for a keyframe,
+        the tile mosaic for a delta frame, or None when no tile changed """
+        padded = self._pad(frame)
+        rows, cols = padded.shape[0] // self.tile, padded.shape[1] // self.tile
+        fields = {"tile_size": self.tile, "tiles_total": rows * cols}
+
+        changed = None
+        if self.reference is not None and self.reference.shape == padded.shape:
+            moved = cv2.absdiff(padded, self.reference).max(axis=2) > self.pixel_threshold
+            counts = moved.reshape(rows, self.tile, cols, self.tile).sum(axis=(1, 3))
+            changed = np.argwhere(counts >= self.min_changed_pixels)
+
+        self.frames_since_keyframe += 1
+        if (changed is None or self.frames_since_keyframe >= self.keyframe_interval
+                or len(changed) > self.keyframe_ratio * rows * cols):
+            self.reference = padded
+            self.frames_since_keyframe = 0
+            return frame, {**fields, "keyframe": True}
+
+        fields.update(keyframe=False, tiles=changed.tolist())
+        if len(changed) == 0:
+            return None, fields
+
+        tiles = tile_view(padded, self.tile)[changed[:, 0], changed[:, 1]]
+        tile_view(self.reference, self.tile)[changed[:, 0], changed[:, 1]] = tiles
+        return mosaic(tiles, self.tile), fields
+
+
+def mosaic_shape(count):
+    """ (rows, cols) of the mosaic for `count` tiles """
+    cols = math.ceil(math.sqrt(count))
+    return math.ceil(count / cols), cols
+
+
+def mosaic(tiles, tile):
+    rows, cols = mosaic_shape(len(tiles))
+    slots = np.zeros((rows * cols, tile, tile, tiles.shape[3]), tiles.dtype)
+    slots[:len(tiles)] = tiles
+    return slots.reshape(rows, cols, tile, tile, tiles.shape[3]).swapaxes(1, 2).reshape(rows * tile, cols * tile, tiles.shape[3])
+
+
+class TileCompositor:
+    """ Receiver side: keeps the last full frame and pastes delta tiles onto it """
+
+    def __init__(self):
+        self.canvas = None  # padded to whole tiles
+        self.size = None
+
+    def apply(self, fields, image):
+        """ Returns the composed frame (a copy, safe to draw on) or None while no keyframe has arrived """
+        if "keyframe" not in fields:
+            return image  # sender without --delta
+
+        tile = fields["tile_size"]
+        if fields["keyframe"]:
+            if image is None:
+                return None
+            height, width = image.shape[:2]
+            rows, cols = tile_grid(width, height, tile)
+            self.canvas = np.zeros((rows * tile, cols * tile, image.shape[2]), image.dtype)
+            self.canvas[:height, :width] = image
+            self.size = (width, height)
+        elif self.canvas is None:
+            return None
+        elif fields["tiles"]:
+            positions = np.array(fields["tiles"])
+            rows, cols = mosaic_shape(len(positions))
+            if image is None or image.shape[:2] != (rows * tile, cols * tile):
+                return None
+            tiles = tile_view(image, tile).reshape(rows * cols, tile, tile, image.shape[2])[:len(positions)]
+            tile_view(self.canvas, tile)[positions[:, 0], positions[:, 1]] = tiles
+
+        width, height = self.size
+        return self.canvas[:height, :width].copy()
@@ -0,0 +1,183 @@
+import functools
+import io
+import cv2
+import numpy as np
+from PIL import Image
+
+try:
+    # optioneel: pip install PyTurboJPEG (+ libturbojpeg)
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_444, TJSAMP_422, TJSAMP_420, TJFLAG_PROGRESSIVE
+except ImportError:
+    TurboJPEG = None
+
+# Image encoder backends for the testbench senders and benchmarkEncoders.py:
+#
+#   pil        Pillow JPEG (original testbench path, needs an RGB PIL image)
+#   opencv     cv2.imencode JPEG straight from the BGR frame (as the RTC sender does)
+#   turbojpeg  libjpeg-turbo through PyTurboJPEG, BGR frame in, only when installed
+#   webp       Pillow WebP (lossy, same 1-100 quality scale, fastest method for live streaming)
+#
+# prepare() converts a frame (BGR numpy array from OpenCV, or PIL image) to what the backend encodes
+# from, so a sender can do that once per static image; encode() returns the encoded bytes and
+# decode() gives a BGR array back. The receivers use cv2.imdecode, which reads JPEG and WebP alike.
+#
+# JPEG settings are a "+"-separated string next to the quality, e.g. "420+opt+prog+rst16":
+#
+#   default        backend defaults (4:2:0, baseline, standard Huffman tables, no restart markers)
+#   444, 422, 420  chroma subsampling
+#   opt            optimized Huffman tables (extra pass, smaller file)
+#   prog           progressive JPEG
+#   rstN           restart marker every N MCU blocks (a corrupt block only breaks up to the next marker)
+DEFAULT_JPEG_SETTINGS = "default"
+SUBSAMPLINGS = ("444", "422", "420")
+
+
+@functools.lru_cache(maxsize=None)
+def parse_jpeg_settings(text):
+    """ "420+opt+rst16" -> {"subsampling": "420", "optimize": True, "progressive": False, "restart_blocks": 16} """
+    settings = {"subsampling": None, "optimize": False, "progressive": False, "restart_blocks": 0}
+    for token in text.split("+"):
+        token = token.strip()
+        if token == DEFAULT_JPEG_SETTINGS:
+            continue
+        if token in SUBSAMPLINGS:
+            settings["subsampling"] = token
+        elif token == "opt":
+            settings["optimize"] = True
+        elif token == "prog":
+            settings["progressive"] = True
+        elif token.startswith("rst") and token[3:].isdigit() and int(token[3:]) > 0:
+            settings["restart_blocks"] = int(token[3:])
+        else:
+            raise ValueError(f"Unknown JPEG setting {token!r} in {text!r} (444/422/420, opt, prog, rstN)")
+    return settings
+
+
+class PilEncoder:
+    name = "pil"
+    format = "JPEG"
+    SUBSAMPLING = {"444": 0, "422": 1, "420": 2}
+
+    def prepare(self, frame):
+        if isinstance(frame, np.ndarray):
+            return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        return frame
+
+    def options(self, settings=DEFAULT_JPEG_SETTINGS):
+        """ Pillow save() arguments; rstN needs a Pillow version with restart_marker_blocks """
+        settings = parse_jpeg_settings(settings)
+        options = {}
+        if settings["subsampling"]:
+            options["subsampling"] = self.SUBSAMPLING[settings["subsampling"]]
+        if settings["optimize"]:
+            options["optimize"] = True
+        if settings["progressive"]:
+            options["progressive"] = True
+        if settings["restart_blocks"]:
+            options["restart_marker_blocks"] = settings["restart_blocks"]
+        return options
+
+    def encode(self, image, quality, settings=DEFAULT_JPEG_SETTINGS):
+        compressed_io = io.BytesIO()
+        image.save(compressed_io, format=self.format, quality=quality, **self.options(settings))
+        return compressed_io.getbuffer()
+
+    def decode(self, data):
+        return cv2.cvtColor(np.asarray(Image.open(io.BytesIO(data)).convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+class WebpEncoder(PilEncoder):
+    name = "webp"
+    format = "WEBP"
+
+    def options(self, settings=DEFAULT_JPEG_SETTINGS):
+        if settings != DEFAULT_JPEG_SETTINGS:
+            raise ValueError("webp encoder has no JPEG settings")
+        # method 0: snelste WebP-compressie (Pillow's standaard 4 is ~4x trager, ~20% kleiner)
+        return {"method": 0}
+
+
+class OpenCvEncoder:
+    name = "opencv"
+    # cv2.IMWRITE_JPEG_SAMPLING_FACTOR_* bestaan pas sinds OpenCV 4.7: pas opzoeken als erom gevraagd wordt
+    SUBSAMPLING = {
+        "444": "IMWRITE_JPEG_SAMPLING_FACTOR_444",
+        "422": "IMWRITE_JPEG_SAMPLING_FACTOR_422",
+        "420": "IMWRITE_JPEG_SAMPLING_FACTOR_420",
+    }
+
+    def prepare(self, frame):
+        if isinstance(frame, np.ndarray):
+            return frame
+        return cv2.cvtColor(np.asarray(frame.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+    def options(self, settings=DEFAULT_JPEG_SETTINGS):
+        """ cv2.imencode flags after the quality """
+        settings = parse_jpeg_settings(settings)
+        options = []
+        if settings["subsampling"]:
+            factor = getattr(cv2, self.SUBSAMPLING[settings["subsampling"]], None)
+            if factor is None or not hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+                raise ValueError(f"opencv encoder: chroma subsampling needs OpenCV >= 4.7 (found {cv2.__version__})")
+            options += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factor]
+        if settings["optimize"]:
+            options += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        if settings["progressive"]:
+            options += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+        if settings["restart_blocks"]:
+            options += [cv2.IMWRITE_JPEG_RST_INTERVAL, settings["restart_blocks"]]
+        return options
+
+    def encode(self, frame, quality, settings=DEFAULT_JPEG_SETTINGS):
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality] + self.options(settings))
+        if not ok:
+            raise ValueError("cv2.imencode failed")
+        return buffer.data
+
+    def decode(self, data):
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class TurboJpegEncoder(OpenCvEncoder):
+    name = "turbojpeg"
+
+    def __init__(self):
+        self.turbo = TurboJPEG()  # one handle per instance: senders create one per worker
+
+    def options(self, settings=DEFAULT_JPEG_SETTINGS):
+        """ PyTurboJPEG encode() arguments; it has no Huffman optimisation or restart interval option """
+        settings = parse_jpeg_settings(settings)
+        if settings["optimize"] or settings["restart_blocks"]:
+            raise ValueError("turbojpeg encoder supports only 444/422/420 and prog")
+        subsampling = {"444": TJSAMP_444, "422": TJSAMP_422, "420": TJSAMP_420}[settings["subsampling"] or "420"]
+        return {"jpeg_subsample": subsampling, "flags": TJFLAG_PROGRESSIVE if settings["progressive"] else 0}
+
+    def encode(self, frame, quality, settings=DEFAULT_JPEG_SETTINGS):
+        return self.turbo.encode(np.ascontiguousarray(frame), quality=quality, pixel_format=TJPF_BGR,
+                                 **self.options(settings))
+
+    def decode(self, data):
+        return self.turbo.decode(bytes(data), pixel_format=TJPF_BGR)
+
+
+ENCODERS = {encoder.name: encoder for encoder in (PilEncoder, OpenCvEncoder, TurboJpegEncoder, WebpEncoder)}
+
+
+def available_encoders():
+    """ Backend names that work on this machine (turbojpeg needs PyTurboJPEG and libturbojpeg) """
+    names = []
+    for name in ENCODERS:
+        try:
+            create_encoder(name)
+        except (ImportError, OSError, RuntimeError):
+            continue
+        names.append(name)
+    return names
+
+
+def create_encoder(name):
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder {name!r}")
+    if name == "turbojpeg" and TurboJPEG is None:
+        raise ImportError("turbojpeg encoder needs PyTurboJPEG: pip install PyTurboJPEG")
+    return ENCODERS[name]()
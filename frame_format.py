@@ -0,0 +1,249 @@
+import json
+import struct
+import time
+from datetime import datetime
+
+# Testbench frames are split into a session header and minimal per-frame fields.
+#
+# Session header (JSON text message, sent when the image/resolution or encoder settings change and
+# refreshed every second so late or lossy receivers recover): {"type": "session", "session": id,
+# "setup_description", "filename", "width", "height", "cipher", "encoder", "jpeg_settings"}.
+# Frames only carry the session id; `cipher` is one of frame_crypto.CIPHER_SUITES (AEAD suites
+# authenticate associated_data() of every frame), `encoder` / `jpeg_settings` see frame_encoders.py.
+#
+# Binary frame (one binary WebSocket message):
+#
+#   fixed header (HEADER) | payload (IV + ciphertext, payload_len bytes)
+#
+# All header fields are network byte order. relay_ingress / relay_egress are 0.0 until a relay
+# with --stamp fills them in place, so the relay never has to parse the rest of the frame.
+#
+# Chunked binary frame (sender --chunk_kb): the payload is split over several binary messages that
+# each carry CHUNK_HEADER (HEADER + chunk_index, chunk_count, chunk_offset), so the relay offsets
+# stay the same and every message stays small. The receiver decrypts each chunk as it arrives.
+#
+# JSON frame (text message): {"session", "frame_id", "sent_at", "jpeg_quality", "jpeg_bytes", "size_kb",
+# "compression_time_ms", "encryption_time_ms", "loop_block_ms", "send_lag_ms", "skipped_frames",
+# "dropped_frames", "send_wait_ms", "degraded", "data" (base64)}.
+#
+# loop_block_ms is the longest time the sender's event loop was blocked since the previous frame.
+# send_lag_ms is how late the frame went out against its frame_pipeline.FramePacer deadline, and
+# skipped_frames the number of frame slots the sender skipped right before it (it fell behind).
+# dropped_frames counts the frames the sender dropped right before it because its WebSocket write
+# buffer was full, send_wait_ms how long it waited for that buffer, and "degraded" (bit 0 of the flags
+# byte in a binary frame) marks a frame sent at a lower quality for the same reason
+# (frame_pipeline.Backpressure).
+MAGIC = b"5GWF"
+VERSION = 5
+HEADER = struct.Struct("!4sBBIIdddBffffHHfII")
+CHUNK_MAGIC = b"5GWC"
+CHUNK_HEADER = struct.Struct("!4sBBIIdddBffffHHfIIHHI")
+ASSOCIATED_DATA = struct.Struct("!IIdBI")
+RELAY_INGRESS_OFFSET = struct.calcsize("!4sBBIId")
+RELAY_EGRESS_OFFSET = RELAY_INGRESS_OFFSET + 8
+RELAY_OFFSETS = {"relay_ingress": RELAY_INGRESS_OFFSET, "relay_egress": RELAY_EGRESS_OFFSET}
+WIRE_FORMATS = ("json", "binary")
+SESSION_TYPE = "session"
+FLAG_DEGRADED = 0x01
+
+
+def format_timestamp(epoch_seconds):
+    """ Same string format as the CSV timestamps: 'YYYY-MM-DD HH:MM:SS.mmm' (local time) """
+    return datetime.fromtimestamp(epoch_seconds).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def session_message(session_id, setup_description, filename, width, height, cipher="aes-cbc", encoder="pil",
+                    jpeg_settings="default"):
+    return json.dumps({
+        "type": SESSION_TYPE,
+        "session": session_id,
+        "setup_description": setup_description,
+        "filename": filename,
+        "width": width,
+        "height": height,
+        "cipher": cipher,
+        "encoder": encoder,
+        "jpeg_settings": jpeg_settings,
+    })
+
+
+def read_session(data):
+    """ Receiver-side session state; everything derived (resolution string, size tuple) is computed once """
+    session = dict(data)
+    session["size"] = (int(data["width"]), int(data["height"]))
+    session["resolution"] = f"{session['size'][0]}x{session['size'][1]}"
+    session.setdefault("cipher", "aes-cbc")
+    session.setdefault("encoder", "pil")
+    session.setdefault("jpeg_settings", "default")
+    return session
+
+
+def associated_data(session_id, frame_id, sent_at, quality, jpeg_bytes):
+    """ Header fields bound to the ciphertext by the AEAD suites (frame_crypto.py).
+
+    Timings and relay timestamps are left out: they are filled in after encryption.
+    """
+    return ASSOCIATED_DATA.pack(session_id, frame_id, sent_at, quality, jpeg_bytes)
+
+
+def frame_associated_data(frame):
+    """ associated_data() for a decoded frame or chunk (binary or JSON) """
+    return associated_data(frame["session"], frame["frame_id"], frame["sent_at"], frame["jpeg_quality"],
+                           frame["jpeg_bytes"])
+
+
+def pack_frame(session_id, frame_id, sent_at, quality, jpeg_bytes, compression_time_ms,
+               encryption_time_ms, payload, loop_block_ms=0.0, send_lag_ms=0.0, skipped_frames=0,
+               dropped_frames=0, send_wait_ms=0.0, degraded=False):
+    """ Builds a binary frame; `payload` is the raw IV + ciphertext """
+    header = HEADER.pack(MAGIC, VERSION, FLAG_DEGRADED if degraded else 0, session_id, frame_id, sent_at, 0.0, 0.0,
+                         quality, compression_time_ms, encryption_time_ms, loop_block_ms, send_lag_ms,
+                         min(skipped_frames, 0xFFFF), min(dropped_frames, 0xFFFF), send_wait_ms,
+                         jpeg_bytes, len(payload))
+    return b"".join((header, payload))
+
+
+def split_frame(session_id, frame_id, sent_at, quality, jpeg_bytes, compression_time_ms,
+                encryption_time_ms, payload, chunk_size, loop_block_ms=0.0, send_lag_ms=0.0, skipped_frames=0,
+                dropped_frames=0, send_wait_ms=0.0, degraded=False):
+    """ Yields the chunk messages of one frame; only one chunk is copied at a time """
+    view = memoryview(payload)
+    chunk_count = max(1, -(-len(payload) // chunk_size))
+    for index in range(chunk_count):
+        offset = index * chunk_size
+        chunk = view[offset:offset + chunk_size]
+        header = CHUNK_HEADER.pack(CHUNK_MAGIC, VERSION, FLAG_DEGRADED if degraded else 0, session_id, frame_id,
+                                   sent_at, 0.0, 0.0, quality, compression_time_ms, encryption_time_ms, loop_block_ms,
+                                   send_lag_ms, min(skipped_frames, 0xFFFF), min(dropped_frames, 0xFFFF),
+                                   send_wait_ms, jpeg_bytes, len(payload), index, chunk_count, offset)
+        yield b"".join((header, chunk))
+
+
+def is_binary_frame(message):
+    return isinstance(message, (bytes, bytearray)) and message[:4] in (MAGIC, CHUNK_MAGIC)
+
+
+def is_chunk(message):
+    return isinstance(message, (bytes, bytearray)) and message[:4] == CHUNK_MAGIC
+
+
+def stamp_relay(message, field, value):
+    """ Fills relay_ingress or relay_egress in a binary frame (one copy, no parsing) """
+    stamped = bytearray(message)
+    struct.pack_into("!d", stamped, RELAY_OFFSETS[field], value)
+    return bytes(stamped)
+
+
+def unpack_frame(message):
+    """ Decodes a binary frame into the same keys as a JSON frame.
+
+    `data` is a memoryview on the raw IV + ciphertext (no base64, no copy); the relay
+    timestamps are only present when a relay stamped the frame.
+    """
+    (magic, version, flags, session_id, frame_id, sent_at, relay_ingress, relay_egress, quality,
+     compression_time_ms, encryption_time_ms, loop_block_ms, send_lag_ms, skipped_frames, dropped_frames,
+     send_wait_ms, jpeg_bytes, payload_len) = HEADER.unpack_from(message)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unknown frame format {magic!r} v{version}")
+
+    frame = {
+        "session": session_id,
+        "frame_id": frame_id,
+        "sent_at": sent_at,
+        "jpeg_quality": quality,
+        "jpeg_bytes": jpeg_bytes,
+        "size_kb": round(jpeg_bytes / 1024, 2),
+        "compression_time_ms": round(compression_time_ms, 5),
+        "encryption_time_ms": round(encryption_time_ms, 5),
+        "loop_block_ms": round(loop_block_ms, 3),
+        "send_lag_ms": round(send_lag_ms, 3),
+        "skipped_frames": skipped_frames,
+        "dropped_frames": dropped_frames,
+        "send_wait_ms": round(send_wait_ms, 3),
+        "degraded": bool(flags & FLAG_DEGRADED),
+        "data": memoryview(message)[HEADER.size:HEADER.size + payload_len],
+    }
+    if relay_ingress:
+        frame["relay_ingress"] = relay_ingress
+    if relay_egress:
+        frame["relay_egress"] = relay_egress
+    return frame
+
+
+def unpack_chunk(message):
+    """ Decodes one chunk message; `payload_len` is the size of the whole frame payload """
+    (magic, version, flags, session_id, frame_id, sent_at, relay_ingress, relay_egress, quality,
+     compression_time_ms, encryption_time_ms, loop_block_ms, send_lag_ms, skipped_frames, dropped_frames,
+     send_wait_ms, jpeg_bytes, payload_len, chunk_index, chunk_count, chunk_offset) = CHUNK_HEADER.unpack_from(message)
+    if magic != CHUNK_MAGIC or version != VERSION:
+        raise ValueError(f"Unknown chunk format {magic!r} v{version}")
+
+    chunk = {
+        "session": session_id,
+        "frame_id": frame_id,
+        "sent_at": sent_at,
+        "jpeg_quality": quality,
+        "jpeg_bytes": jpeg_bytes,
+        "size_kb": round(jpeg_bytes / 1024, 2),
+        "compression_time_ms": round(compression_time_ms, 5),
+        "encryption_time_ms": round(encryption_time_ms, 5),
+        "loop_block_ms": round(loop_block_ms, 3),
+        "send_lag_ms": round(send_lag_ms, 3),
+        "skipped_frames": skipped_frames,
+        "dropped_frames": dropped_frames,
+        "send_wait_ms": round(send_wait_ms, 3),
+        "degraded": bool(flags & FLAG_DEGRADED),
+        "payload_len": payload_len,
+        "chunk_index": chunk_index,
+        "chunk_count": chunk_count,
+        "chunk_offset": chunk_offset,
+        "data": memoryview(message)[CHUNK_HEADER.size:],
+    }
+    if relay_ingress:
+        chunk["relay_ingress"] = relay_ingress
+    if relay_egress:
+        chunk["relay_egress"] = relay_egress
+    return chunk
+
+
+class ChunkedFrame:
+    """ Reassembles one chunked frame while it arrives.
+
+    Every chunk is handed to `decryptor` (frame_crypto.StreamDecryptor) as soon as it is in, so
+    the receiver never holds the full ciphertext and the last chunk only costs one chunk of work.
+    """
+
+    def __init__(self, first_chunk, decryptor):
+        self.frame = {key: value for key, value in first_chunk.items() if key != "data"}
+        self.decryptor = decryptor
+        self.next_index = 0
+        self.wire_bytes = 0
+        self.decryption_time_ms = 0.0
+
+    def add(self, chunk, message_bytes=0):
+        """ Decrypts the next chunk; returns True when the frame is complete """
+        if chunk["frame_id"] != self.frame["frame_id"] or chunk["chunk_index"] != self.next_index:
+            raise ValueError(f"Chunk {chunk['chunk_index']} of frame {chunk['frame_id']} out of order")
+
+        start = time.perf_counter()
+        self.decryptor.update(chunk["data"])
+        self.decryption_time_ms += (time.perf_counter() - start) * 1000
+        self.next_index += 1
+        self.wire_bytes += message_bytes
+        for field in ("relay_ingress", "relay_egress"):
+            if field in chunk:
+                self.frame[field] = chunk[field]
+        return self.next_index == self.frame["chunk_count"]
+
+    def plaintext(self):
+        start = time.perf_counter()
+        plain = self.decryptor.finalize()
+        self.decryption_time_ms += (time.perf_counter() - start) * 1000
+        return plain
+
+
+def wire_bytes(message):
+    """ Size of a WebSocket message on the wire (payload only, without WebSocket framing) """
+    if isinstance(message, str):
+        return len(message) if message.isascii() else len(message.encode("utf-8"))
+    return len(message)
@@ -0,0 +1,388 @@
+import asyncio
+import base64
+import collections
+import functools
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import cv2
+import numpy as np
+import frame_crypto
+import frame_encoders
+import frame_format
+
+# Encode + encrypt stage of the senders, optionally outside the asyncio event loop:
+#
+#   none     run inline in the coroutine (old behaviour, blocks the loop for the whole frame)
+#   thread   thread pool; Pillow and cryptography release the GIL for the heavy work
+#   process  process pool; every frame is pickled to the worker and the payload back
+#
+# Results always come out in submission order. Every worker has its own FrameCipher with the
+# session nonce prefix and uses the frame id as explicit counter, so nonces never collide.
+EXECUTOR_MODES = ("none", "thread", "process")
+BACKPRESSURE_POLICIES = ("off", "drop", "degrade", "wait")
+
+_worker = threading.local()
+_STOP = object()  # end of stream marker between PipelineStages
+
+
+def init_worker(suite, key, nonce_prefix, encoder="pil"):
+    _worker.cipher = frame_crypto.FrameCipher(suite, key, nonce_prefix)
+    _worker.encoder = frame_encoders.create_encoder(encoder)
+
+
+def encode_image(encoder, image, quality, jpeg_settings=frame_encoders.DEFAULT_JPEG_SETTINGS):
+    """ Encodes `image` (PIL image, BGR numpy array, or encoder.prepare() output); returns (data, compression_time_ms).
+
+    Only encoder.encode() is timed, the conversion to the backend's input format is not.
+    """
+    image = encoder.prepare(image)
+    compress_start = time.time()
+    data = encoder.encode(image, quality, jpeg_settings)
+    return data, (time.time() - compress_start) * 1000
+
+
+def encode_and_encrypt(image, quality, frame_fields=None, counter=None, to_base64=False,
+                       jpeg_settings=frame_encoders.DEFAULT_JPEG_SETTINGS):
+    """ Encodes `image` with the worker's encoder (see encode_image) and encrypts it.
+
+    `image` may also be an already encoded JPEG (bytes, e.g. from frame_cache.FrameCache): then only
+    the encryption runs and compression_time_ms is 0.
+    `frame_fields` (session_id, frame_id, sent_at, quality) are authenticated together with the
+    JPEG size as frame_format.associated_data(). Returns (jpeg_bytes, compression_time_ms, payload,
+    encryption_time_ms); `payload` is the base64 text for JSON messages when `to_base64` is set.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        compressed_bytes, compression_time_ms = image, 0.0
+    else:
+        compressed_bytes, compression_time_ms = encode_image(_worker.encoder, image, quality, jpeg_settings)
+    associated_data = frame_format.associated_data(*frame_fields, len(compressed_bytes)) if frame_fields else b""
+
+    encrypt_start = time.time()
+    payload = _worker.cipher.encrypt(compressed_bytes, associated_data, counter)
+    encryption_time_ms = (time.time() - encrypt_start) * 1000
+    if to_base64:
+        payload = base64.b64encode(payload).decode("utf-8")
+    else:
+        payload = bytes(payload)  # picklable for the process pool
+    return len(compressed_bytes), compression_time_ms, payload, encryption_time_ms
+
+
+def decrypt_and_decode(cipher, payload, associated_data=b"", size=None):
+    """ Decode job of the receivers: decrypts `payload` with `cipher` (a FrameCipher, or None when it is
+    already the JPEG, e.g. a reassembled chunked frame), decodes it and resizes it to `size` if needed.
+
+    The decryption and cv2.imdecode / cv2.resize release the GIL, so a thread pool runs several of
+    these in parallel. Returns (frame or None, decryption_time_ms, decode_time_ms); raises
+    frame_crypto.DecryptionError when the payload doesn't decrypt.
+    """
+    decryption_time_ms = 0.0
+    if cipher is not None:
+        decrypt_start = time.perf_counter()
+        payload = cipher.decrypt(payload, associated_data)
+        decryption_time_ms = (time.perf_counter() - decrypt_start) * 1000
+    decode_start = time.perf_counter()
+    frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+    if frame is not None and size is not None and (frame.shape[1], frame.shape[0]) != tuple(size):
+        frame = cv2.resize(frame, tuple(size))
+    return frame, decryption_time_ms, (time.perf_counter() - decode_start) * 1000
+
+
+class FramePipeline:
+    """ Ordered encode + encrypt pipeline with at most `depth` frames in flight.
+
+    The producer awaits submit() (it waits while the pipeline is full); a separate consumer task
+    iterates results() and gets every frame as soon as it and all frames before it are done.
+    """
+
+    def __init__(self, mode, suite, key, workers=2, depth=None, encoder="pil"):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode {mode!r}")
+        self.mode = mode
+        initargs = (suite, key, os.urandom(frame_crypto.NONCE_PREFIX_BYTES), encoder)
+        if mode == "thread":
+            self.executor = ThreadPoolExecutor(workers, initializer=init_worker, initargs=initargs)
+        elif mode == "process":
+            self.executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=initargs)
+        else:
+            self.executor = None
+            init_worker(*initargs)
+        self.pending = asyncio.Queue(maxsize=1 if mode == "none" else (depth or workers))
+        self.consumer = None
+
+    def start(self, consumer):
+        """ Runs the coroutine that iterates results() as a task; submit() fails once it has stopped """
+        self.consumer = asyncio.get_running_loop().create_task(consumer)
+        return self.consumer
+
+    async def submit(self, meta, image, quality, frame_fields=None, counter=None, to_base64=False,
+                     jpeg_settings=frame_encoders.DEFAULT_JPEG_SETTINGS):
+        """ Queues one frame; `meta` comes back unchanged with its result """
+        job = functools.partial(encode_and_encrypt, image, quality, frame_fields, counter, to_base64, jpeg_settings)
+        loop = asyncio.get_running_loop()
+        if self.executor is None:
+            result = loop.create_future()
+            result.set_result(job())
+        else:
+            result = loop.run_in_executor(self.executor, job)
+        if self.consumer is None:
+            await self.pending.put((meta, result))
+            return
+
+        # Don't wait forever on a full queue when the consumer died (e.g. the connection closed)
+        put = loop.create_task(self.pending.put((meta, result)))
+        await asyncio.wait((put, self.consumer), return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            self.consumer.result()
+            raise RuntimeError("Frame pipeline consumer stopped")
+
+    async def results(self):
+        """ Yields (meta, (jpeg_bytes, compression_time_ms, payload, encryption_time_ms)) in order """
+        while True:
+            meta, result = await self.pending.get()
+            if result is None:
+                return
+            yield meta, await result
+
+    async def finish(self):
+        """ No more frames: results() ends after the frames already submitted """
+        await self.pending.put((None, None))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)  # at most `depth` frames still in flight
+
+
+class FramePacer:
+    """ Frame clock with absolute deadlines: frame n is due at start + n / fps.
+
+    Sleeping until the deadline instead of sleeping one interval after the work keeps the frame rate
+    at `fps` whatever encoding, encryption and sending cost, and a late wake-up is made up on the next
+    frame, so the rate doesn't drift. When the sender is a whole interval or more behind, the missed
+    slots are skipped (and counted) instead of sent in a burst.
+    """
+
+    def __init__(self, fps):
+        self.interval = 1 / fps
+        self.start = None  # loop.time() of slot 0
+        self.start_epoch = None  # time.time() of slot 0
+        self.slot = 0
+        self.frames = 0
+        self.skipped = 0
+
+    async def wait(self):
+        """ Sleeps until the next slot; returns (target send time as time.time(), slots skipped before it) """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.start is None:
+            self.start, self.start_epoch = now, time.time()
+        deadline = self.start + self.slot * self.interval
+        skipped = 0
+        if now - deadline >= self.interval:
+            skipped = int((now - deadline) / self.interval)
+            deadline += skipped * self.interval
+            self.slot += skipped
+            self.skipped += skipped
+        if deadline > now:
+            await asyncio.sleep(deadline - now)
+        self.slot += 1
+        self.frames += 1
+        return self.start_epoch + (deadline - self.start), skipped
+
+
+def write_buffer_size(websocket):
+    """ Bytes send() handed to the transport that the OS hasn't taken yet (grows when the uplink is congested) """
+    transport = websocket.transport
+    return transport.get_write_buffer_size() if transport is not None else 0
+
+
+class Backpressure:
+    """ What the sender does with a new frame while the WebSocket write buffer holds more than `limit` bytes:
+
+      off      nothing, send() buffers it (old behaviour)
+      drop     skip the frame
+      degrade  send it at a lower quality
+      wait     wait until the buffer is at most `limit` again (up to `max_wait` seconds), then send it
+
+    The check runs before the frame is encoded, so a dropped frame costs no CPU.
+    """
+
+    def __init__(self, policy, limit, max_wait=1.0, poll_interval=0.002):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy!r}")
+        self.policy = policy
+        self.limit = limit
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.dropped = 0
+        self.degraded = 0
+        self.delayed = 0
+        self.wait_ms = 0.0
+
+    def congested(self, websocket):
+        return self.policy != "off" and write_buffer_size(websocket) > self.limit
+
+    async def admit(self, websocket):
+        """ Returns (action, send_wait_ms); action is "send", "drop" or "degrade" """
+        if not self.congested(websocket):
+            return "send", 0.0
+        if self.policy == "drop":
+            self.dropped += 1
+            return "drop", 0.0
+        if self.policy == "degrade":
+            self.degraded += 1
+            return "degrade", 0.0
+
+        start = time.perf_counter()
+        while self.congested(websocket) and time.perf_counter() - start < self.max_wait:
+            await asyncio.sleep(self.poll_interval)
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.delayed += 1
+        self.wait_ms += wait_ms
+        return "send", wait_ms
+
+    def stats(self):
+        return (f"{self.dropped} dropped, {self.degraded} degraded, {self.delayed} delayed "
+                f"({self.wait_ms / 1000:.1f} s waited)")
+
+
+class LoopMonitor:
+    """ Measures how long the event loop was blocked: the lateness of a short periodic sleep """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.max_block = 0.0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_block = max(self.max_block, time.perf_counter() - start - self.interval)
+
+    def take_max_ms(self):
+        """ Longest block since the previous call, in ms """
+        block, self.max_block = self.max_block, 0.0
+        return block * 1000
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
+class PipelineStage:
+    """ One stage of the receiver pipeline: `handler` runs on every item of a bounded queue, in its own
+    thread (start()) or in the caller's (run()), and what it returns (unless None) goes to the
+    `outputs` stages.
+
+    A full queue makes put() wait, so the upstream stage slows down and the wait is counted in
+    `blocked`; with `drop_oldest` the oldest item is replaced instead (counted in `dropped`), for a
+    stage such as the display that only needs the latest frame. The queue depth and the service time
+    per item show which stage is the bottleneck.
+    """
+
+    def __init__(self, name, handler, maxsize=8, outputs=(), drop_oldest=False):
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize)
+        self.outputs = list(outputs)
+        self.drop_oldest = drop_oldest
+        self.thread = None
+        self.started = None
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.busy = 0.0  # seconds spent in handler
+        self.blocked = 0.0  # seconds upstream waited for room in the queue
+        self.service_ms = collections.deque(maxlen=1000)
+        self.error = None
+
+    def put(self, item, block=True):
+        """ Queues `item`; returns False when the queue is full and `block` is off """
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if self.drop_oldest:
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+                    try:
+                        self.queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        continue
+            elif not block:
+                return False
+            else:
+                start = time.perf_counter()
+                self.queue.put(item)
+                self.blocked += time.perf_counter() - start
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def run(self):
+        """ Handles items until close(), then closes the outputs """
+        self.started = time.perf_counter()
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            if self.error is not None:
+                continue  # keep draining, so upstream never blocks on a dead stage
+            start = time.perf_counter()
+            try:
+                result = self.handler(item)
+            except Exception as e:
+                self.error = e
+                print(f"❌ Pipeline stage {self.name} failed:")
+                traceback.print_exc()
+                continue
+            elapsed = time.perf_counter() - start
+            self.busy += elapsed
+            self.service_ms.append(elapsed * 1000)
+            self.processed += 1
+            if result is not None:
+                for output in self.outputs:
+                    output.put(result)
+        for output in self.outputs:
+            output.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        """ No more items: the stage stops after the ones already queued """
+        self.queue.put(_STOP)
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def stats(self):
+        """ Queue depth, service time (mean / p95 of the last 1000 items) and busy fraction """
+        service = sorted(self.service_ms)
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0
+        text = (f"{self.name}: queue {self.queue.qsize()}/{self.queue.maxsize} (max {self.max_depth}), "
+                f"{self.processed} done")
+        if service:
+            text += f", service {sum(service) / len(service):.2f}/{service[int(len(service) * 0.95)]:.2f} ms (mean/p95)"
+        if elapsed:
+            text += f", busy {self.busy / elapsed:.0%}"
+        if self.blocked:
+            text += f", upstream blocked {self.blocked:.1f} s"
+        if self.dropped:
+            text += f", {self.dropped} dropped"
+        return text
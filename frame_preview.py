@@ -0,0 +1,49 @@
+import os
+import cv2
+
+# Display of the receivers, or none (--headless): without cv2.imshow / cv2.waitKey a receiver runs on
+# a server or in CI without a display (also with opencv-python-headless), and the GUI work stays out
+# of the measured path. Decoding, metrics and logging don't change. --preview_every N writes every
+# Nth frame as it would be shown (with overlay) as a JPEG to --preview_dir, to check a headless
+# run afterwards.
+
+
+class FramePreview:
+    def __init__(self, window, headless=False, every=0, directory="preview"):
+        self.window = window
+        self.headless = headless
+        self.every = every
+        self.directory = directory
+        self.frames = 0
+        self.saved = 0
+
+    def next(self):
+        """ Counts a new frame; True when it will be shown or saved, so the overlay is only drawn then """
+        self.frames += 1
+        return not self.headless or self.sampled()
+
+    def sampled(self):
+        return self.every > 0 and self.frames % self.every == 0
+
+    def save(self, image):
+        """ Writes the current frame when it is one of every `every` frames """
+        if not self.sampled():
+            return
+        if self.saved == 0:
+            os.makedirs(self.directory, exist_ok=True)
+        cv2.imwrite(os.path.join(self.directory, f"frame_{self.frames:06d}.jpg"), image)
+        self.saved += 1
+
+    def show(self, image):
+        """ save() + imshow unless headless; returns True when 'q' was pressed """
+        self.save(image)
+        if self.headless:
+            return False
+        cv2.imshow(self.window, image)
+        return cv2.waitKey(1) & 0xFF == ord('q')
+
+    def close(self):
+        if self.saved:
+            print(f"🖼️ {self.saved} preview frames saved in {self.directory}")
+        if not self.headless:
+            cv2.destroyAllWindows()
@@ -44,6 +44,68 @@ def generate_combined_graphs(csv_path):
     summary.to_csv(summary_file)
     print(f"📋 Saved summary CSV by filename: {summary_file}")
 
+    # Latency and peak memory per resolution and wire format (large 4K/8K frames, chunked or not)
+    if "peak_rss_mb" in df.columns:
+        summary = df.groupby(["resolution", "wire_format"]).agg(
+            frames=("frame_id", "count"),
+            size_kb_mean=("size_kb", "mean"),
+            latency_ms_mean=("latency_ms", "mean"),
+            latency_ms_p99=("latency_ms", lambda x: x.quantile(0.99)),
+            assembly_ms_mean=("assembly_ms", "mean"),
+            peak_rss_mb=("peak_rss_mb", "max"),
+        )
+        summary_file = csv_path.replace(".csv", "_summary_by_resolution.csv")
+        summary.to_csv(summary_file)
+        print(summary.round(2).to_string())
+        print(f"📋 Saved summary CSV by resolution: {summary_file}")
+
+    # Crypto cost per cipher suite (concatenate the stream_log.csv of several runs to compare suites)
+    if "cipher" in df.columns:
+        summary = df.groupby(["cipher", "resolution"]).agg(
+            frames=("frame_id", "count"),
+            size_kb_mean=("size_kb", "mean"),
+            encryption_time_ms_mean=("encryption_time_ms", "mean"),
+            decryption_time_ms_mean=("decryption_time_ms", "mean"),
+            receiver_cpu_percent_mean=("cpu_percent", "mean"),
+        )
+        summary_file = csv_path.replace(".csv", "_summary_by_cipher.csv")
+        summary.to_csv(summary_file)
+        print(summary.round(3).to_string())
+        print(f"📋 Saved summary CSV by cipher: {summary_file}")
+
+    # Encoder backend comparison (concatenate the stream_log.csv of runs with different --encoder)
+    if "encoder" in df.columns:
+        summary = df.groupby(["encoder"] + (["jpeg_settings"] if "jpeg_settings" in df.columns else [])
+                             + ["resolution", "jpeg_quality"]).agg(
+            frames=("frame_id", "count"),
+            size_kb_mean=("size_kb", "mean"),
+            compression_time_ms_mean=("compression_time_ms", "mean"),
+            latency_ms_mean=("latency_ms", "mean"),
+        )
+        summary_file = csv_path.replace(".csv", "_summary_by_encoder.csv")
+        summary.to_csv(summary_file)
+        print(f"📋 Saved summary CSV by encoder: {summary_file}")
+
+    # Size vs. encode time per JPEG setting (one point per quality): the lowest curve at a given size
+    # is the cheapest setting for that bitrate
+    if "jpeg_settings" in df.columns and df["jpeg_settings"].nunique() > 1:
+        plt.figure(figsize=(10, 6))
+        for (encoder, jpeg_settings), df_setting in df.groupby(["encoder", "jpeg_settings"]):
+            grouped = df_setting.groupby("jpeg_quality")[["size_kb", "compression_time_ms"]].mean()
+            plt.plot(grouped["size_kb"].to_numpy(dtype=float), grouped["compression_time_ms"].to_numpy(dtype=float),
+                     marker='o', label=f"{encoder} {jpeg_settings}")
+        plt.title(f"Compressed Size vs Encode Time per JPEG Setting (points = JPEG quality)\n{setup_description}")
+        plt.xlabel("Mean Compressed Size (KB)")
+        plt.ylabel("Mean Compression Time (ms)")
+        plt.grid(True)
+        plt.legend(title="Encoder / settings", fontsize=8)
+        plt.tight_layout()
+
+        output_file = csv_path.replace(".csv", "_size_vs_encode_time_by_jpeg_settings.png")
+        plt.savefig(output_file)
+        plt.close()
+        print(f"📈 Saved Size vs. Encode time per JPEG setting chart: {output_file}")
+
     # 4. Graph per filename (example: fps vs jpeg_quality)
     for metric in metrics:
         plt.figure(figsize=(12, 6))
@@ -115,6 +177,54 @@ def generate_combined_graphs(csv_path):
     plt.close()
     print(f"📈 Saved filtered Latency vs. Size chart: {output_file}")
 
+    # Latency split (uplink / relay / downlink) vs. Size, only when the relay added timestamps
+    split_metrics = ["uplink_ms", "relay_ms", "downlink_ms"]
+    if all(metric in df.columns for metric in split_metrics) and df[split_metrics].notna().all(axis=1).any():
+        df_filtered = df.dropna(subset=split_metrics)
+        df_filtered = df_filtered[df_filtered["size_kb"] >= 35].copy()
+        df_filtered["size_kb_rounded"] = df_filtered["size_kb"].round(0)
+        grouped = df_filtered.groupby("size_kb_rounded")[split_metrics].mean()
+
+        x = grouped.index.to_numpy(dtype=float)
+        plt.figure(figsize=(10, 6))
+        plt.stackplot(x, *[grouped[metric].to_numpy(dtype=float) for metric in split_metrics],
+                      labels=["Uplink (sender → relay)", "Relay residence", "Downlink (relay → receiver)"], alpha=0.7)
+        plt.title(f"Latency Split over Compressed Size (Rounded KB ≥ 35)\n{setup_description}")
+        plt.xlabel("Compressed Size (KB, rounded)")
+        plt.ylabel("Mean Latency (ms)")
+        plt.grid(True)
+        plt.legend(loc="upper left")
+        plt.tight_layout()
+
+        output_file = csv_path.replace(".csv", "_latency_split_over_size_filtered.png")
+        plt.savefig(output_file)
+        plt.close()
+        print(f"📈 Saved Latency split vs. Size chart: {output_file}")
+
+    # Bytes on the wire vs. Size per wire format (json = base64 + JSON, binary = struct header + raw ciphertext)
+    if "wire_bytes" in df.columns and df["wire_bytes"].notna().any():
+        df_filtered = df.dropna(subset=["wire_bytes"]).copy()
+        df_filtered["size_kb_rounded"] = df_filtered["size_kb"].round(0)
+        df_filtered["wire_kb"] = df_filtered["wire_bytes"] / 1024
+
+        plt.figure(figsize=(10, 6))
+        for wire_format, df_format in df_filtered.groupby("wire_format"):
+            grouped = df_format.groupby("size_kb_rounded")["wire_kb"].mean()
+            overhead = (grouped / grouped.index.to_numpy(dtype=float).clip(min=1) - 1) * 100
+            plt.plot(grouped.index.to_numpy(dtype=float), grouped.to_numpy(dtype=float), marker='o',
+                     label=f"{wire_format} (mean overhead {overhead.mean():.1f}%)")
+        plt.title(f"Bytes on the Wire over Compressed Size per Wire Format\n{setup_description}")
+        plt.xlabel("Compressed Size (KB, rounded)")
+        plt.ylabel("Wire Size (KB)")
+        plt.grid(True)
+        plt.legend()
+        plt.tight_layout()
+
+        output_file = csv_path.replace(".csv", "_wire_bytes_over_size.png")
+        plt.savefig(output_file)
+        plt.close()
+        print(f"📈 Saved Wire bytes vs. Size chart: {output_file}")
+
 
 
 
@@ -6,20 +6,28 @@ import time
 import cv2
 import numpy as np
 import base64
-import csv
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.backends import default_backend
 import argparse
+try:
+    import resource  # alleen op Unix; op Windows geen piekgeheugen
+except ImportError:
+    resource = None
 from datetime import datetime
 from datetime import timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import frame_format
+import frame_crypto
+import frame_pipeline
+import frame_preview
+import stream_logger
 
 
 no_message_timeout = 5
+relay_sync_timeout = 2
 
 # Set up argument parser
 parser = argparse.ArgumentParser(
@@ -33,6 +41,66 @@ parser.add_argument(
     help="WebSocket Signaling Server URL (default: ws://heliwi.duckdns.org:9000)"
 )
 
+parser.add_argument(
+    "--frame_deadline_ms",
+    type=float,
+    default=0,
+    help="Abandon a chunked frame that is still incomplete after this many ms since it was sent (default: 0 = never)"
+)
+
+parser.add_argument(
+    "--queue_size",
+    type=int,
+    default=8,
+    help="Bounded queue length between the receiver stages (default: 8)"
+)
+
+parser.add_argument(
+    "--decode_workers",
+    type=int,
+    default=0,
+    help="Decrypt and decode frames in a pool of N threads, results in frame order (default: 0 = in the decode stage itself)"
+)
+
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    help="No display (no cv2.imshow / cv2.waitKey): for servers and automated benchmarks; decoding, video and CSV stay the same"
+)
+
+parser.add_argument(
+    "--preview_every",
+    type=int,
+    default=0,
+    help="Save every Nth frame with overlay as JPEG in <testbench dir>/preview (default: 0 = none)"
+)
+
+parser.add_argument(
+    "--log_flush_rows",
+    type=int,
+    default=256,
+    help="Write the buffered log rows once this many are waiting (default: 256)"
+)
+
+parser.add_argument(
+    "--log_flush_s",
+    type=float,
+    default=1.0,
+    help="Write buffered log rows at the latest this many seconds after the first one; a crash loses at most this window (default: 1.0)"
+)
+
+parser.add_argument(
+    "--columnar",
+    choices=stream_logger.COLUMNAR_FORMATS,
+    help="Also log to stream_log.arrows (Arrow IPC stream) or stream_log.parquet, needs pyarrow"
+)
+
+parser.add_argument(
+    "--stats_interval",
+    type=float,
+    default=5,
+    help="Print queue depth and service time of every receiver stage every N seconds (default: 5, 0 = only at the end)"
+)
 
 args = parser.parse_args()
 
@@ -49,27 +117,35 @@ AES_KEY = b'C\x03\xb6\xd2\xc5\t.Brp\x1ce\x0e\xa4\xf6\x8b\xd2\xf6\xb0\x8a\x9c\xd5
 
 video_writer = None
 current_resolution = None
-
-# CSV-bestand voorbereiden
+preview = frame_preview.FramePreview("Live Stream met Overlay", args.headless, args.preview_every, f"{outputPath}/preview")
+
+# CSV-bestand voorbereiden: kolommen met hun type voor --columnar
+LOG_COLUMNS = [
+    ("setup description", "str"), ("timestamp_receiver", "str"), ("timestamp_server", "str"), ("filename", "str"),
+    ("frame_id", "int"), ("resolution", "str"), ("jpeg_quality", "int"), ("size_kb", "float"),
+    ("compression_time_ms", "float"), ("encryption_time_ms", "float"), ("fps", "int"), ("Mbits", "float"),
+    ("latency_ms", "float"), ("uplink_ms", "float"), ("relay_ms", "float"), ("downlink_ms", "float"),
+    ("wire_format", "str"), ("wire_bytes", "int"), ("chunks", "int"), ("assembly_ms", "float"),
+    ("peak_rss_mb", "float"), ("cipher", "str"), ("decryption_time_ms", "float"), ("cpu_percent", "float"),
+    ("loop_block_ms", "float"), ("encoder", "str"), ("jpeg_settings", "str"), ("send_lag_ms", "float"),
+    ("skipped_frames", "int"), ("dropped_frames", "int"), ("send_wait_ms", "float"), ("degraded", "bool"),
+    ("receiver_ms", "float"), ("decode_queue", "int"), ("decode_ms", "float"),
+]
 timestamp_label = datetime.now().strftime("%Y%m%d_%H%M%S")
 csv_filename = f"{outputPath}/stream_log.csv"
-with open(csv_filename, mode='w', newline='') as file:
-    writer = csv.writer(file)
-    writer.writerow(["setup description","timestamp_receiver","timestamp_server", "filename","frame_id", "resolution", "jpeg_quality", "size_kb", "compression_time_ms", "encryption_time_ms", "fps","Mbits","latency_ms"])
-
-def decrypt_data(encrypted_base64):
-    encrypted_data = base64.b64decode(encrypted_base64)
-    iv = encrypted_data[:16]
-    encrypted_bytes = encrypted_data[16:]
+try:
+    stream_log = stream_logger.StreamLogger(csv_filename, LOG_COLUMNS, args.log_flush_rows, args.log_flush_s,
+                                            args.columnar)
+except ImportError as e:
+    parser.error(str(e))
 
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-    decrypted_padded = decryptor.update(encrypted_bytes) + decryptor.finalize()
 
-    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-    decrypted_bytes = unpadder.update(decrypted_padded) + unpadder.finalize()
+frame_ciphers = {}  # suite -> frame_crypto.FrameCipher, key setup één keer per suite
 
-    return decrypted_bytes
+def cipher_for(suite):
+    if suite not in frame_ciphers:
+        frame_ciphers[suite] = frame_crypto.FrameCipher(suite, AES_KEY)
+    return frame_ciphers[suite]
 
 def init_video_writer(resolution):
     global video_writer
@@ -105,109 +181,391 @@ async def time_sync(websocket):
     return delay
 
 
-async def receive_messages():
-    global current_resolution, video_writer
-
-    frameCounter = 0
-
-    async with websockets.connect(SIGNALING_SERVER) as websocket:
-        print(f"✅ Verbonden met Signaling Server: {SIGNALING_SERVER}")
-        frameCounter+=1
-        message_count = 0
-        last_time = time.time()
-        fps_display = 0
+async def relay_time_sync(websocket):
+    """ Klokafwijking relay - ontvanger in ms (NTP-stijl), None als de relay geen RelayTimeSync kent """
+    request_tx = time.time()
+    await websocket.send(json.dumps({
+        "type": "RelayTimeSync",
+        "requestTxTime": request_tx
+    }))
 
-        offset_ms = await time_sync(websocket)
-        print (f"Estimated offset timesync is: {offset_ms} ms")
+    try:
+        response = await asyncio.wait_for(websocket.recv(), timeout=relay_sync_timeout)
+    except asyncio.TimeoutError:
+        return None
+    response_rx = time.time()
+    response_data = json.loads(response)
+    if response_data.get("type") != "RelayTimeSyncResponse":
+        return None
+
+    return (response_data["relayTime"] - (request_tx + response_rx) / 2) * 1000
+
+
+
+
+# Ontvangst-pipeline: vier stages met begrensde queues (--queue_size, frame_pipeline.PipelineStage),
+# zodat een trage stage (VideoWriter, CSV, imshow) de gemeten FPS niet meer omlaag trekt:
+#   intake   eigen thread met asyncio: websocket.recv() + aankomsttijd; wacht als de decode-queue vol is
+#   decode   parsen, sessies, chunks samenvoegen, decrypteren, imdecode, resize en de metrics per frame
+#            met --decode_workers N: decode parst en zet decrypteren + imdecode + resize
+#            (frame_pipeline.decrypt_and_decode) in een pool van N threads; de stage "reorder" wacht
+#            de resultaten af in aankomstvolgorde, dus in frame_id-volgorde (één WebSocket, in volgorde verstuurd)
+#   record   overlay, VideoWriter.write en CSV voor elk frame (een volle queue laat decode wachten)
+#   present  main thread (HighGUI): overlay + imshow van het nieuwste frame, oudere worden overgeslagen
+# Latency, FPS en assembly_ms gaan uit van de aankomsttijd bij intake, niet van het moment waarop het
+# frame klaar is; receiver_ms is de tijd van aankomst tot gedecodeerd frame (incl. wachten in de queue).
+class FrameDecoder:
+    """ Decode stage: one message (message, arrival time, decode queue depth) -> frame record or None.
+
+    parse() is the sequential part (sessions, chunk reassembly); the decode job can run in a thread
+    pool (`workers`) as long as finish() gets the frames in order.
+    """
+
+    def __init__(self, workers=0):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="decode") if workers > 0 else None
+        self.offset_ms = 0
+        self.relay_offset_ms = None
+        self.sessions = {}  # session id -> session header (setup, filename, resolution), zie frame_format.py
+        self.frames_without_session = 0
+        self.assembling = None  # chunked frame dat nog binnenkomt
+        self.assembly_start = 0
+        self.abandoned_frames = 0
+        self.message_count = 0
+        self.last_time = time.time()
+        self.last_cpu_time = time.process_time()
+        self.cpu_percent = 0
+        self.fps_display = 0
+
+    def parse(self, item):
+        """ Returns (frame fields, decode job arguments) or None when the message yields no frame (yet) """
+        message, arrival, decode_queue = item
+
+        # Chunked of binaire frames (sender --wire_format binary) of JSON met base64-data
+        if frame_format.is_chunk(message):
+            wire_format = "chunked"
+            message_json = frame_format.unpack_chunk(message)
+        elif frame_format.is_binary_frame(message):
+            wire_format = "binary"
+            message_json = frame_format.unpack_frame(message)
+        else:
+            wire_format = "json"
+            message_json = json.loads(message)
+            if message_json.get("type") == frame_format.SESSION_TYPE:
+                self.sessions[message_json["session"]] = frame_format.read_session(message_json)
+                return None
+
+        session = self.sessions.get(message_json.get("session"))
+        if session is None:
+            # Frame van een sessie waarvan de header (nog) niet binnen is: wacht op de volgende refresh
+            if message_json.get("chunk_index", 0) == 0:
+                self.frames_without_session += 1
+            return None
+
+        pending = {"session": session, "wire_format": wire_format, "arrival": arrival, "decode_queue": decode_queue,
+                   "chunks": 1, "assembly_ms": ""}
+        if wire_format == "chunked":
+            # Elke chunk wordt meteen gedecrypteerd, het frame wordt pas verwerkt bij de laatste chunk
+            if message_json["chunk_index"] == 0:
+                if self.assembling is not None:
+                    self.abandoned_frames += 1  # vorig frame nooit afgemaakt (deadline bij de sender of gedropt)
+                self.assembling = frame_format.ChunkedFrame(message_json, cipher_for(session["cipher"]).stream_decryptor(
+                    message_json["payload_len"], frame_format.frame_associated_data(message_json)
+                ))
+                self.assembly_start = arrival
+            elif self.assembling is None or self.assembling.frame["frame_id"] != message_json["frame_id"]:
+                return None  # rest van een frame dat al opgegeven is
+
+            frame_age_ms = (arrival - message_json["sent_at"]) * 1000 - self.offset_ms
+            if args.frame_deadline_ms and frame_age_ms > args.frame_deadline_ms:
+                self.abandoned_frames += 1
+                self.assembling = None
+                return None
 
-        while True:
             try:
-                message = await asyncio.wait_for(websocket.recv(), timeout=no_message_timeout)
-            except asyncio.TimeoutError:
-                print("⏳ No data received after (timeout). Sluit af.")
-                break
-
-            message_json = json.loads(message)
-            decrypted_data = decrypt_data(message_json["data"])
-            np_arr = np.frombuffer(decrypted_data, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-            if frame is None:
-                continue
-
-
-            received_dt = datetime.now()
-            timestampCsv = received_dt.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]            
-
-            #if message_json['frame_id'] % 500 == 0:
-            #    print (f"frame {message_json['frame_id']} : {timestampCsv}")
-            
-
-            width, height = map(int, message_json["resolution"].split("x"))
-            if current_resolution != (width, height):
-                current_resolution = (width, height)
-                init_video_writer(current_resolution)
-
-            frame = cv2.resize(frame, (width, height))
-
-            message_count += 1
-            current_time = time.time()
-            elapsed_time = current_time - last_time
-            if elapsed_time >= 1.0:
-                fps_display = message_count
-                message_count = 0
-                last_time = current_time
-
-            MbitsPerSecond = round((message_json['size_kb'] * 8 * fps_display) / 1000, 4)
-
-            sent_time = datetime.fromisoformat(message_json["timestamp"]) 
-            sent_time += timedelta(milliseconds=offset_ms)
-
-            frame_delay_ms = (received_dt - sent_time).total_seconds() * 1000
-
-            overlay = frame.copy()
-            cv2.putText(overlay, f"{message_json['setup_description']}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(overlay, f"Time: {message_json['timestamp']}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(overlay, f"Resolution: {message_json['resolution']}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            cv2.putText(overlay, f"Size/Mbits: {message_json['size_kb']} KB - {MbitsPerSecond:.2f} Mb/s", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(overlay, f"Comp. Time: {message_json['compression_time_ms']} ms", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(overlay, f"Encryption: {message_json['encryption_time_ms']} ms", (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(overlay, f"JPEG Quality: {message_json['jpeg_quality']}%", (10, 210), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(overlay, f"Receiver FPS: {fps_display} - frame: {message_json['frame_id']} ", (10, 240), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            cv2.putText(overlay, f"Frame delay: {frame_delay_ms:.3f} ms ", (10, 270), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-
-
-            if video_writer:
-                video_writer.write(overlay)
-
-            # ⬇️ CSV logging
-            with open(csv_filename, mode='a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    message_json["setup_description"],
-                    message_json["timestamp"],
-                    timestampCsv,
-                    message_json.get("filename", ""),
-                    message_json["frame_id"],
-                    message_json["resolution"],
-                    message_json["jpeg_quality"],
-                    message_json["size_kb"],
-                    message_json["compression_time_ms"],
-                    message_json["encryption_time_ms"],
-                    fps_display,
-                    MbitsPerSecond,
-                    np.round(frame_delay_ms,3),
-
-                ])
-
-            cv2.imshow("Live Stream met Overlay", overlay)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+                if not self.assembling.add(message_json, frame_format.wire_bytes(message)):
+                    return None
+                decrypted_data = self.assembling.plaintext()
+            except ValueError as e:
+                print(f"⚠️ Chunked frame {message_json['frame_id']} dropped: {e}")
+                self.abandoned_frames += 1
+                self.assembling = None
+                return None
+
+            pending.update(frame_json=self.assembling.frame, wire_bytes=self.assembling.wire_bytes,
+                           chunks=self.assembling.frame["chunk_count"],
+                           assembly_ms=np.round((arrival - self.assembly_start) * 1000, 3),
+                           decryption_time_ms=self.assembling.decryption_time_ms)
+            self.assembling = None
+            return pending, (None, decrypted_data, b"", session["size"])
+
+        if wire_format == "binary":
+            encrypted_data = message_json["data"]
+        else:
+            encrypted_data = base64.b64decode(message_json["data"])
+        pending.update(frame_json=message_json, wire_bytes=frame_format.wire_bytes(message))
+        return pending, (cipher_for(session["cipher"]), encrypted_data,
+                         frame_format.frame_associated_data(message_json), session["size"])
+
+    def finish(self, pending, result):
+        """ Frame record from the parse() fields and the decode job; `result` returns the job's result """
+        message_json, arrival = pending["frame_json"], pending["arrival"]
+        try:
+            frame, decryption_time_ms, decode_ms = result()
+        except frame_crypto.DecryptionError as e:
+            print(f"⚠️ Frame {message_json['frame_id']} rejected: {e}")
+            return None
+        if frame is None:
+            return None
+
+        self.message_count += 1
+        elapsed_time = arrival - self.last_time
+        if elapsed_time >= 1.0:
+            self.fps_display = self.message_count
+            self.message_count = 0
+            self.cpu_percent = round((time.process_time() - self.last_cpu_time) / elapsed_time * 100, 1)
+            self.last_cpu_time = time.process_time()
+            self.last_time = arrival
+
+        received_dt = datetime.fromtimestamp(arrival)
+        sent_time = datetime.fromtimestamp(message_json["sent_at"])
+        sent_time += timedelta(milliseconds=self.offset_ms)
+        frame_delay_ms = (received_dt - sent_time).total_seconds() * 1000
+
+        # Split in uplink / relay / downlink als de relay tijdstempels toevoegt (signalingServer.py --stamp)
+        uplink_ms = relay_ms = downlink_ms = ""
+        if self.relay_offset_ms is not None and "relay_ingress" in message_json and "relay_egress" in message_json:
+            relay_ms = (message_json["relay_egress"] - message_json["relay_ingress"]) * 1000
+            downlink_ms = (arrival - message_json["relay_egress"]) * 1000 + self.relay_offset_ms
+            uplink_ms = frame_delay_ms - relay_ms - downlink_ms
+            relay_ms, downlink_ms, uplink_ms = np.round(relay_ms, 3), np.round(downlink_ms, 3), np.round(uplink_ms, 3)
+
+        return {
+            **pending,
+            "frame": frame,
+            "received_dt": received_dt,
+            "fps_display": self.fps_display,
+            "cpu_percent": self.cpu_percent,
+            "Mbits": round((message_json['size_kb'] * 8 * self.fps_display) / 1000, 4),
+            "frame_delay_ms": frame_delay_ms,
+            "uplink_ms": uplink_ms,
+            "relay_ms": relay_ms,
+            "downlink_ms": downlink_ms,
+            "decryption_time_ms": pending.get("decryption_time_ms", decryption_time_ms),
+            "decode_ms": np.round(decode_ms, 3),
+            "receiver_ms": np.round((time.time() - arrival) * 1000, 3),
+        }
+
+    def decode(self, item):
+        """ Parse + decode in the calling stage """
+        parsed = self.parse(item)
+        if parsed is None:
+            return None
+        pending, job = parsed
+        return self.finish(pending, lambda: frame_pipeline.decrypt_and_decode(*job))
+
+    def submit(self, item):
+        """ Parse and hand the decode job to the pool; collect() finishes it """
+        parsed = self.parse(item)
+        if parsed is None:
+            return None
+        pending, job = parsed
+        return pending, self.pool.submit(frame_pipeline.decrypt_and_decode, *job)
+
+    def collect(self, submitted):
+        pending, future = submitted
+        return self.finish(pending, future.result)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+
+def draw_overlay(record):
+    session, message_json = record["session"], record["frame_json"]
+    timestampSender = frame_format.format_timestamp(message_json["sent_at"])
+    overlay = record["frame"].copy()
+    cv2.putText(overlay, f"{session['setup_description']}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    cv2.putText(overlay, f"Time: {timestampSender}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    cv2.putText(overlay, f"Resolution: {session['resolution']}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    cv2.putText(overlay, f"Size/Mbits: {message_json['size_kb']} KB - {record['Mbits']:.2f} Mb/s", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    cv2.putText(overlay, f"Comp. Time: {message_json['compression_time_ms']} ms", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    cv2.putText(overlay, f"Encryption: {message_json['encryption_time_ms']} ms ({session['cipher']})", (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    cv2.putText(overlay, f"JPEG Quality: {message_json['jpeg_quality']}%", (10, 210), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    cv2.putText(overlay, f"Receiver FPS: {record['fps_display']} - frame: {message_json['frame_id']} ", (10, 240), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    cv2.putText(overlay, f"Frame delay: {record['frame_delay_ms']:.3f} ms ", (10, 270), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    return overlay
+
+
+def record_frame(record):
+    """ Record stage: video + CSV row for every frame """
+    global current_resolution
+    session, message_json = record["session"], record["frame_json"]
+
+    if current_resolution != session["size"]:
+        current_resolution = session["size"]
+        init_video_writer(current_resolution)
+
+    preview.next()
+    if video_writer or preview.sampled():
+        overlay = draw_overlay(record)
+        if video_writer:
+            video_writer.write(overlay)
+        preview.save(overlay)
+
+    # ⬇️ CSV logging (gebufferd, stream_logger.py schrijft in de achtergrond)
+    stream_log.write([
+        session["setup_description"],
+        frame_format.format_timestamp(message_json["sent_at"]),
+        record["received_dt"].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+        session["filename"],
+        message_json["frame_id"],
+        session["resolution"],
+        message_json["jpeg_quality"],
+        message_json["size_kb"],
+        message_json["compression_time_ms"],
+        message_json["encryption_time_ms"],
+        record["fps_display"],
+        record["Mbits"],
+        np.round(record["frame_delay_ms"], 3),
+        record["uplink_ms"],
+        record["relay_ms"],
+        record["downlink_ms"],
+        record["wire_format"],
+        record["wire_bytes"],
+        record["chunks"],
+        record["assembly_ms"],
+        round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else "",
+        session["cipher"],
+        np.round(record["decryption_time_ms"], 5),
+        record["cpu_percent"],
+        message_json.get("loop_block_ms", ""),
+        session["encoder"],
+        session["jpeg_settings"],
+        message_json.get("send_lag_ms", ""),
+        message_json.get("skipped_frames", ""),
+        message_json.get("dropped_frames", ""),
+        message_json.get("send_wait_ms", ""),
+        message_json.get("degraded", ""),
+        record["receiver_ms"],
+        record["decode_queue"],
+        record["decode_ms"],
+    ])
+
+
+def present_frame(record, stop):
+    """ Present stage: overlay + imshow; 'q' stops the receiver """
+    if stop.is_set():
+        return
+    cv2.imshow(preview.window, draw_overlay(record))
+    if cv2.waitKey(1) & 0xFF == ord('q'):
+        stop.set()
+
+
+def print_stage_stats(stages):
+    print("🧵 Receiver stages:")
+    for stage in stages:
+        print(f"   {stage.stats()}")
+
+
+async def report_stages(stages):
+    while True:
+        await asyncio.sleep(args.stats_interval)
+        print_stage_stats(stages)
+
+
+async def receive_messages(decoder, decode, stages, stop):
+    """ Intake stage: receives messages and hands them to the decode stage with their arrival time """
+    loop = asyncio.get_running_loop()
+    reporter = None
+    try:
+        async with websockets.connect(SIGNALING_SERVER, max_size=None) as websocket:
+            print(f"✅ Verbonden met Signaling Server: {SIGNALING_SERVER}")
+
+            decoder.relay_offset_ms = await relay_time_sync(websocket)
+            if decoder.relay_offset_ms is None:
+                print("ℹ️ Relay does not answer RelayTimeSync: no uplink/relay/downlink split")
+            else:
+                print(f"Estimated relay clock offset: {decoder.relay_offset_ms:.3f} ms")
+
+            decoder.offset_ms = await time_sync(websocket)
+            print (f"Estimated offset timesync is: {decoder.offset_ms} ms")
+
+            if args.stats_interval > 0:
+                reporter = loop.create_task(report_stages(stages))
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), timeout=no_message_timeout)
+                except asyncio.TimeoutError:
+                    print("⏳ No data received after (timeout). Sluit af.")
+                    break
+
+                item = (message, time.time(), decode.queue.qsize())
+                if not decode.put(item, block=False):
+                    # Decode loopt achter: wachten buiten de event loop, zodat pings beantwoord blijven
+                    await loop.run_in_executor(None, decode.put, item)
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        decode.close()
+
+
+def main():
+    stop = threading.Event()
+    decoder = FrameDecoder(args.decode_workers)
+    record = frame_pipeline.PipelineStage("record", record_frame, args.queue_size)
+    present = None
+    sinks = (record,)
+    if not args.headless:
+        present = frame_pipeline.PipelineStage("present", lambda record: present_frame(record, stop), maxsize=1,
+                                               drop_oldest=True)
+        sinks = (record, present)
+    if decoder.pool is None:
+        decode = frame_pipeline.PipelineStage("decode", decoder.decode, args.queue_size, outputs=sinks)
+        stages = (decode,) + sinks
+    else:
+        # Eén frame per worker onderweg plus een queue: de reorder-queue begrenst wat in de pool zit
+        reorder = frame_pipeline.PipelineStage("reorder", decoder.collect, args.queue_size + args.decode_workers,
+                                               outputs=sinks)
+        decode = frame_pipeline.PipelineStage("decode", decoder.submit, args.queue_size, outputs=(reorder,))
+        stages = (decode, reorder) + sinks
+    threaded = [stage for stage in stages if stage is not present]
+    for stage in threaded:
+        stage.start()
+
+    intake_errors = []
+
+    def run_intake():
+        try:
+            asyncio.run(receive_messages(decoder, decode, stages, stop))
+        except BaseException as e:
+            intake_errors.append(e)
+
+    intake = threading.Thread(target=run_intake, name="intake", daemon=True)
+    intake.start()
+    if present is not None:
+        present.run()  # HighGUI in de main thread
+    intake.join()
+    for stage in threaded:
+        stage.join()
+    decoder.close()
+
+    if decoder.frames_without_session:
+        print(f"ℹ️ {decoder.frames_without_session} frames skipped before their session header arrived")
+    if decoder.abandoned_frames:
+        print(f"ℹ️ {decoder.abandoned_frames} chunked frames abandoned (deadline passed or incomplete)")
+    print_stage_stats(stages)
+    stream_log.close()
+    print(f"📋 Log: {stream_log.stats()}")
+    if resource is not None:
+        print(f"Peak memory (RSS): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
 
     if video_writer:
         video_writer.release()
-    cv2.destroyAllWindows()
+    preview.close()
+
+    for error in intake_errors + [stage.error for stage in stages if stage.error is not None]:
+        raise error
 
     # 📊 Genereer visualisatie
 # Start
-asyncio.run(receive_messages())
+main()
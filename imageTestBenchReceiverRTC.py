@@ -6,6 +6,7 @@ import argparse
 import json
 from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
 from av import VideoFrame
+import frame_preview
 from websocket_signaling import WebSocketSignaling
 
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +18,23 @@ parser.add_argument(
     default="ws://34.46.183.47:9000",
     help="WebSocket Signaling Server URL (default: ws://34.46.183.47:9000)"
 )
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    help="No display (no cv2.imshow / cv2.waitKey), for servers and automated benchmarks"
+)
+parser.add_argument(
+    "--preview_every",
+    type=int,
+    default=0,
+    help="Save every Nth frame with overlay as JPEG in --preview_dir (default: 0 = none)"
+)
+parser.add_argument(
+    "--preview_dir",
+    type=str,
+    default="preview",
+    help="Folder for --preview_every (default: preview)"
+)
 args = parser.parse_args()
 SIGNALING_SERVER = args.signaling_server
 
@@ -46,6 +64,7 @@ class VideoReceiver:
         self.fps_display = 0
         self.message_count = 0
         self.last_time = asyncio.get_event_loop().time()
+        self.preview = frame_preview.FramePreview("WebRTC Video Stream", args.headless, args.preview_every, args.preview_dir)
         self.latest_metadata = {}
 
     def handle_metadata(self, json_str):
@@ -68,6 +87,9 @@ class VideoReceiver:
             self.message_count = 0
             self.last_time = current_time
 
+        if not self.preview.next():
+            return  # headless en geen preview-frame: geen overlay nodig
+
         metadata = self.latest_metadata
         overlay_lines = [
             f"FPS: {self.fps_display}",
@@ -84,8 +106,7 @@ class VideoReceiver:
             cv2.putText(image, line, (10, 30 + i*30),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
 
-        cv2.imshow("WebRTC Video Stream", image)
-        cv2.waitKey(1)
+        self.preview.show(image)
 
 async def wait_for_ice(pc):
     for _ in range(10):
@@ -169,7 +190,7 @@ async def run():
         logging.info("🛑 WebRTC verbinding sluiten...")
         await pc.close()
         await signaling.close()
-        cv2.destroyAllWindows()
+        receiver.preview.close()
         logging.info("✅ WebRTC gestopt en venster gesloten.")
 
 if __name__ == "__main__":
@@ -177,4 +198,5 @@ if __name__ == "__main__":
         asyncio.run(run())
     except KeyboardInterrupt:
         logging.info("🛑 Handmatige onderbreking. Programma wordt afgesloten.")
-        cv2.destroyAllWindows()
\ No newline at end of file
+        if not args.headless:
+            cv2.destroyAllWindows()
\ No newline at end of file
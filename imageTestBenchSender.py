@@ -4,15 +4,19 @@ import json
 import websockets
 import time
 import cv2
-import base64
-import io
 import os
-from PIL import Image
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.backends import default_backend
 import argparse
+try:
+    import resource  # alleen op Unix; op Windows geen piekgeheugen
+except ImportError:
+    resource = None
+import statistics
 from datetime import datetime
+import frame_format
+import frame_crypto
+import frame_pipeline
+import frame_encoders
+from frame_cache import FrameCache
 
 # Set up argument parser
 parser = argparse.ArgumentParser(
@@ -33,12 +37,126 @@ parser.add_argument(
     help="Description of the test setup (default: 'Local Wifi 5G')"
 )
 
+parser.add_argument(
+    "--wire_format",
+    type=str,
+    choices=frame_format.WIRE_FORMATS,
+    default="json",
+    help="json: base64 ciphertext in a JSON text message; binary: struct header + raw IV/ciphertext (default: json)"
+)
+
+parser.add_argument(
+    "--chunk_kb",
+    type=int,
+    default=0,
+    help="Split every frame into binary chunks of this many KB (binary wire format only, default: 0 = one message per frame)"
+)
+
+parser.add_argument(
+    "--frame_deadline_ms",
+    type=float,
+    default=0,
+    help="Stop sending the remaining chunks of a frame once it is older than this (default: 0 = never)"
+)
+
+parser.add_argument(
+    "--cipher",
+    type=str,
+    choices=frame_crypto.CIPHER_SUITES,
+    default="aes-cbc",
+    help="Crypto suite for the frames; the AEAD suites authenticate the frame header (default: aes-cbc)"
+)
+
+parser.add_argument(
+    "--executor",
+    type=str,
+    choices=frame_pipeline.EXECUTOR_MODES,
+    default="none",
+    help="Where JPEG encoding and encryption run: none (inside the event loop), thread or process pool (default: none)"
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=2,
+    help="Thread/process pool size for --executor, also the number of frames in flight (default: 2)"
+)
+
+parser.add_argument(
+    "--encoder",
+    type=str,
+    choices=list(frame_encoders.ENCODERS),
+    default="pil",
+    help="Image encoder backend: pil, opencv, turbojpeg (needs PyTurboJPEG) or webp (default: pil)"
+)
+
+parser.add_argument(
+    "--jpeg_settings",
+    type=str,
+    default="default",
+    help="Comma separated JPEG encoder settings to sweep next to the qualities, each a '+' combination of "
+         "444/422/420 (chroma subsampling), opt (optimized Huffman), prog (progressive) and rstN (restart "
+         "marker every N MCU blocks), e.g. default,444,420+opt,420+prog,420+rst16 (default: default)"
+)
+
+parser.add_argument(
+    "--frame_cache",
+    type=str,
+    choices=["off", "memory", "disk"],
+    default="off",
+    help="Transport-only mode: JPEG-encode every (image, resolution, quality) once before streaming and "
+         "stream from memory, or also keep the encoded frames on disk for the next run; frames are still "
+         "encrypted one by one (default: off)"
+)
+
+parser.add_argument(
+    "--cache_mb",
+    type=int,
+    default=512,
+    help="Size limit of the frame cache in MB, in memory and on disk (default: 512)"
+)
+
+parser.add_argument(
+    "--cache_dir",
+    type=str,
+    default="frame_cache",
+    help="Directory for --frame_cache disk (default: frame_cache)"
+)
+
+parser.add_argument(
+    "--backpressure",
+    type=str,
+    choices=frame_pipeline.BACKPRESSURE_POLICIES,
+    default="off",
+    help="What to do with a new frame while the WebSocket write buffer is above --send_buffer_kb: off (buffer "
+         "it anyway), drop it, degrade (send it at half the JPEG quality) or wait for the buffer to drain (default: off)"
+)
+
+parser.add_argument(
+    "--send_buffer_kb",
+    type=int,
+    default=64,
+    help="Write buffer level in KB above which --backpressure applies (default: 64)"
+)
+
 args = parser.parse_args()
+try:
+    encoder = frame_encoders.create_encoder(args.encoder)  # voor prepare() en de frame cache
+except ImportError as e:
+    parser.error(str(e))
+JPEG_SETTINGS = [setting.strip() for setting in args.jpeg_settings.split(",")]
+for jpeg_settings in JPEG_SETTINGS:
+    try:
+        encoder.options(jpeg_settings)
+    except ValueError as e:
+        parser.error(str(e))
+if args.chunk_kb and args.wire_format != "binary":
+    parser.error("--chunk_kb requires --wire_format binary")
 
 SIGNALING_SERVER = args.signaling_server
 setupDescription = f"{args.description} - {SIGNALING_SERVER}"
 
-print(f"Started: {setupDescription}")
+print(f"Started: {setupDescription} (wire format: {args.wire_format}, cipher: {args.cipher}, executor: {args.executor}, encoder: {args.encoder})")
 
 # AES-256 key (32 bytes)
 # Don't forget to change this key for real situations!!!
@@ -51,29 +169,108 @@ JPEG_QUALITIES = [20,25,30,35,40,45,50,55,60,65,70,75,80,85,90]
 SECONDS_PER_QUALITY = 5
 FPS = 40
 FRAMES_PER_QUALITY = SECONDS_PER_QUALITY * FPS
-FRAME_INTERVAL = 1 / FPS
+SESSION_REFRESH_SECONDS = 1  # session header opnieuw sturen voor ontvangers die later instappen of hem misten
+
+# Transport-only mode: gecodeerde frames uit de cache, zodat de JPEG-encoder de netwerkmeting niet beïnvloedt
+frame_cache = None
+if args.frame_cache != "off":
+    frame_cache = FrameCache(args.cache_mb * 1024 * 1024, args.cache_dir if args.frame_cache == "disk" else None)
 
-def encrypt_data(plain_bytes):
-    encrypt_start_time = time.time()
+def list_images():
+    return sorted([
+        f for f in os.listdir(IMAGE_FOLDER)
+        if f.lower().endswith((".jpg", ".jpeg", ".png"))
+    ])
 
-    iv = os.urandom(16)
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
+def degraded_quality(quality):
+    """ Quality for --backpressure degrade """
+    return max(10, quality // 2)
 
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded = padder.update(plain_bytes) + padder.finalize()
+def cache_key(image_file, width, height, quality, jpeg_settings):
+    """ Key per (image, resolution, quality, encoder, settings); the mtime makes a changed test image a new entry """
+    mtime = int(os.path.getmtime(os.path.join(IMAGE_FOLDER, image_file)))
+    return f"{os.path.splitext(image_file)[0]}_{width}x{height}_q{quality}_{args.encoder}_{jpeg_settings}_{mtime}"
 
-    encrypted = encryptor.update(padded) + encryptor.finalize()
-    encryption_time = (time.time() - encrypt_start_time) * 1000
+def pre_encode(image_files):
+    """ Vult de frame cache vóór het streamen (op disk gecachete frames worden alleen ingelezen) """
+    start = time.time()
+    for image_file in image_files:
+        frame = cv2.imread(os.path.join(IMAGE_FOLDER, image_file))
+        if frame is None:
+            continue
+        height, width = frame.shape[:2]
+        image = encoder.prepare(frame)
+        for jpeg_settings in JPEG_SETTINGS:
+            qualities = set(JPEG_QUALITIES)
+            if args.backpressure == "degrade":
+                qualities.update(degraded_quality(quality) for quality in JPEG_QUALITIES)
+            for quality in sorted(qualities):
+                frame_cache.get_or_encode(cache_key(image_file, width, height, quality, jpeg_settings),
+                                          lambda: frame_pipeline.encode_image(encoder, image, quality, jpeg_settings)[0])
+    print(f"🗃️ Frame cache filled in {time.time() - start:.1f} s: {frame_cache.stats()}")
 
-    return base64.b64encode(iv + encrypted).decode("utf-8"), encryption_time
+async def send_frame(websocket, meta, result, loop_block_ms, send_lags):
+    """ Verstuurt één gecodeerd frame; False als de rest van een chunked frame na de deadline is opgegeven """
+    (session_id, frame_id, sent_at, quality), target_at, pacing = meta
+    jpeg_bytes, compress_time, encrypted_data, encryption_time = result
+    # Hoe laat het frame echt de deur uitgaat t.o.v. zijn deadline van de FramePacer
+    send_lag_ms = (time.time() - target_at) * 1000
+    send_lags.append(send_lag_ms)
+
+    if args.chunk_kb:
+        for chunk in frame_format.split_frame(
+            session_id, frame_id, sent_at, quality, jpeg_bytes,
+            compress_time, encryption_time, encrypted_data, args.chunk_kb * 1024, loop_block_ms,
+            send_lag_ms, **pacing
+        ):
+            if args.frame_deadline_ms and (time.time() - sent_at) * 1000 > args.frame_deadline_ms:
+                return False  # de ontvanger gooit het onvolledige frame weg
+            await websocket.send(chunk)
+    elif args.wire_format == "binary":
+        await websocket.send(frame_format.pack_frame(
+            session_id, frame_id, sent_at, quality, jpeg_bytes,
+            compress_time, encryption_time, encrypted_data, loop_block_ms, send_lag_ms, **pacing
+        ))
+    else:
+        # Message to send (only per-frame fields, the rest is in the session header)
+        message = {
+            "session": session_id,
+            "frame_id": frame_id,
+            "sent_at": sent_at,
+            "jpeg_quality": quality,
+            "jpeg_bytes": jpeg_bytes,
+            "size_kb": round(jpeg_bytes / 1024, 2),
+            "compression_time_ms": round(compress_time, 5),
+            "encryption_time_ms": round(encryption_time, 5),
+            "loop_block_ms": round(loop_block_ms, 3),
+            "send_lag_ms": round(send_lag_ms, 3),
+            "skipped_frames": pacing["skipped_frames"],
+            "dropped_frames": pacing["dropped_frames"],
+            "send_wait_ms": round(pacing["send_wait_ms"], 3),
+            "degraded": pacing["degraded"],
+            "data": encrypted_data  # al base64 (pipeline met to_base64)
+        }
+
+        await websocket.send(json.dumps(message))
+    return True
 
 async def send_images():
-    async with websockets.connect(SIGNALING_SERVER, max_size=None) as websocket:
+    if frame_cache is not None:
+        pre_encode(list_images())
+
+    # Met een --backpressure policy bewaakt de sender zelf de write buffer; send() mag dan niet al zelf
+    # blokkeren bij de standaard write_limit van websockets (32 KB), anders ziet de policy de volle buffer nooit
+    connect_options = {"write_limit": 2 ** 30} if args.backpressure != "off" else {}
+    async with websockets.connect(SIGNALING_SERVER, max_size=None, **connect_options) as websocket:
         print(f"✅ Connected to Signaling Server: {SIGNALING_SERVER}")
 
-        message = await websocket.recv()
-        data = json.loads(message)
+        # Wacht op de SingleTimeSync van de ontvanger, andere berichten (bv. een RelayTimeSync
+        # die een oudere relay doorstuurt) worden genegeerd
+        while True:
+            message = await websocket.recv()
+            data = json.loads(message)
+            if data.get("type") == "SingleTimeSync":
+                break
 
         if data["type"] == "SingleTimeSync":
             request_tx_time = data["requestTxTime"]
@@ -86,16 +283,34 @@ async def send_images():
             }))
 
 
-        image_files = sorted([
-            f for f in os.listdir(IMAGE_FOLDER)
-            if f.lower().endswith((".jpg", ".jpeg", ".png"))
-        ])
+        image_files = list_images()
 
         if not image_files:
             print("❌ No images found in test_images/")
             return
 
         frame_id = 0
+        session_id = 0
+
+        # Compressie en encryptie in de gekozen executor; een aparte taak verstuurt de frames in volgorde
+        # zodra ze klaar zijn, zodat de event loop vrij blijft voor pings en andere berichten
+        pipeline = frame_pipeline.FramePipeline(args.executor, args.cipher, AES_KEY, args.workers, encoder=args.encoder)
+        loop_monitor = frame_pipeline.LoopMonitor().start()
+        # Vaste deadlines per frame i.p.v. sleep(1 / FPS) na het werk, zodat de FPS echt FPS is
+        pacer = frame_pipeline.FramePacer(FPS)
+        send_lags = []
+        # Kijkt vóór elk frame naar de write buffer van de WebSocket, zodat een volle uplink geen bufferbloat wordt
+        backpressure = frame_pipeline.Backpressure(args.backpressure, args.send_buffer_kb * 1024)
+        dropped_frames = 0
+
+        async def send_results():
+            abandoned = 0
+            async for meta, result in pipeline.results():
+                if not await send_frame(websocket, meta, result, loop_monitor.take_max_ms(), send_lags):
+                    abandoned += 1
+            return abandoned
+
+        sender_task = pipeline.start(send_results())
 
         for image_file in image_files:
             image_path = os.path.join(IMAGE_FOLDER, image_file)
@@ -106,48 +321,80 @@ async def send_images():
                 continue
 
             height, width = frame.shape[:2]
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(frame_rgb)
+            # Eén keer per afbeelding omzetten naar de invoer van de encoder (RGB PIL-image of BGR array)
+            image = encoder.prepare(frame)
 
             print(f"🚀 Start streaming: {image_file} ({width}x{height})")
+            for jpeg_settings in JPEG_SETTINGS:
+                if len(JPEG_SETTINGS) > 1:
+                    print(f"⚙️ JPEG settings: {jpeg_settings}")
+                # Velden die per afbeelding en encoder-instelling vastliggen gaan één keer mee in een session header
+                session_id += 1
+                session_header = frame_format.session_message(
+                    session_id, setupDescription, image_file, width, height, args.cipher, args.encoder, jpeg_settings
+                )
+                session_sent_at = 0
+
+                for quality in JPEG_QUALITIES:
+                    print(f"🎯 JPEG quality: {quality}% ({SECONDS_PER_QUALITY} sec @ {FPS} FPS)")
+                    # Met de frame cache wordt alleen nog per frame versleuteld (compression_time_ms = 0)
+                    encoded = image
+                    if frame_cache is not None:
+                        encoded = frame_cache.get_or_encode(
+                            cache_key(image_file, width, height, quality, jpeg_settings),
+                            lambda: frame_pipeline.encode_image(encoder, image, quality, jpeg_settings)[0])
+                    low_quality = degraded_quality(quality)
+                    degraded = image
+                    if frame_cache is not None and args.backpressure == "degrade":
+                        degraded = frame_cache.get_or_encode(
+                            cache_key(image_file, width, height, low_quality, jpeg_settings),
+                            lambda: frame_pipeline.encode_image(encoder, image, low_quality, jpeg_settings)[0])
+                    # Overgeslagen slots tellen mee, zodat elke kwaliteit SECONDS_PER_QUALITY duurt
+                    slots_left = FRAMES_PER_QUALITY
+                    while slots_left > 0:
+                        target_at, skipped_frames = await pacer.wait()
+                        slots_left -= 1 + skipped_frames
+                        action, send_wait_ms = await backpressure.admit(websocket)
+                        if action == "drop":
+                            dropped_frames += 1
+                            continue
+                        frame_id += 1
+                        sent_at = time.time()
+                        if sent_at - session_sent_at >= SESSION_REFRESH_SECONDS:
+                            await websocket.send(session_header)
+                            session_sent_at = sent_at
+                        #if frame_id % 500 == 0:
+                        #    print (f"frame {frame_id} : {sent_at}")
+                        # Compression + encryption (counter = frame_id, zie frame_pipeline.py)
+                        frame_quality, frame_image = (low_quality, degraded) if action == "degrade" else (quality, encoded)
+                        frame_fields = (session_id, frame_id, sent_at, frame_quality)
+                        pacing = {"skipped_frames": skipped_frames, "dropped_frames": dropped_frames,
+                                  "send_wait_ms": send_wait_ms, "degraded": action == "degrade"}
+                        dropped_frames = 0
+                        await pipeline.submit((frame_fields, target_at, pacing), frame_image, frame_quality,
+                                              frame_fields, frame_id, args.wire_format == "json", jpeg_settings)
 
-            for quality in JPEG_QUALITIES:
-                print(f"🎯 JPEG quality: {quality}% ({SECONDS_PER_QUALITY} sec @ {FPS} FPS)")
-                for _ in range(FRAMES_PER_QUALITY):
-                    frame_id += 1
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-                    #if frame_id % 500 == 0:
-                    #    print (f"frame {frame_id} : {timestamp}")
-                    # Compression
-                    compressed_io = io.BytesIO()
-                    compress_start = time.time()
-                    pil_image.save(compressed_io, format="JPEG", quality=quality)
-                    compress_time = (time.time() - compress_start) * 1000
-                    compressed_bytes = compressed_io.getvalue()
-                    size_kb = len(compressed_bytes) / 1024
-
-                    # Encryption
-                    encrypted_data, encryption_time = encrypt_data(compressed_bytes)
-
-                    # Message to send
-                    message = {
-                        "setup_description": setupDescription,
-                        "frame_id": frame_id,
-                        "type": "test",
-                        "filename": image_file,
-                        "timestamp": timestamp,
-                        "resolution": f"{width}x{height}",
-                        "jpeg_quality": quality,
-                        "size_kb": round(size_kb, 2),
-                        "compression_time_ms": round(compress_time, 5),
-                        "encryption_time_ms": round(encryption_time, 5),
-                        "data": encrypted_data
-                    }
-
-                    await websocket.send(json.dumps(message))
-                    await asyncio.sleep(FRAME_INTERVAL)
+        await pipeline.finish()
+        abandoned_frames = await sender_task
+        pipeline.close()
+        loop_monitor.stop()
 
         print(f"✅ All images and quality levels sent. Total frames: {frame_id}")
+        if send_lags:
+            print(f"⏱️ Pacing @ {FPS} FPS: {pacer.frames} frames due, {pacer.skipped} slots skipped, send lag "
+                  f"median {statistics.median(send_lags):.1f} ms / max {max(send_lags):.1f} ms")
+        if args.chunk_kb:
+            print(f"Frames abandoned after their deadline: {abandoned_frames}")
+        if args.backpressure != "off":
+            print(f"🚦 Backpressure ({args.backpressure}, {args.send_buffer_kb} KB): {backpressure.stats()}")
+        if frame_cache is not None:
+            print(f"🗃️ Frame cache: {frame_cache.stats()}")
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            print(f"Peak memory (RSS): {usage.ru_maxrss / 1024:.1f} MB, CPU time ({args.cipher}): "
+                  f"{usage.ru_utime + usage.ru_stime:.1f} s")
+        else:
+            print(f"CPU time ({args.cipher}): {time.process_time():.1f} s")
 
 # Start the async loop
 try:
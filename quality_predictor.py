@@ -0,0 +1,164 @@
+import collections
+import itertools
+import math
+import statistics
+import cv2
+import numpy as np
+import frame_encoders
+
+# Sender-side JPEG quality for a target frame size, with one encode per frame:
+#
+# Every scene gets a quality -> size curve, fitted from a few trial encodes (`trial_qualities`) of its
+# first frame and linear in log(size) between those points (extrapolated with the slope of the outer
+# two). A scene is recognised by a 32x24 grayscale thumbnail: a frame within `scene_threshold` (mean
+# absolute difference, 0-255) of a cached scene with the same resolution reuses that curve, so a camera
+# switching between a few views only pays the trial encodes once per view (LRU of `max_scenes`).
+#
+# After every real encode the whole curve shifts by half the log error at the used quality, so its
+# level follows slow content changes (light, motion) while the shape from the trial encodes stays.
+# The error is taken against the curve as it is now, not as it was at predict time: with several
+# frames in flight (FramePipeline with workers) the earlier observes have already shifted the curve,
+# and applying the same correction once per frame in flight would make the quality oscillate.
+# When the error stays above `refit_error` for `refit_frames` frames the shape is off too and the
+# scene is fitted again. A frame "hits" when its size is within `tolerance` of the budget.
+Prediction = collections.namedtuple("Prediction", "quality predicted_bytes budget_bytes scene")
+
+
+class SizeCurve:
+    """ log(JPEG bytes) over quality for one scene: trial points, linear in between """
+
+    def __init__(self, sizes):
+        self.points = sorted((quality, math.log(size)) for quality, size in sizes.items())
+
+    def predict(self, quality):
+        """ Expected bytes at `quality` """
+        points = self.points
+        if len(points) == 1:
+            return math.exp(points[0][1])
+        # Segment with `quality` in it; below the first / above the last point the outer segment extrapolates
+        index = 0
+        while index < len(points) - 2 and quality > points[index + 1][0]:
+            index += 1
+        (q0, log0), (q1, log1) = points[index], points[index + 1]
+        return math.exp(log0 + (log1 - log0) * (quality - q0) / (q1 - q0))
+
+    def quality_for(self, budget_bytes, min_quality, max_quality):
+        """ Highest quality whose expected size fits in `budget_bytes` (min_quality when none does) """
+        for quality in range(max_quality, min_quality - 1, -1):
+            if self.predict(quality) <= budget_bytes:
+                return quality
+        return min_quality
+
+    def shift(self, log_error):
+        self.points = [(quality, log_size + log_error) for quality, log_size in self.points]
+
+
+class Scene:
+    def __init__(self, scene_id, shape, thumbnail, curve):
+        self.id = scene_id
+        self.shape = shape
+        self.thumbnail = thumbnail
+        self.curve = curve
+        self.misses_in_a_row = 0
+
+
+class QualityPredictor:
+    """ Quality per frame for a byte budget, from a cached quality -> size curve per scene """
+
+    def __init__(self, encoder, min_quality=10, max_quality=95, trial_qualities=(25, 50, 80), tolerance=0.1,
+                 scene_threshold=12.0, max_scenes=16, refit_error=0.3, refit_frames=5,
+                 jpeg_settings=frame_encoders.DEFAULT_JPEG_SETTINGS):
+        self.encoder = encoder
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.trial_qualities = trial_qualities
+        self.tolerance = tolerance
+        self.scene_threshold = scene_threshold
+        self.max_scenes = max_scenes
+        self.refit_error = refit_error
+        self.refit_frames = refit_frames
+        self.jpeg_settings = jpeg_settings
+        self.scenes = collections.OrderedDict()  # id -> Scene, least recently used first
+        self.scene_ids = itertools.count(1)
+        self.current = None
+        self.frames = 0
+        self.hits = 0
+        self.out_of_range = 0
+        self.trial_encodes = 0
+        self.fits = 0
+        self.reuses = 0
+        self.errors = collections.deque(maxlen=1000)  # |size / budget - 1| of the last frames in range
+
+    @staticmethod
+    def thumbnail(frame):
+        """ 32x24 grayscale float thumbnail of a BGR frame """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (32, 24), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def fit(self, frame):
+        """ Trial encodes of `frame` -> SizeCurve """
+        image = self.encoder.prepare(frame)
+        sizes = {quality: len(self.encoder.encode(image, quality, self.jpeg_settings)) for quality in self.trial_qualities}
+        self.trial_encodes += len(sizes)
+        self.fits += 1
+        return SizeCurve(sizes)
+
+    def scene(self, frame):
+        """ The cached scene that looks like `frame` (same resolution), or a new one fitted on it """
+        thumbnail = self.thumbnail(frame)
+
+        def distance(scene):
+            return np.abs(thumbnail - scene.thumbnail).mean() if scene.shape == frame.shape else math.inf
+
+        if self.current is not None and distance(self.current) <= self.scene_threshold:
+            # Zelfde scène: thumbnail langzaam laten meebewegen (licht, beweging)
+            self.current.thumbnail += 0.1 * (thumbnail - self.current.thumbnail)
+            return self.current
+
+        best = min(self.scenes.values(), key=distance, default=None)
+        if best is not None and distance(best) <= self.scene_threshold:
+            self.reuses += 1
+            scene = best
+        else:
+            scene = Scene(next(self.scene_ids), frame.shape, thumbnail, self.fit(frame))
+            self.scenes[scene.id] = scene
+            while len(self.scenes) > self.max_scenes:
+                self.scenes.popitem(last=False)
+        self.scenes.move_to_end(scene.id)
+        self.current = scene
+        return scene
+
+    def predict(self, frame, budget_bytes):
+        """ Quality for `frame` to land on `budget_bytes`; returns a Prediction to pass to observe() """
+        scene = self.scene(frame)
+        if scene.misses_in_a_row >= self.refit_frames:
+            scene.curve = self.fit(frame)
+            scene.misses_in_a_row = 0
+        quality = scene.curve.quality_for(budget_bytes, self.min_quality, self.max_quality)
+        return Prediction(quality, scene.curve.predict(quality), budget_bytes, scene)
+
+    def observe(self, prediction, size_bytes):
+        """ Feeds back the real size of a predicted frame; returns True when it is within the tolerance """
+        self.frames += 1
+        scene = prediction.scene
+        log_error = math.log(size_bytes / scene.curve.predict(prediction.quality))
+        scene.curve.shift(0.5 * log_error)
+        scene.misses_in_a_row = scene.misses_in_a_row + 1 if abs(log_error) > math.log(1 + self.refit_error) else 0
+
+        error = size_bytes / prediction.budget_bytes - 1
+        hit = abs(error) <= self.tolerance
+        # Buiten bereik: zelfs de laagste kwaliteit is te groot of de hoogste te klein voor het budget
+        if not hit and ((prediction.quality == self.min_quality and error > 0)
+                        or (prediction.quality == self.max_quality and error < 0)):
+            self.out_of_range += 1
+        else:
+            self.hits += hit
+            self.errors.append(abs(error))
+        return hit
+
+    def stats(self):
+        in_range = self.frames - self.out_of_range
+        return (f"{self.hits}/{in_range} frames within {self.tolerance:.0%} of the budget"
+                + (f" (median error {statistics.median(self.errors):.1%})" if self.errors else "")
+                + f", {self.out_of_range} out of range, {len(self.scenes)} scenes, {self.fits} fits "
+                  f"({self.trial_encodes} trial encodes), {self.reuses} reused")
@@ -0,0 +1,263 @@
+import collections
+import math
+
+# Receiver-side rate control for the webcam stream (simpleReceiveImageAes_v2.py ->
+# simpleSenderWebcamAes_v2.py), in the style of WebRTC's delay-based congestion control:
+#
+# Every frame gives (sent_at, arrival, size). The delay variation between two frames,
+#   (arrival_i - arrival_i-1) - (sent_at_i - sent_at_i-1),
+# is independent of the clock offset between sender and receiver; it grows once a queue builds up in
+# the network. DelayGradientController accumulates it, smooths it and fits a line through the last
+# `window` points (trendline filter). A slope above an adaptive threshold means overuse, below minus the
+# threshold underuse (a queue draining); a smoothed delay more than `max_queue_ms` above its recent
+# minimum counts as overuse too. On overuse the target drops to `beta` x the measured receive
+# throughput; in the normal state it grows multiplicatively (far below the last known capacity) or
+# additively (close to it); on underuse it holds. The target is sent to the sender as
+# {"target_bitrate": bps}, which QualityMapper turns into a JPEG quality.
+#
+# FpsStepController is the old controller of the receiver (quality +-10 against a wanted frame rate),
+# kept for comparison (--controller fps); it sends {"quality": q}.
+OVERUSE, NORMAL, UNDERUSE = "overuse", "normal", "underuse"
+CONTROLLERS = ("delay", "fps")
+
+
+class DelayGradientController:
+    """ Target bitrate from per-frame timestamps and sizes (delay gradient + throughput, AIMD).
+
+    Without `start_bps` the target starts at the first throughput measurement, i.e. what the sender
+    sends now, instead of ramping up from a guess at 8 % per second.
+    """
+
+    def __init__(self, start_bps=None, min_bps=100_000, max_bps=20_000_000, window=20, smoothing=0.9,
+                 gain=4.0, threshold_ms=12.5, max_queue_ms=50.0, beta=0.85, increase_per_s=0.08,
+                 throughput_window=0.5):
+        self.target_bps = start_bps
+        self.min_bps = min_bps
+        self.max_bps = max_bps
+        self.window = window
+        self.smoothing = smoothing
+        self.gain = gain
+        self.threshold_ms = threshold_ms
+        self.max_queue_ms = max_queue_ms
+        self.beta = beta
+        self.increase_per_s = increase_per_s
+        self.throughput_window = throughput_window
+
+        self.previous = None  # (sent_at, arrival) of the previous frame
+        self.first_arrival = None
+        self.accumulated_ms = 0.0
+        self.smoothed_ms = 0.0
+        self.points = collections.deque(maxlen=window)  # (arrival ms, smoothed delay ms)
+        self.trend = 0.0
+        self.base = collections.deque()  # (arrival, smoothed delay ms), increasing: running minimum over 10 s
+        self.queue_ms = 0.0
+        self.state = NORMAL
+        self.received = collections.deque()  # (arrival, bytes received up to and with that frame)
+        self.received_bytes = 0
+        self.capacity_bps = None  # throughput at the last decrease, the link capacity estimate
+        self.last_update = None
+        self.last_decrease = None
+        self.sent = None  # (time, target) of the last feedback
+
+    def throughput_bps(self):
+        """ Receive rate over the last `throughput_window` seconds, None until the window is filled """
+        if len(self.received) < 2 or self.received[-1][0] - self.received[0][0] < self.throughput_window / 2:
+            return None
+        span = self.received[-1][0] - self.received[0][0]
+        return (self.received_bytes - self.received[0][1]) * 8 / span
+
+    def _detect(self, arrival, delta_ms, elapsed_ms):
+        self.accumulated_ms += delta_ms
+        self.smoothed_ms = self.smoothing * self.smoothed_ms + (1 - self.smoothing) * self.accumulated_ms
+        self.points.append(((arrival - self.first_arrival) * 1000, self.smoothed_ms))
+        while self.base and self.base[-1][1] >= self.smoothed_ms:
+            self.base.pop()
+        self.base.append((arrival, self.smoothed_ms))
+        while arrival - self.base[0][0] > 10.0:
+            self.base.popleft()
+        self.queue_ms = self.smoothed_ms - self.base[0][1]
+        if len(self.points) < self.window:
+            return NORMAL
+
+        mean_x = sum(x for x, _ in self.points) / len(self.points)
+        mean_y = sum(y for _, y in self.points) / len(self.points)
+        numerator = sum((x - mean_x) * (y - mean_y) for x, y in self.points)
+        denominator = sum((x - mean_x) ** 2 for x, _ in self.points)
+        slope = numerator / denominator if denominator else 0.0
+        self.trend = slope * len(self.points) * self.gain
+
+        # Adaptive threshold: follows |trend| slowly downwards and faster upwards, so a noisy link
+        # (wifi, 5G) doesn't trigger overuse all the time while a real queue still does
+        magnitude = abs(self.trend)
+        if magnitude < self.threshold_ms + 15:
+            k = 0.01 if magnitude > self.threshold_ms else 0.00018
+            self.threshold_ms += k * (magnitude - self.threshold_ms) * min(elapsed_ms, 100.0)
+            self.threshold_ms = min(max(self.threshold_ms, 6.0), 600.0)
+        # The slope only fires on a fast growing queue; at a frame rate of 25 FPS a slowly growing one is
+        # caught by the queueing delay itself (smoothed delay above its minimum of the last 10 s)
+        if self.trend > self.threshold_ms or (self.queue_ms > self.max_queue_ms and self.trend >= 0):
+            return OVERUSE
+        if self.trend < -self.threshold_ms:
+            return UNDERUSE
+        return NORMAL
+
+    def on_frame(self, sent_at, arrival, size_bytes):
+        """ Feeds one received frame (sender and receiver time in seconds); returns the target bitrate in
+        bit/s, None while the first throughput measurement isn't there yet """
+        self.received_bytes += size_bytes
+        self.received.append((arrival, self.received_bytes))
+        while arrival - self.received[0][0] > self.throughput_window:
+            self.received.popleft()
+
+        if self.previous is None:
+            self.previous = (sent_at, arrival)
+            self.first_arrival = self.last_update = arrival
+            return self.target_bps
+        delta_ms = ((arrival - self.previous[1]) - (sent_at - self.previous[0])) * 1000
+        elapsed = max(0.0, arrival - self.last_update)
+        self.previous = (sent_at, arrival)
+        self.state = self._detect(arrival, delta_ms, elapsed * 1000)
+
+        self.last_update = arrival
+        throughput = self.throughput_bps()
+        if self.target_bps is None:
+            if throughput is None:
+                return None
+            self.target_bps = throughput
+        if self.state == OVERUSE:
+            # At most one decrease per 200 ms: the sender needs a moment before the new target shows up
+            if throughput is not None and (self.last_decrease is None or arrival - self.last_decrease > 0.2):
+                self.capacity_bps = throughput
+                self.target_bps = self.beta * throughput
+                self.last_decrease = arrival
+        elif self.state == NORMAL:
+            if self.capacity_bps is not None and self.target_bps > 1.1 * self.capacity_bps:
+                self.capacity_bps = None  # the link got faster, the old estimate no longer holds
+            if self.capacity_bps is not None and self.target_bps > 0.9 * self.capacity_bps:
+                # Near the capacity estimate: additive, 2 % of the target per second (at least 20 kbit/s)
+                self.target_bps += elapsed * max(self.target_bps * 0.02, 20_000)
+            else:
+                self.target_bps *= (1 + self.increase_per_s) ** elapsed
+            if throughput is not None:
+                self.target_bps = min(self.target_bps, 1.5 * throughput + 100_000)
+        self.target_bps = min(max(self.target_bps, self.min_bps), self.max_bps)
+        return self.target_bps
+
+    def feedback(self, now, min_interval=0.05, refresh=1.0, change=0.05):
+        """ Target to send to the sender now, or None: when it changed more than `change` (relative)
+        since the last feedback, or every `refresh` s, but not more often than every `min_interval` s """
+        if self.target_bps is None:
+            return None
+        if self.sent is not None:
+            sent_at, sent_target = self.sent
+            if now - sent_at < min_interval:
+                return None
+            if now - sent_at < refresh and abs(self.target_bps - sent_target) <= change * sent_target:
+                return None
+        self.sent = (now, self.target_bps)
+        return int(self.target_bps)
+
+
+class FpsStepController:
+    """ Old receiver logic: quality +-`step` every `interval` s while the FPS is above / below `wanted_fps` """
+
+    def __init__(self, wanted_fps=25, max_quality=60, quality=50, step=10, interval=0.2, warmup_frames=200):
+        self.wanted_fps = wanted_fps
+        self.max_quality = max_quality
+        self.quality = quality
+        self.step = step
+        self.interval = interval
+        self.warmup_frames = warmup_frames
+        self.frames = 0
+        self.frame_times = collections.deque()
+        self.last_change = 0.0
+
+    def on_frame(self, arrival):
+        """ Returns the new quality when it changed, else None """
+        self.frames += 1
+        self.frame_times.append(arrival)
+        while arrival - self.frame_times[0] > 1.0:
+            self.frame_times.popleft()
+        fps = len(self.frame_times)
+        if self.frames <= self.warmup_frames or arrival - self.last_change < self.interval:
+            return None
+
+        quality = self.quality
+        if fps > self.wanted_fps:
+            quality = min(self.quality + self.step, self.max_quality)
+        elif fps < self.wanted_fps - 2:
+            quality = max(self.quality - self.step, 1)
+        else:
+            return None
+        self.last_change = arrival
+        if quality == self.quality:
+            return None
+        self.quality = quality
+        return quality
+
+
+class QualityMapper:
+    """ Sender side: the highest JPEG quality whose frames fit in the target bitrate at the current frame rate.
+
+    Frame sizes per quality are learned from the frames sent (moving average); qualities that weren't
+    sent yet are interpolated between known ones, or scaled in proportion to the quality outside them.
+    """
+
+    def __init__(self, min_quality=10, max_quality=90, smoothing=0.2):
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.smoothing = smoothing
+        self.sizes = {}  # quality -> average frame bytes
+
+    def observe(self, quality, size_bytes):
+        if size_bytes <= 0:
+            return  # delta frame without changed tiles
+        average = self.sizes.get(quality)
+        self.sizes[quality] = size_bytes if average is None else average + self.smoothing * (size_bytes - average)
+
+    def estimate(self, quality):
+        """ Expected frame bytes at `quality`, None before the first frame """
+        if quality in self.sizes:
+            return self.sizes[quality]
+        if not self.sizes:
+            return None
+        lower = max((q for q in self.sizes if q < quality), default=None)
+        upper = min((q for q in self.sizes if q > quality), default=None)
+        if lower is not None and upper is not None:
+            fraction = (quality - lower) / (upper - lower)
+            return self.sizes[lower] + fraction * (self.sizes[upper] - self.sizes[lower])
+        nearest = lower if lower is not None else upper
+        return self.sizes[nearest] * quality / nearest
+
+    def quality(self, target_bps, fps, current):
+        """ Quality for `target_bps` at `fps` frames per second; `current` while nothing is known yet """
+        if not self.sizes or fps <= 0:
+            return current
+        budget = target_bps / 8 / fps
+        for quality in range(self.max_quality, self.min_quality - 1, -1):
+            if self.estimate(quality) <= budget:
+                return quality
+        return self.min_quality
+
+
+def settle_time(samples, low, high, hold=3.0):
+    """ Seconds from the first sample until the value stays within [low, high] up to the last sample,
+    None when that last stretch is shorter than `hold` s; `samples` are (time, value) pairs """
+    inside_since = None
+    for time, value in samples:
+        if low <= value <= high:
+            if inside_since is None:
+                inside_since = time
+        else:
+            inside_since = None
+    if inside_since is None or samples[-1][0] - inside_since < hold:
+        return None
+    return inside_since - samples[0][0]
+
+
+def variation(values):
+    """ Coefficient of variation (stdev / mean) """
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((value - mean) ** 2 for value in values) / (len(values) - 1)) / mean if mean else 0.0
@@ -1,29 +1,454 @@
 import asyncio
+import argparse
+import json
+import multiprocessing
+try:
+    import resource  # alleen op Unix; op Windows geen piekgeheugen
+except ImportError:
+    resource = None
+import socket
+import time
+import zlib
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
 import websockets
+import frame_format
+
+DEFAULT_ROOM = "default"
+# Alleen korte tekstberichten worden bekeken op een controlebericht (join, RelayTimeSync), frames worden nooit geparsed
+CONTROL_MAX_BYTES = 256
+# Maximale lengte van de HTTP request-regel die de front-process bekijkt in multi-worker modus
+REQUEST_LINE_MAX_BYTES = 4096
+OVERFLOW_POLICIES = ("drop-oldest", "drop-newest", "disconnect")
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+rooms = {}  # room naam -> set van verbonden peers
+verbose = False
+queue_size = 64
+overflow_policy = "drop-oldest"
+# Berichten vanaf deze grootte tellen als videoframe (conflatie, relay-tijdstempels), kleinere zijn controleberichten
+frame_min_bytes = 4096
+stamp_frames = False  # relay_ingress / relay_egress toevoegen aan elk frame
+send_buffer_bytes = 0  # SO_SNDBUF per client, 0 = standaard van het OS
+worker_index = 0  # multi-worker modus: index van deze worker en het aantal workers
+worker_count = 1
+
+
+class Peer:
+    """ Verbonden client met een eigen begrensde uitgaande queue en writer task.
+
+    Een trage ontvanger vult enkel zijn eigen queue; bij overflow bepaalt de policy
+    of het oudste of nieuwste frame vervalt of de client wordt losgekoppeld. Controleberichten
+    (kleiner dan frame_min_bytes, o.a. de sessie-header) vallen nooit weg: voor hen maakt
+    een frame plaats.
+
+    Frames van een stream met conflatie staan niet zelf in de queue: de queue bevat dan
+    de bron-peer als plaatshouder en `pending` het nieuwste nog niet verzonden frame.
+    """
+
+    def __init__(self, websocket, max_queue, overflow, conflate=False):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.overflow = overflow
+        self.conflate = conflate  # Deze client is een bron waarvan enkel het nieuwste frame telt
+        self.pending = {}  # bron-peer -> nieuwste nog niet verzonden frame
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.disconnecting = False
+        self.writer = asyncio.create_task(self._write())
+
+    @property
+    def remote_address(self):
+        return self.websocket.remote_address
+
+    def enqueue(self, message):
+        """ Zet een bericht in de uitgaande queue zonder ooit te blokkeren """
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        self.dropped += 1
+        control = not self._is_frame(message)
+        if (self.overflow == "drop-oldest" or control) and self._evict_frame(newest=self.overflow != "drop-oldest"):
+            self.queue.put_nowait(message)
+            return
+        self._forget(message)
+        if self.overflow == "disconnect" and not self.disconnecting:
+            self.disconnecting = True
+            print(f"🐢 Trage client {self.remote_address} wordt losgekoppeld (queue vol)")
+            asyncio.create_task(self.websocket.close(1013, "slow consumer"))
+        # drop-newest: het nieuwe bericht wordt gewoon niet bewaard
+
+    def enqueue_latest(self, source, frame):
+        """ Conflatie: vervang een nog niet verzonden frame van dezelfde bron door het nieuwe """
+        if source in self.pending:
+            self.pending[source] = frame
+            self.conflated += 1
+            return
+        self.pending[source] = frame
+        self.enqueue(source)
+
+    @staticmethod
+    def _is_frame(item):
+        return isinstance(item, Peer) or len(item) >= frame_min_bytes
+
+    def _evict_frame(self, newest=False):
+        """ Haalt het oudste (of nieuwste) frame uit de volle queue; False als er enkel controleberichten in staan """
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        frames = [index for index, item in enumerate(items) if self._is_frame(item)]
+        if frames:
+            self._forget(items.pop(frames[-1] if newest else frames[0]))
+        for item in items:
+            self.queue.put_nowait(item)
+        return bool(frames)
+
+    def _forget(self, item):
+        # Een weggevallen plaatshouder mag geen verweesd frame achterlaten
+        if isinstance(item, Peer):
+            self.pending.pop(item, None)
+
+    async def _write(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                if isinstance(message, Peer):
+                    message = self.pending.pop(message)
+                if stamp_frames and len(message) >= frame_min_bytes:
+                    # Zo laat mogelijk, maar het tijdstempel moet in het frame staan vóór send(): de eigen
+                    # socket-write van de relay (en wachten op een volle send buffer) telt dus als downlink
+                    message = stamp_frame(message, "relay_egress")
+                await self.websocket.send(message)
+                self.sent += 1
+                if verbose:
+                    print(f"📤 Bericht doorgestuurd naar {self.remote_address}")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def close(self):
+        self.writer.cancel()
+        await asyncio.gather(self.writer, return_exceptions=True)
+
+
+def room_from_request_path(path):
+    room = path.split("?", 1)[0].strip("/")
+    return room or DEFAULT_ROOM
+
+
+def request_path(websocket):
+    request = getattr(websocket, "request", None)  # websockets >= 13
+    return request.path if request is not None else getattr(websocket, "path", "/")
+
+
+def room_from_path(websocket):
+    """ Bepaalt de room uit het URL-pad, bv. ws://server:9000/robot1 -> 'robot1' """
+    return room_from_request_path(request_path(websocket))
+
+
+def conflate_from_path(websocket):
+    """ Een bron vraagt conflatie aan met ?conflate=1, bv. ws://server:9000/robot1?conflate=1 """
+    path = request_path(websocket)
+    if "?" not in path:
+        return False
+    values = parse_qs(path.split("?", 1)[1]).get("conflate", [])
+    return bool(values) and values[-1].lower() in TRUE_VALUES
+
+
+def parse_control(message):
+    """ Geeft het bericht terug als het voor de relay zelf bedoeld is:
+    {"type": "join", "room": ..., "conflate": ...} of {"type": "RelayTimeSync", "requestTxTime": ...}
+    """
+    if not isinstance(message, str) or len(message) > CONTROL_MAX_BYTES:
+        return None
+    if '"join"' not in message and '"RelayTimeSync"' not in message:
+        return None
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if data.get("type") == "join" and data.get("room"):
+        return data
+    if data.get("type") == "RelayTimeSync":
+        return data
+    return None
+
+
+def stamp_frame(message, field):
+    """ Voegt een relay-tijdstempel (epoch seconden) toe aan een JSON- of binair frame zonder het te parsen """
+    if isinstance(message, str) and message.endswith("}"):
+        return f'{message[:-1]},"{field}":{time.time():.6f}}}'
+    if frame_format.is_binary_frame(message):
+        return frame_format.stamp_relay(message, field, time.time())
+    return message
+
+
+def join_room(peer, room):
+    rooms.setdefault(room, set()).add(peer)
+
+
+def leave_room(peer, room):
+    members = rooms.get(room)
+    if members is None:
+        return
+    members.discard(peer)
+    if not members:
+        del rooms[room]
+
+
+def limit_send_buffer(websocket, size):
+    """ Kleine kernel-buffer: frames wachten dan in de relay-queue, waar conflatie ze kan vervangen """
+    sock = websocket.transport.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
 
-clients = set()
 
 async def signaling(websocket):
-    clients.add(websocket)
-    print(f"✅ Nieuwe client verbonden: {websocket.remote_address}")
-    
+    if send_buffer_bytes > 0:
+        limit_send_buffer(websocket, send_buffer_bytes)
+    room = room_from_path(websocket)
+    peer = Peer(websocket, queue_size, overflow_policy, conflate_from_path(websocket))
+    join_room(peer, room)
+    print(f"✅ Nieuwe client verbonden: {websocket.remote_address} (room: {room}{', conflatie' if peer.conflate else ''})")
+
     try:
         async for message in websocket:
             #print(f"📩 Bericht ontvangen van {websocket.remote_address}: {message}")
-            for client in clients:
-                if client != websocket:
-                    await client.send(message)
-                    print(f"📤 Bericht doorgestuurd naar {client.remote_address}")
+            control = parse_control(message)
+            if control is not None:
+                if control["type"] == "RelayTimeSync":
+                    # Antwoord rechtstreeks: de ontvanger schat zo de klokafwijking met de relay
+                    peer.enqueue(json.dumps({
+                        "type": "RelayTimeSyncResponse",
+                        "requestTxTime": control.get("requestTxTime"),
+                        "relayTime": time.time()
+                    }))
+                    continue
+                if worker_for_room(str(control["room"]), worker_count) != worker_index:
+                    # De room hoort bij een andere worker: daar zitten zijn peers, dus niet verplaatsen
+                    peer.enqueue(json.dumps({
+                        "type": "joinRejected",
+                        "room": str(control["room"]),
+                        "reason": "room belongs to another worker; reconnect with the room in the URL path"
+                    }))
+                    print(f"⚠ Join van {websocket.remote_address} naar room {control['room']} geweigerd (andere worker)")
+                    continue
+                leave_room(peer, room)
+                room = str(control["room"])
+                peer.conflate = bool(control.get("conflate", peer.conflate))
+                join_room(peer, room)
+                print(f"🔀 Client {websocket.remote_address} verplaatst naar room: {room}")
+                continue
+
+            if stamp_frames and len(message) >= frame_min_bytes:
+                message = stamp_frame(message, "relay_ingress")
+
+            # Chunks van één frame nooit conflateren: een vervangen chunk maakt het hele frame onbruikbaar
+            if peer.conflate and len(message) >= frame_min_bytes and not frame_format.is_chunk(message):
+                for client in rooms.get(room, ()):
+                    if client is not peer:
+                        client.enqueue_latest(peer, message)
+            else:
+                for client in rooms.get(room, ()):
+                    if client is not peer:
+                        client.enqueue(message)
     except websockets.exceptions.ConnectionClosedError:
         print(f"⚠ Client {websocket.remote_address} heeft de verbinding verbroken.")
     finally:
-        clients.remove(websocket)
-        print(f"❌ Client verwijderd: {websocket.remote_address}")
+        leave_room(peer, room)
+        await peer.close()
+        print(f"❌ Client verwijderd: {websocket.remote_address} (room: {room}) - verzonden: {peer.sent}, "
+              f"gedropt: {peer.dropped}, geconflateerd: {peer.conflated}")
 
-async def start_server():
-    print("🚀 WebSocket Signaling Server wordt gestart op ws://0.0.0.0:9000")
-    async with websockets.serve(signaling, "0.0.0.0", 9000): 
+async def report_stats(interval):
+    """ Print periodiek de queue-diepte en drop-tellers per client """
+    while True:
+        await asyncio.sleep(interval)
+        if resource is not None:
+            print(f"📊 Piekgeheugen relay (RSS): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+        for room, members in list(rooms.items()):
+            for peer in members:
+                print(f"📊 [{room}] {peer.remote_address}: queue {peer.queue.qsize()}/{peer.queue.maxsize}, "
+                      f"verzonden {peer.sent}, gedropt {peer.dropped}, geconflateerd {peer.conflated}")
+
+async def start_server(host="0.0.0.0", port=9000, stats_interval=0):
+    print(f"🚀 WebSocket Signaling Server wordt gestart op ws://{host}:{port} (queue: {queue_size}, overflow: {overflow_policy})")
+    async with websockets.serve(signaling, host, port, max_size=None):
+        if stats_interval > 0:
+            asyncio.create_task(report_stats(stats_interval))
         await asyncio.Future()  # Houd de server actief
 
+def worker_for_room(room, workers):
+    """ Vaste room -> worker toewijzing, zodat alle peers van een sessie in hetzelfde proces zitten """
+    return zlib.crc32(room.encode("utf-8")) % workers
+
+
+def peek_room(conn, timeout=5.0):
+    """ Leest de HTTP request-regel met MSG_PEEK: de bytes blijven in de socket voor de worker """
+    deadline = time.monotonic() + timeout
+    conn.settimeout(timeout)
+    while True:
+        data = conn.recv(REQUEST_LINE_MAX_BYTES, socket.MSG_PEEK)
+        if not data:
+            return None
+        if b"\r\n" in data:
+            break
+        if len(data) >= REQUEST_LINE_MAX_BYTES or time.monotonic() > deadline:
+            return None
+        time.sleep(0.005)  # Request-regel nog niet volledig binnen
+    parts = data.split(b"\r\n", 1)[0].split()
+    if len(parts) != 3:
+        return None
+    return room_from_request_path(parts[1].decode("latin-1"))
+
+
+async def serve_handoffs(index, channel, stats_interval):
+    """ Worker: ontvangt geaccepteerde sockets van de front-process en serveert ze als WebSocket """
+    # Enkel hier geïmporteerd: deze API bestaat pas sinds websockets 13, de gewone relay (en
+    # signalingServerRTC.py, die dit module importeert) werkt ook met oudere versies
+    from websockets.asyncio.server import ServerConnection, serve
+    from websockets.server import ServerProtocol
+
+    loop = asyncio.get_running_loop()
+    # De server luistert enkel op een willekeurige lokale poort; hij levert de handshake- en
+    # afsluitlogica (ws_server.handler, ws_server.close) voor de sockets die de front-process doorgeeft
+    async with serve(signaling, "127.0.0.1", 0, max_size=None) as ws_server:
+
+        def protocol_factory():
+            # Zelfde opbouw als serve(): sans-I/O protocol + asyncio-verbinding die bij ws_server hoort
+            return ServerConnection(ServerProtocol(max_size=None), ws_server)
+
+        def on_handoff():
+            try:
+                _, fds, _, _ = socket.recv_fds(channel, 1, 16)
+            except BlockingIOError:
+                return
+            if not fds:
+                loop.remove_reader(channel.fileno())  # Front-process is gestopt
+                return
+            for fd in fds:
+                conn = socket.socket(fileno=fd)
+                conn.setblocking(False)
+                loop.create_task(loop.connect_accepted_socket(protocol_factory, conn))
+
+        channel.setblocking(False)
+        loop.add_reader(channel.fileno(), on_handoff)
+        if stats_interval > 0:
+            asyncio.create_task(report_stats(stats_interval))
+        print(f"👷 Worker {index} klaar")
+        await asyncio.Future()
+
+
+def run_worker(index, channel, options):
+    global verbose, queue_size, overflow_policy, frame_min_bytes, send_buffer_bytes, stamp_frames
+    global worker_index, worker_count
+    worker_index = index
+    worker_count = options["workers"]
+    verbose = options["verbose"]
+    queue_size = options["queue_size"]
+    overflow_policy = options["overflow"]
+    frame_min_bytes = options["frame_min_bytes"]
+    send_buffer_bytes = options["sndbuf"]
+    stamp_frames = options["stamp"]
+    try:
+        asyncio.run(serve_handoffs(index, channel, options["stats_interval"]))
+    except KeyboardInterrupt:
+        pass
+
+
+def handoff(conn, channels):
+    """ Bepaalt de room van een nieuwe verbinding en geeft de socket door aan de juiste worker """
+    try:
+        room = peek_room(conn)
+        if room is None:
+            return
+        index = worker_for_room(room, len(channels))
+        socket.send_fds(channels[index], [b"c"], [conn.fileno()])
+    except OSError as e:
+        print(f"⚠ Handoff mislukt: {e}")
+    finally:
+        conn.close()  # De worker heeft nu zijn eigen kopie van de file descriptor
+
+
+def start_workers(host, port, workers, options):
+    """ Multi-worker modus: één front-process accepteert, N worker-processen relayen """
+    print(f"🚀 WebSocket Signaling Server wordt gestart op ws://{host}:{port} met {workers} workers "
+          f"(queue: {options['queue_size']}, overflow: {options['overflow']})")
+    channels = []
+    processes = []
+    for index in range(workers):
+        front_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        process = multiprocessing.Process(target=run_worker, args=(index, worker_end, options), daemon=True)
+        process.start()
+        worker_end.close()
+        channels.append(front_end)
+        processes.append(process)
+
+    listener = socket.create_server((host, port), backlog=1024)
+    # Handoff in threads: een trage client die zijn request-regel niet afmaakt blokkeert de accept-lus niet
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        try:
+            while True:
+                conn, _ = listener.accept()
+                executor.submit(handoff, conn, channels)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            for process in processes:
+                process.terminate()
+
+
 if __name__ == "__main__":
-    asyncio.run(start_server())
+    parser = argparse.ArgumentParser(
+        description="WebSocket relay: stuurt berichten door naar de andere clients in dezelfde room."
+    )
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Listen address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=9000, help="Listen port (default: 9000)")
+    parser.add_argument("--verbose", action="store_true", help="Log every forwarded message")
+    parser.add_argument("--queue_size", type=int, default=64, help="Max queued messages per client (default: 64)")
+    parser.add_argument("--overflow", type=str, choices=OVERFLOW_POLICIES, default="drop-oldest",
+                        help="What to do when a client queue is full (default: drop-oldest)")
+    parser.add_argument("--stats_interval", type=float, default=0, help="Print per-client queue/drop stats every N seconds (0 = off)")
+    parser.add_argument("--frame_min_bytes", type=int, default=4096,
+                        help="Messages of at least this size are treated as video frames: they are conflated for "
+                             "?conflate=1 streams and get relay timestamps with --stamp (default: 4096)")
+    parser.add_argument("--stamp", action="store_true",
+                        help="Add relay_ingress/relay_egress timestamps to every JSON frame")
+    parser.add_argument("--sndbuf", type=int, default=0,
+                        help="SO_SNDBUF per client in bytes; keep it small with conflation so stale frames are not "
+                             "stuck in the kernel (default: 0 = OS default)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of relay processes; rooms are spread over the workers by URL path (default: 1, Linux only for > 1)")
+    args = parser.parse_args()
+
+    verbose = args.verbose
+    queue_size = args.queue_size
+    overflow_policy = args.overflow
+    frame_min_bytes = args.frame_min_bytes
+    send_buffer_bytes = args.sndbuf
+    stamp_frames = args.stamp
+    if args.workers > 1:
+        if not hasattr(socket, "send_fds"):
+            parser.error("--workers > 1 requires Unix file descriptor passing (Linux, Python 3.9+)")
+        try:
+            import websockets.asyncio.server  # pas sinds websockets 13
+        except ImportError:
+            parser.error("--workers > 1 requires websockets >= 13: pip install -U websockets")
+        start_workers(args.host, args.port, args.workers, {
+            "verbose": args.verbose,
+            "queue_size": args.queue_size,
+            "overflow": args.overflow,
+            "stats_interval": args.stats_interval,
+            "frame_min_bytes": args.frame_min_bytes,
+            "sndbuf": args.sndbuf,
+            "stamp": args.stamp,
+            "workers": args.workers,
+        })
+    else:
+        asyncio.run(start_server(args.host, args.port, args.stats_interval))
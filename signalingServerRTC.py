@@ -1,33 +1,56 @@
 import asyncio
+import argparse
 import websockets
 import json
+from signalingServer import room_from_path
 
-clients = set()
+RELAY_MODES = ("passthrough", "json")
 
-async def signaling(websocket, path):
-    """ Signaling server voor WebRTC: verstuurt SDP- en ICE-berichten tussen clients """
+rooms = {}  # room naam -> set van verbonden websockets
+relay_mode = "passthrough"
+
+async def signaling(websocket, path=None):
+    """ Signaling server voor WebRTC: verstuurt SDP- en ICE-berichten tussen clients in dezelfde room.
+
+    In passthrough-modus wordt de inhoud nooit geparsed: de room (URL-pad) is de enige
+    routeringsinformatie en het originele bericht (tekst of binair) gaat ongewijzigd door.
+    """
+    room = room_from_path(websocket)
+    clients = rooms.setdefault(room, set())
     clients.add(websocket)
-    print(f"✅ Nieuwe client verbonden: {websocket.remote_address}")
+    print(f"✅ Nieuwe client verbonden: {websocket.remote_address} (room: {room})")
 
     try:
         async for message in websocket:
-            data = json.loads(message)  # Decodeer het ontvangen JSON-bericht
-            
-            # Stuur het bericht door naar alle andere verbonden clients
+            if relay_mode == "json":
+                message = json.dumps(json.loads(message))  # Valideer en her-encodeer het JSON-bericht
+
+            # Stuur het bericht door naar alle andere verbonden clients in de room
             for client in clients:
                 if client != websocket:
-                    await client.send(json.dumps(data))
+                    await client.send(message)
 
     except websockets.exceptions.ConnectionClosedError:
         print(f"⚠ Client {websocket.remote_address} heeft de verbinding verbroken.")
 
     finally:
-        clients.remove(websocket)
+        clients.discard(websocket)
+        if not clients:
+            rooms.pop(room, None)
 
-async def start_server():
-    print("🚀 WebRTC Signaling Server wordt gestart op ws://0.0.0.0:9000")
-    async with websockets.serve(signaling, "0.0.0.0", 9000): 
+async def start_server(host="0.0.0.0", port=9000):
+    print(f"🚀 WebRTC Signaling Server wordt gestart op ws://{host}:{port} (modus: {relay_mode})")
+    async with websockets.serve(signaling, host, port, max_size=None):
         await asyncio.Future()  # Houd de server actief
 
 if __name__ == "__main__":
-    asyncio.run(start_server())
+    parser = argparse.ArgumentParser(description="WebRTC signaling relay (SDP/ICE) per room.")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Listen address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=9000, help="Listen port (default: 9000)")
+    parser.add_argument("--mode", type=str, choices=RELAY_MODES, default="passthrough",
+                        help="passthrough: forward the original text/binary frame untouched; "
+                             "json: parse and re-encode every message (old behaviour) (default: passthrough)")
+    args = parser.parse_args()
+
+    relay_mode = args.mode
+    asyncio.run(start_server(args.host, args.port))
@@ -6,6 +6,7 @@ import cv2
 import numpy as np
 import base64
 import sys
+import frame_delta
 
 
 SIGNALING_SERVER = "ws://heliwi.duckdns.org:9000"  # Vervang door je server IP
@@ -23,6 +24,7 @@ async def receive_messages():
         message_count = 0
         last_time = time.time()
         fps_display = 0  # Variable to store the latest FPS value
+        compositor = frame_delta.TileCompositor()  # senders with --delta only send changed tiles
 
         while True:
             message = await websocket.recv()
@@ -31,7 +33,8 @@ async def receive_messages():
 
             image_data = base64.b64decode(message_json["data"])
             np_arr = np.frombuffer(image_data, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR) if len(np_arr) else None
+            frame = compositor.apply(message_json, frame)
 
             # ✅ Ensure the image is always 640x480
             if frame is not None:
@@ -9,6 +9,7 @@ import base64
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
+import frame_delta
 
 SIGNALING_SERVER = "ws://heliwi.duckdns.org:9000"  # Vervang door je server IP
 
@@ -47,6 +48,7 @@ async def receive_messages():
         message_count = 0
         last_time = time.time()
         fps_display = 0  # Opslag van laatste FPS waarde
+        compositor = frame_delta.TileCompositor()  # zenders met --delta sturen alleen gewijzigde tiles
 
         while True:
             message = await websocket.recv()
@@ -57,7 +59,8 @@ async def receive_messages():
 
             # 📌 Decodeer naar afbeelding
             np_arr = np.frombuffer(decrypted_data, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR) if len(np_arr) else None
+            frame = compositor.apply(message_json, frame)  # tiles op het vorige frame plakken
 
             # ✅ Zorg ervoor dat de afbeelding altijd 640x480 is
             if frame is not None:
@@ -82,6 +85,9 @@ async def receive_messages():
                 cv2.putText(frame, f"Comp. Time: {round(message_json['compression_time_ms'], 2)} ms", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
                 cv2.putText(frame, f"Encryption time AES: {round(message_json['encryption_time_ms'], 2)} ms", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
                 cv2.putText(frame, fps_text, (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2, cv2.LINE_AA)
+                if "tiles_total" in message_json:
+                    tiles = "keyframe" if message_json["keyframe"] else f"{len(message_json['tiles'])}/{message_json['tiles_total']} tiles"
+                    cv2.putText(frame, f"Delta: {tiles}", (10, 210), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2, cv2.LINE_AA)
 
 
                 # Toon de afbeelding met FPS-overlay
@@ -1,4 +1,4 @@
-import sys
+import argparse
 import asyncio
 import json
 import websockets
@@ -9,6 +9,8 @@ import base64
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
+import frame_delta
+import rate_controller
 
 from collections import deque
 
@@ -16,11 +18,17 @@ frame_times = deque(maxlen=100)  # Schuivend venster van tijdstempels
 
 SIGNALING_SERVER = "ws://heliwi.duckdns.org:9000"
 
-if len(sys.argv) > 1:
-    SIGNALING_SERVER = sys.argv[1]
+parser = argparse.ArgumentParser(description="Ontvang de AES-256 webcamstream en stuur de zender bij (rate_controller.py).")
+parser.add_argument("signaling_server", nargs="?", default=SIGNALING_SERVER, help=f"Signaling server URL (default: {SIGNALING_SERVER})")
+parser.add_argument("--controller", choices=rate_controller.CONTROLLERS, default="delay",
+                    help="delay: target bitrate from delay gradient + throughput; fps: old quality +-10 against --wanted_fps (default: delay)")
+parser.add_argument("--wanted_fps", type=int, default=25, help="Wanted frame rate for --controller fps (default: 25)")
+parser.add_argument("--max_quality", type=int, default=60, help="Maximum JPEG quality for --controller fps (default: 60)")
+args = parser.parse_args()
+SIGNALING_SERVER = args.signaling_server
 
-wantedFramerate = 25
-maxQuality = 60
+wantedFramerate = args.wanted_fps
+maxQuality = args.max_quality
 
 
 
@@ -50,20 +58,47 @@ async def receive_messages():
         # Init FPS tracking
         message_count = 0
         last_time = time.time()
-        last_executed_q = time.time()
         fps_display = 0
         frameCounter = 0
+        compositor = frame_delta.TileCompositor()  # zenders met --delta sturen alleen gewijzigde tiles
+        # Rate control: delay gradient + throughput -> target bitrate, of de oude FPS-stappen -> kwaliteit
+        if args.controller == "delay":
+            controller = rate_controller.DelayGradientController()
+        else:
+            controller = rate_controller.FpsStepController(wantedFramerate, maxQuality, quality)
+        last_report = time.time()
 
         while True:
             try:
                 message = await websocket.recv()
+                arrival = time.time()
                 message_json = json.loads(message)
                 frameCounter +=1
 
+                if args.controller == "delay" and "sent_at" in message_json:
+                    # JPEG bytes, niet de base64 JSON: de zender budgetteert in dezelfde eenheid
+                    controller.on_frame(message_json["sent_at"], arrival, message_json.get("jpeg_bytes", len(message)))
+                    target_bitrate = controller.feedback(arrival)
+                    if target_bitrate is not None:
+                        await websocket.send(json.dumps({"target_bitrate": target_bitrate}))
+                    if arrival - last_report >= 1.0 and controller.target_bps is not None:
+                        throughput = controller.throughput_bps() or 0
+                        print(f"📶 target {controller.target_bps / 1e6:.2f} Mbit/s, throughput {throughput / 1e6:.2f} Mbit/s, "
+                              f"queue {controller.queue_ms:.0f} ms, {controller.state}")
+                        last_report = arrival
+                elif args.controller == "fps":
+                    new_quality = controller.on_frame(arrival)
+                    if new_quality is not None:
+                        print(f"📉 {'verhoog' if new_quality > quality else 'verlaag'} kwaliteit naar {new_quality}")
+                        quality = new_quality
+                        await websocket.send(json.dumps({"quality": quality}))
+                quality = message_json.get("jpeg_quality", quality)
+
                 # ✅ Decrypt afbeelding
                 decrypted_data = decrypt_data(message_json["data"])
                 np_arr = np.frombuffer(decrypted_data, np.uint8)
-                frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR) if len(np_arr) else None
+                frame = compositor.apply(message_json, frame)  # tiles op het vorige frame plakken
 
                 #if frame is not None:
                 #    frame = cv2.resize(frame, (TARGET_WIDTH, TARGET_HEIGHT))
@@ -72,7 +107,6 @@ async def receive_messages():
                 message_count += 1
                 current_time = time.time()
                 elapsed_time = current_time - last_time
-                lastQuality = quality
 
                 current_time = time.time()
                 frame_times.append(current_time)
@@ -82,30 +116,6 @@ async def receive_messages():
                     frame_times.popleft()
 
                 fps_display = len(frame_times)  # Aantal frames in de laatste seconde
-                # ✅ Automatisch kwaliteitsaanpassing sturen
-                if (fps_display > wantedFramerate and frameCounter > 200): 
-                    if current_time - last_executed_q >= 0.2:
-                        quality += 10
-                        if (quality>maxQuality):
-                            quality = maxQuality
-                        if (quality != lastQuality):
-                            print(f"📉 verhoog kwaliteit naar {quality}")
-                            await websocket.send(json.dumps({"quality": quality}))
-                        last_executed_q = current_time
-                        lastQuality = quality
-
-                # ✅ Automatisch kwaliteitsaanpassing sturen
-                if (fps_display < wantedFramerate - 2 and frameCounter > 200):
-                    if current_time - last_executed_q >= 0.2:
-                        quality -= 10
-                        if (quality<1):
-                            quality = 1
-                        if (quality != lastQuality):
-                            await websocket.send(json.dumps({"quality": quality}))
-                            print(f"📉 verlaag kwaliteit naar {quality}")
-
-                        last_executed_q = current_time
-                        lastQuality = quality
 
 
                 # ✅ Overlay info op beeld
@@ -117,6 +127,11 @@ async def receive_messages():
                     cv2.putText(frame, f"Encryption: {round(message_json['encryption_time_ms'], 2)} ms", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
                     cv2.putText(frame, f"FPS: {fps_display}", (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2)
                     cv2.putText(frame, f"Framecoounter: {frameCounter}", (10, 210), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
+                    if args.controller == "delay" and controller.target_bps is not None:
+                        cv2.putText(frame, f"Target: {controller.target_bps / 1e6:.2f} Mbit/s ({controller.state})", (10, 270), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
+                    if "tiles_total" in message_json:
+                        tiles = "keyframe" if message_json["keyframe"] else f"{len(message_json['tiles'])}/{message_json['tiles_total']} tiles"
+                        cv2.putText(frame, f"Delta: {tiles}", (10, 240), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
 
                     cv2.imshow("Ontvangen Afbeelding", frame)
                     cv2.waitKey(1)
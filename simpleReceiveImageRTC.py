@@ -3,6 +3,7 @@ import cv2
 import logging
 from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
 from av import VideoFrame
+import frame_preview
 from websocket_signaling import WebSocketSignaling  # ✅ Gebruik aangepaste WebSocket Signaling
 import time
 import argparse
@@ -23,6 +24,23 @@ parser.add_argument(
 )
 
 
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    help="No display (no cv2.imshow / cv2.waitKey), for servers and automated benchmarks"
+)
+parser.add_argument(
+    "--preview_every",
+    type=int,
+    default=0,
+    help="Save every Nth frame with overlay as JPEG in --preview_dir (default: 0 = none)"
+)
+parser.add_argument(
+    "--preview_dir",
+    type=str,
+    default="preview",
+    help="Folder for --preview_every (default: preview)"
+)
 args = parser.parse_args()
 
 SIGNALING_SERVER = args.signaling_server
@@ -59,6 +77,7 @@ class VideoReceiver:
         self.fps_display = 0
         self.message_count = 0
         self.last_time = asyncio.get_event_loop().time()
+        self.preview = frame_preview.FramePreview("WebRTC Video Stream", args.headless, args.preview_every, args.preview_dir)
 
     def process_frame(self, frame: VideoFrame):
         """ Converteert WebRTC-frame naar OpenCV-afbeelding en toont het. """
@@ -76,12 +95,14 @@ class VideoReceiver:
             self.message_count = 0
             self.last_time = current_time
 
+        if not self.preview.next():
+            return  # headless en geen preview-frame: geen overlay nodig
+
         # Overlay FPS
         cv2.putText(image, f"FPS: {self.fps_display}", (10, 470),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2, cv2.LINE_AA)
 
-        cv2.imshow("WebRTC Video Stream", image)
-        cv2.waitKey(1)
+        self.preview.show(image)
 
 
 async def wait_for_ice(pc):
@@ -165,7 +186,7 @@ async def run():
         logging.info("🛑 WebRTC verbinding sluiten...")
         await pc.close()
         await signaling.close()
-        cv2.destroyAllWindows()
+        receiver.preview.close()
         logging.info("✅ WebRTC gestopt en venster gesloten.")
     
 
@@ -175,4 +196,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logging.info("🛑 Handmatige onderbreking. Programma wordt afgesloten.")
 
-        cv2.destroyAllWindows()
+        if not args.headless:
+            cv2.destroyAllWindows()
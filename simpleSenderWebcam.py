@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import json
 import websockets
@@ -6,11 +7,17 @@ import cv2
 import base64
 import io
 from PIL import Image
-import sys
+import frame_delta
 
 SIGNALING_SERVER = "ws://heliwi.duckdns.org:9000"  # Vervang door je server IP
-if len(sys.argv) > 1:
-    SIGNALING_SERVER = sys.argv[1]
+
+parser = argparse.ArgumentParser(description="Stream the webcam as JPEG via the signaling server.")
+parser.add_argument("signaling_server", nargs="?", default=SIGNALING_SERVER, help=f"Signaling server URL (default: {SIGNALING_SERVER})")
+parser.add_argument("--delta", action="store_true", help="Send only changed tiles plus a periodic full keyframe (frame_delta.py)")
+parser.add_argument("--tile_size", type=int, default=64, help="Tile size in pixels for --delta, multiple of 16 (default: 64)")
+parser.add_argument("--keyframe_interval", type=int, default=50, help="Frames between keyframes for --delta (default: 50)")
+args = parser.parse_args()
+SIGNALING_SERVER = args.signaling_server
 
 
 
@@ -22,9 +29,34 @@ capture = cv2.VideoCapture(0)
 width = 640
 height = 480
 
+def compress(frame):
+    """ BGR frame -> (JPEG bytes, compression time in ms) """
+    pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    compressed_image_io = io.BytesIO()
+    start_time = time.time()
+    pil_image.save(compressed_image_io, format="JPEG", quality=JPEG_QUALITY)
+    return compressed_image_io.getvalue(), (time.time() - start_time) * 1000
+
+async def send_delta(websocket, delta, frame, timestamp):
+    """ --delta: only the changed tiles (one mosaic JPEG) or a keyframe, without the text overlay,
+    which would mark its tiles as changed in every frame """
+    image, delta_fields = delta.encode(frame)
+    compressed_bytes, compression_time_ms = compress(image) if image is not None else (b"", 0.0)
+    message = {
+        "type": "test",
+        "data": base64.b64encode(compressed_bytes).decode("utf-8"),
+        "timestamp": timestamp,
+        "resolution": f"{width}x{height}",
+        "size_kb": round(len(compressed_bytes) / 1024, 2),
+        "compression_time_ms": round(compression_time_ms, 2),
+        **delta_fields
+    }
+    await websocket.send(json.dumps(message))
+
 async def send_messages():
     async with websockets.connect(SIGNALING_SERVER) as websocket:
         print(f"✅ Connected to Signaling Server: {SIGNALING_SERVER}")
+        delta = frame_delta.TileDeltaEncoder(args.tile_size, keyframe_interval=args.keyframe_interval) if args.delta else None
         
         while True:
             ret, frame = capture.read()
@@ -38,6 +70,11 @@ async def send_messages():
             # Get timestamp
             timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
+            if delta is not None:
+                await send_delta(websocket, delta, frame, timestamp)
+                await asyncio.sleep(0.001)
+                continue
+
             # Convert OpenCV frame (with text) to PIL Image
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # Convert BGR to RGB
             pil_image = Image.fromarray(frame_rgb)
@@ -1,21 +1,24 @@
-import sys
+import argparse
 import asyncio
 import json
 import websockets
 import time
 import cv2
-import base64
-import io
-from PIL import Image
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.backends import default_backend
-import os
+import frame_delta
+import frame_pipeline
 
 SIGNALING_SERVER = "ws://94.111.36.87:9000"  # Vervang door je server IP
 
-if len(sys.argv) > 1:
-    SIGNALING_SERVER = sys.argv[1]
+parser = argparse.ArgumentParser(description="Stream de webcam AES-256 versleuteld via de Signaling Server.")
+parser.add_argument("signaling_server", nargs="?", default=SIGNALING_SERVER, help=f"Signaling server URL (default: {SIGNALING_SERVER})")
+parser.add_argument("--executor", choices=frame_pipeline.EXECUTOR_MODES, default="none",
+                    help="Where JPEG compression + encryption run: inline in the event loop, a thread pool or a process pool (default: none)")
+parser.add_argument("--workers", type=int, default=2, help="Worker threads/processes for --executor thread/process (default: 2)")
+parser.add_argument("--delta", action="store_true", help="Stuur alleen gewijzigde tiles, met periodiek een volledig keyframe (frame_delta.py)")
+parser.add_argument("--tile_size", type=int, default=64, help="Tile size in pixels for --delta, multiple of 16 (default: 64)")
+parser.add_argument("--keyframe_interval", type=int, default=50, help="Frames between keyframes for --delta (default: 50)")
+args = parser.parse_args()
+SIGNALING_SERVER = args.signaling_server
 
 print(f"Signaling Server: {SIGNALING_SERVER}")
 
@@ -30,85 +33,72 @@ height = 480
 # AES-256 sleutel (moet 32 bytes zijn, hier een voorbeeld, verander dit voor veiligheid)
 AES_KEY = b'C\x03\xb6\xd2\xc5\t.Brp\x1ce\x0e\xa4\xf6\x8b\xd2\xf6\xb0\x8a\x9c\xd5D\x1e\xf4\xeb\x1d\xe6\x0c\x1d\xff '
 
-def encrypt_data(plain_text):
-    """Versleutelt gegevens met AES-256 CBC en base64-encodeert de uitvoer."""
-    # Start tijdmeting voor encryptie
-    encrypt_start_time = time.time()
 
-    iv = os.urandom(16)  # AES vereist een IV van 16 bytes
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
+async def read_frame():
+    """ Camera uitlezen; buiten de event loop zodra er een executor gekozen is """
+    if args.executor == "none":
+        return capture.read()
+    return await asyncio.get_running_loop().run_in_executor(None, capture.read)
 
-    # PKCS7 padding toepassen
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_data = padder.update(plain_text) + padder.finalize()
 
+async def send_results(websocket, pipeline, loop_monitor):
+    """ Verstuurt de gecomprimeerde + versleutelde frames in volgorde """
+    async for (timestamp, delta_fields), (jpeg_bytes, compression_time_ms, encrypted_data, encryption_time_ms) in pipeline.results():
+        # JSON bericht samenstellen
+        message = {
+            "type": "test",
+            "data": encrypted_data,  # Versleutelde afbeelding (IV + ciphertext, base64)
+            "timestamp": timestamp,
+            "resolution": f"{width}x{height}",
+            "size_kb": round(jpeg_bytes / 1024, 2),
+            "compression_time_ms": round(compression_time_ms, 2),
+            "encryption_time_ms": round(encryption_time_ms, 2),
+            "loop_block_ms": round(loop_monitor.take_max_ms(), 2),
+            **delta_fields  # keyframe / tiles bij --delta
+        }
 
-    encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
+        # Verstuur versleuteld bericht via WebSocket
+        await websocket.send(json.dumps(message))
 
-    # Einde tijdmeting voor encryptie
-    encrypt_end_time = time.time()
-    encryption_time_ms = (encrypt_end_time - encrypt_start_time) * 1000  # Omzetten naar ms
-
-    return base64.b64encode(iv + encrypted_data).decode('utf-8'), encryption_time_ms  # IV meesturen voor decryptie
 
 async def send_messages():
     async with websockets.connect(SIGNALING_SERVER) as websocket:
         print(f"✅ Verbonden met Signaling Server: {SIGNALING_SERVER}")
 
-        while True:
-            ret, frame = capture.read()
-            if not ret:
-                print("❌ Kan geen frame ophalen van de camera")
-                continue
-
-            # Frame resizen naar 640x480 pixels
-            frame = cv2.resize(frame, (width, height))
-
-            # Timestamp ophalen
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-
-            # OpenCV-frame converteren naar RGB voor Pillow
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(frame_rgb)
-
-            # Compressie met Pillow naar een in-memory JPEG
-            compressed_image_io = io.BytesIO()
-            start_time = time.time()
-            pil_image.save(compressed_image_io, format="JPEG", quality=JPEG_QUALITY)
-            end_time = time.time()
-
-            # Compressed image bytes ophalen
-            compressed_bytes = compressed_image_io.getvalue()
-            compressed_size_kb = len(compressed_bytes) / 1024  # Omzetten naar KB
-            compression_time_ms = (end_time - start_time) * 1000  # Omzetten naar ms
-
-            # Annotated OpenCV frame opnieuw naar Pillow converteren
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(frame_rgb)
-
-            # Opnieuw comprimeren
-            final_compressed_image_io = io.BytesIO()
-            pil_image.save(final_compressed_image_io, format="JPEG", quality=JPEG_QUALITY)
-            final_compressed_bytes = final_compressed_image_io.getvalue()
-
-            # Gegevens versleutelen en encryptietijd meten
-            encrypted_data, encryption_time_ms = encrypt_data(final_compressed_bytes)
-
-            # JSON bericht samenstellen
-            message = {
-                "type": "test",
-                "data": encrypted_data,  # Versleutelde afbeelding
-                "timestamp": timestamp,
-                "resolution": f"{width}x{height}",
-                "size_kb": round(compressed_size_kb, 2),
-                "compression_time_ms": round(compression_time_ms, 2),
-                "encryption_time_ms": round(encryption_time_ms, 2)
-            }
-
-            # Verstuur versleuteld bericht via WebSocket
-            await websocket.send(json.dumps(message))
-            await asyncio.sleep(0.001)  # Even wachten voor het volgende frame
+        # Compressie + encryptie in de gekozen executor, resultaten komen in volgorde terug
+        pipeline = frame_pipeline.FramePipeline(args.executor, "aes-cbc", AES_KEY, args.workers)
+        loop_monitor = frame_pipeline.LoopMonitor().start()
+        pipeline.start(send_results(websocket, pipeline, loop_monitor))
+        delta = frame_delta.TileDeltaEncoder(args.tile_size, keyframe_interval=args.keyframe_interval) if args.delta else None
+        frame_counter = 0
+
+        try:
+            while True:
+                ret, frame = await read_frame()
+                if not ret:
+                    print("❌ Kan geen frame ophalen van de camera")
+                    continue
+
+                # Frame resizen naar 640x480 pixels
+                frame = cv2.resize(frame, (width, height))
+
+                # Timestamp ophalen
+                timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+
+                # Delta-modus: alleen de gewijzigde tiles (als mozaïek) of een keyframe comprimeren
+                delta_fields = {}
+                if delta is not None:
+                    frame, delta_fields = delta.encode(frame)
+                    if frame is None:
+                        frame = b""  # geen gewijzigde tiles: lege payload
+
+                # Frame counter = IV-teller, uniek per frame ook met meerdere workers
+                frame_counter += 1
+                await pipeline.submit((timestamp, delta_fields), frame, JPEG_QUALITY, counter=frame_counter, to_base64=True)
+                await asyncio.sleep(0.001)  # Even wachten voor het volgende frame
+        finally:
+            loop_monitor.stop()
+            pipeline.close()
 
 # Start de async loop
 try:
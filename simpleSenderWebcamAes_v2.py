@@ -1,26 +1,39 @@
-import sys
+import argparse
 import asyncio
+import collections
 import json
 import websockets
 import time
 import cv2
-import base64
-import io
-from PIL import Image
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.backends import default_backend
-import os
+import frame_delta
+import frame_encoders
+import frame_pipeline
+import quality_predictor
+import rate_controller
 
 SIGNALING_SERVER = "ws://heliwi.duckdns.org:9000"  # Vervang door je server IP
 
-if len(sys.argv) > 1:
-    SIGNALING_SERVER = sys.argv[1]
+parser = argparse.ArgumentParser(description="Stream de webcam AES-256 versleuteld via de Signaling Server, JPEG-kwaliteit instelbaar door de ontvanger.")
+parser.add_argument("signaling_server", nargs="?", default=SIGNALING_SERVER, help=f"Signaling server URL (default: {SIGNALING_SERVER})")
+parser.add_argument("--executor", choices=frame_pipeline.EXECUTOR_MODES, default="none",
+                    help="Where JPEG compression + encryption run: inline in the event loop, a thread pool or a process pool (default: none)")
+parser.add_argument("--workers", type=int, default=2, help="Worker threads/processes for --executor thread/process (default: 2)")
+parser.add_argument("--delta", action="store_true", help="Stuur alleen gewijzigde tiles, met periodiek een volledig keyframe (frame_delta.py)")
+parser.add_argument("--tile_size", type=int, default=64, help="Tile size in pixels for --delta, multiple of 16 (default: 64)")
+parser.add_argument("--keyframe_interval", type=int, default=50, help="Frames between keyframes for --delta (default: 50)")
+args = parser.parse_args()
+SIGNALING_SERVER = args.signaling_server
 
 print(f"Signaling Server: {SIGNALING_SERVER}")
 
 # Definieer JPEG-kwaliteitsniveau
 JPEG_QUALITY = 50
+# Doelbitrate van de ontvanger (rate_controller.py), None zolang die alleen een kwaliteit stuurt
+TARGET_BITRATE = None
+quality_mapper = rate_controller.QualityMapper()  # bij --delta: de mozaïeken verschillen per frame
+# Kwaliteit voor de framegrootte die bij de doelbitrate hoort, met een grootte-curve per scène;
+# zelfde encoder als de pipeline (pil), zodat de proef-encodes dezelfde groottes geven
+size_predictor = quality_predictor.QualityPredictor(frame_encoders.create_encoder("pil"))
 
 # Open de camera
 capture = cv2.VideoCapture(0)
@@ -30,72 +43,99 @@ height = 480
 # AES-256 sleutel (moet 32 bytes zijn, hier een voorbeeld, verander dit voor veiligheid)
 AES_KEY = b'C\x03\xb6\xd2\xc5\t.Brp\x1ce\x0e\xa4\xf6\x8b\xd2\xf6\xb0\x8a\x9c\xd5D\x1e\xf4\xeb\x1d\xe6\x0c\x1d\xff '
 
-def encrypt_data(plain_text):
-    """Versleutelt gegevens met AES-256 CBC en base64-encodeert de uitvoer."""
-    # Start tijdmeting voor encryptie
-    encrypt_start_time = time.time()
 
-    iv = os.urandom(16)  # AES vereist een IV van 16 bytes
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
+async def read_frame():
+    """ Camera uitlezen; buiten de event loop zodra er een executor gekozen is """
+    if args.executor == "none":
+        return capture.read()
+    return await asyncio.get_running_loop().run_in_executor(None, capture.read)
 
-    # PKCS7 padding toepassen
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_data = padder.update(plain_text) + padder.finalize()
-
-
-    encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
-
-    # Einde tijdmeting voor encryptie
-    encrypt_end_time = time.time()
-    encryption_time_ms = (encrypt_end_time - encrypt_start_time) * 1000  # Omzetten naar ms
-
-    return base64.b64encode(iv + encrypted_data).decode('utf-8'), encryption_time_ms  # IV meesturen voor decryptie
-
-async def send_messages(websocket):
-    while True:
-        ret, frame = capture.read()
-        if not ret:
-            print("❌ Kan geen frame ophalen van de camera")
-            continue
-
-        frame = cv2.resize(frame, (width, height))
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(frame_rgb)
-
-        compressed_image_io = io.BytesIO()
-        start_time = time.time()
-        pil_image.save(compressed_image_io, format="JPEG", quality=JPEG_QUALITY)
-        end_time = time.time()
-
-        compressed_bytes = compressed_image_io.getvalue()
-        compressed_size_kb = len(compressed_bytes) / 1024
-        compression_time_ms = (end_time - start_time) * 1000
-
-        encrypted_data, encryption_time_ms = encrypt_data(compressed_bytes)
 
+async def send_results(websocket, pipeline, loop_monitor):
+    """ Verstuurt de gecomprimeerde + versleutelde frames in volgorde """
+    async for (timestamp, quality, prediction, delta_fields), (jpeg_bytes, compression_time_ms, encrypted_data, encryption_time_ms) in pipeline.results():
+        quality_mapper.observe(quality, jpeg_bytes)
+        if prediction is not None:
+            size_predictor.observe(prediction, jpeg_bytes)
+            delta_fields = {**delta_fields, "target_bytes": round(prediction.budget_bytes)}
         message = {
             "type": "test",
             "data": encrypted_data,
             "timestamp": timestamp,
+            "sent_at": time.time(),  # voor de delay gradient van de ontvanger
+            "jpeg_quality": quality,
+            "jpeg_bytes": jpeg_bytes,
             "resolution": f"{width}x{height}",
-            "size_kb": round(compressed_size_kb, 2),
+            "size_kb": round(jpeg_bytes / 1024, 2),
             "compression_time_ms": round(compression_time_ms, 2),
-            "encryption_time_ms": round(encryption_time_ms, 2)
+            "encryption_time_ms": round(encryption_time_ms, 2),
+            "loop_block_ms": round(loop_monitor.take_max_ms(), 2),
+            **delta_fields  # keyframe / tiles bij --delta
         }
 
         await websocket.send(json.dumps(message))
-        await asyncio.sleep(0.001)
 
-async def receive_messages(websocket):
+
+async def send_messages(websocket):
     global JPEG_QUALITY
+    # Compressie + encryptie in de gekozen executor, resultaten komen in volgorde terug
+    pipeline = frame_pipeline.FramePipeline(args.executor, "aes-cbc", AES_KEY, args.workers)
+    loop_monitor = frame_pipeline.LoopMonitor().start()
+    pipeline.start(send_results(websocket, pipeline, loop_monitor))
+    delta = frame_delta.TileDeltaEncoder(args.tile_size, keyframe_interval=args.keyframe_interval) if args.delta else None
+    frame_counter = 0
+    frame_times = collections.deque(maxlen=25)  # voor de eigen framerate bij een doelbitrate
+
+    try:
+        while True:
+            ret, frame = await read_frame()
+            if not ret:
+                print("❌ Kan geen frame ophalen van de camera")
+                continue
+
+            frame = cv2.resize(frame, (width, height))
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+
+            # Delta-modus: alleen de gewijzigde tiles (als mozaïek) of een keyframe comprimeren
+            delta_fields = {}
+            if delta is not None:
+                frame, delta_fields = delta.encode(frame)
+                if frame is None:
+                    frame = b""  # geen gewijzigde tiles: lege payload
+
+            # JPEG_QUALITY wordt per frame gelezen, dus een nieuwe waarde van de ontvanger geldt meteen;
+            # bij een doelbitrate de kwaliteit waarvan het frame bij de huidige framerate in het budget past
+            frame_times.append(time.time())
+            prediction = None
+            if TARGET_BITRATE is not None and len(frame_times) > 1:
+                fps = (len(frame_times) - 1) / (frame_times[-1] - frame_times[0] or 1e-3)
+                if delta is None:
+                    # Nieuwe scène: een paar proef-encodes in de event loop, daarna één encode per frame
+                    prediction = size_predictor.predict(frame, TARGET_BITRATE / 8 / fps)
+                    JPEG_QUALITY = prediction.quality
+                else:
+                    JPEG_QUALITY = quality_mapper.quality(TARGET_BITRATE, fps, JPEG_QUALITY)
+            frame_counter += 1
+            await pipeline.submit((timestamp, JPEG_QUALITY, prediction, delta_fields), frame, JPEG_QUALITY,
+                                  counter=frame_counter, to_base64=True)
+            await asyncio.sleep(0.001)
+    finally:
+        loop_monitor.stop()
+        pipeline.close()
+        if size_predictor.frames:
+            print(f"🎯 Frame size budget: {size_predictor.stats()}")
+
+async def receive_messages(websocket):
+    global JPEG_QUALITY, TARGET_BITRATE
     while True:
         try:
             receivedMessage = await websocket.recv()
             message_json = json.loads(receivedMessage)
-            print(message_json['quality'])
-            if (1 <= message_json['quality'] <= 100):
+            if "target_bitrate" in message_json:
+                TARGET_BITRATE = message_json["target_bitrate"]
+                print(f"SET TARGET_BITRATE: {TARGET_BITRATE / 1e6:.2f} Mbit/s (JPEG_QUALITY: {JPEG_QUALITY})")
+            elif 1 <= message_json.get("quality", 0) <= 100:
+                TARGET_BITRATE = None
                 JPEG_QUALITY = message_json['quality']
                 print(f"SET JPEG_QUALITY: {JPEG_QUALITY}")
         except websockets.exceptions.ConnectionClosed:
@@ -0,0 +1,142 @@
+import atexit
+import csv
+import os
+import threading
+import time
+
+try:
+    # optioneel: pip install pyarrow (voor --columnar arrow/parquet)
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Per-frame log of the receiver (stream_log.csv), written by a background thread:
+#
+# write() only appends the row to a batch in memory. The writer thread flushes the batch once it
+# holds `flush_rows` rows or `flush_interval` seconds after its first row, whichever comes first. It
+# uses one csv.writer on a file that stays open and calls file.flush() after every batch. A crash
+# of the receiver therefore loses at most the rows of one flush window; the rows already written
+# are in the OS. At exit (also after an exception or Ctrl+C) the last batch is flushed too.
+#
+# Optionally the same rows also go to a columnar file next to the CSV, one record batch / row group
+# per flush:
+#   arrow    Arrow IPC stream (.arrows): readable up to the last complete flush after a crash
+#   parquet  Parquet (.parquet): compact and fast to load in pandas, but readable only after close()
+# Column types come from `columns`, (name, type) pairs with type "str", "int", "float" or "bool".
+# Empty values ("") become nulls.
+COLUMNAR_FORMATS = ("arrow", "parquet")
+COLUMNAR_SUFFIXES = {"arrow": ".arrows", "parquet": ".parquet"}
+CONVERTERS = {"str": str, "int": int, "float": float, "bool": bool}
+
+
+class StreamLogger:
+    """ CSV log (+ optional Arrow / Parquet copy) with batched writes from a background thread """
+
+    def __init__(self, path, columns, flush_rows=256, flush_interval=1.0, columnar=None):
+        if columnar is not None and columnar not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unknown columnar format {columnar!r}")
+        if columnar is not None and pyarrow is None:
+            raise ImportError(f"--columnar {columnar} needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.columns = list(columns)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        self.file = open(path, mode='w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in self.columns])
+        self.file.flush()
+
+        self.columnar_path = None
+        self.columnar_writer = None
+        if columnar is not None:
+            self.columnar_path = os.path.splitext(path)[0] + COLUMNAR_SUFFIXES[columnar]
+            types = {"str": pyarrow.string(), "int": pyarrow.int64(), "float": pyarrow.float64(), "bool": pyarrow.bool_()}
+            self.schema = pyarrow.schema([(name, types[kind]) for name, kind in self.columns])
+            if columnar == "arrow":
+                self.columnar_writer = pyarrow.ipc.new_stream(self.columnar_path, self.schema)
+            else:
+                self.columnar_writer = pyarrow.parquet.ParquetWriter(self.columnar_path, self.schema)
+
+        self.condition = threading.Condition()
+        self.rows = []
+        self.deadline = None  # flush time of the current batch
+        self.closed = False
+        self.error = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.max_flush_ms = 0.0
+        self.thread = threading.Thread(target=self._run, name="stream-logger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, row):
+        """ Queues one row (values in the order of `columns`); never waits for the disk """
+        if self.error is not None:
+            raise self.error
+        with self.condition:
+            self.rows.append(row)
+            if len(self.rows) == 1:
+                self.deadline = time.monotonic() + self.flush_interval
+                self.condition.notify()
+            elif len(self.rows) >= self.flush_rows:
+                self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and len(self.rows) < self.flush_rows and (
+                        not self.rows or time.monotonic() < self.deadline):
+                    self.condition.wait(self.deadline - time.monotonic() if self.rows else None)
+                batch, self.rows = self.rows, []
+                closed = self.closed
+            if batch:
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    self.error = e
+                    return
+            if closed:
+                return
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        self.writer.writerows(batch)
+        self.file.flush()
+        if self.columnar_writer is not None:
+            self.columnar_writer.write_table(pyarrow.Table.from_batches([self._record_batch(batch)]))
+        self.rows_written += len(batch)
+        self.flushes += 1
+        self.max_flush_ms = max(self.max_flush_ms, (time.perf_counter() - start) * 1000)
+
+    def _record_batch(self, batch):
+        arrays = []
+        for index, (name, kind) in enumerate(self.columns):
+            convert = CONVERTERS[kind]
+            values = [None if row[index] is None or (isinstance(row[index], str) and row[index] == "")
+                      else convert(row[index]) for row in batch]
+            arrays.append(pyarrow.array(values, type=self.schema.field(name).type))
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def close(self):
+        """ Flushes the last rows and closes the files; safe to call more than once """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.file.close()
+        if self.columnar_writer is not None:
+            self.columnar_writer.close()
+        atexit.unregister(self.close)
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        text = f"{self.rows_written} rows in {self.flushes} flushes (longest {self.max_flush_ms:.1f} ms) to {self.path}"
+        if self.columnar_path is not None:
+            text += f" and {self.columnar_path}"
+        return text